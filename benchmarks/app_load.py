@@ -0,0 +1,113 @@
+"""
+Load Test - Many simultaneous testers chatting through the Gradio demo against a local stub upstream
+
+Every simulated tester is a separate Gradio session with its own key and history. The test checks
+that no session sees another session's configuration or messages, and compares turn latency with
+the queue limited to one handler at a time (head-of-line blocking) against the configured limit.
+
+Usage:
+    python -m benchmarks.app_load --sessions 32 --turns 3 --output app_load.json
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+# Add project root directory to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from gradio_client import Client
+
+from benchmarks.run import start_upstream, summarize
+from src.app import CONCURRENCY_LIMIT, create_demo
+from src.key_generator import generate_encrypted_key
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def run_session(url: str, base_url: str, index: int, turns: int) -> Dict[str, Any]:
+    """One tester: configure a key of its own, chat, and check only its own turns come back"""
+    client = Client(url, verbose=False)
+    model = f"model-{index}"
+    status = client.predict(generate_encrypted_key("openai", base_url + "/v1", f"key-{index}", model),
+                            api_name="/validate_config")
+    errors = [] if model in status else [f"session {index} configured as: {status}"]
+
+    samples = []
+    expected = []
+    for turn in range(turns):
+        message = f"session {index} turn {turn}"
+        started = time.perf_counter()
+        _, history, error = client.predict(message, api_name="/chat")
+        samples.append(time.perf_counter() - started)
+        expected += [message, "echo: " + message]
+        contents = [entry["content"] if isinstance(entry["content"], str) else entry["content"][0]["text"]
+                    for entry in history]
+        if error or contents != expected:
+            errors.append(f"session {index} turn {turn}: {error or contents}")
+    client.close()
+    return {"samples": samples, "errors": errors}
+
+
+def run_load(concurrency_limit: int, sessions: int, turns: int, base_url: str) -> Dict[str, Any]:
+    """Serve the demo with a queue concurrency limit and run all sessions at once"""
+    demo = create_demo(concurrency_limit=concurrency_limit)
+    port = free_port()
+    demo.launch(server_name="127.0.0.1", server_port=port, prevent_thread_lock=True, quiet=True)
+    try:
+        url = f"http://127.0.0.1:{port}/"
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=sessions) as executor:
+            results = list(executor.map(lambda i: run_session(url, base_url, i, turns), range(sessions)))
+        elapsed = time.perf_counter() - started
+    finally:
+        demo.close()
+    samples = [sample for result in results for sample in result["samples"]]
+    errors = [error for result in results for error in result["errors"]]
+    return dict(summarize(samples), turns_per_second=len(samples) / elapsed, cross_talk_errors=len(errors),
+                first_errors=errors[:5])
+
+
+def main():
+    """Run the load test and write results as JSON"""
+    parser = argparse.ArgumentParser(description='Load test the Gradio chat demo with simultaneous sessions')
+    parser.add_argument('--sessions', type=int, default=32, help='Simultaneous testers')
+    parser.add_argument('--turns', type=int, default=3, help='Messages sent by each tester')
+    parser.add_argument('--concurrency-limit', type=int, default=CONCURRENCY_LIMIT,
+                        help='Queue concurrency limit to compare against a limit of 1')
+    parser.add_argument('--upstream-latency', type=float, default=0.2, help='Stub seconds before each response')
+    parser.add_argument('--chunk-delay', type=float, default=0.02, help='Stub seconds between streamed chunks')
+    parser.add_argument('--output', help='Write JSON results to this file instead of stdout')
+    args = parser.parse_args()
+
+    upstream, base_url = start_upstream(latency=args.upstream_latency, chunk_delay=args.chunk_delay)
+    results: Dict[str, Any] = {}
+    try:
+        for limit in (1, args.concurrency_limit):
+            print(f"Running {args.sessions} sessions with concurrency limit {limit}...", file=sys.stderr)
+            results[f"limit_{limit}"] = run_load(limit, args.sessions, args.turns, base_url)
+    finally:
+        upstream.terminate()
+
+    report = {"meta": {"sessions": args.sessions, "turns": args.turns,
+                       "upstream_latency": args.upstream_latency, "chunk_delay": args.chunk_delay},
+              "results": results}
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Benchmark Comparison - Report changes between two benchmark result files
+
+Usage:
+    python -m benchmarks.compare baseline.json results.json --threshold 10
+"""
+
+import argparse
+import json
+import sys
+from typing import Any, Dict
+
+
+def flatten(results: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    """Flatten nested results into dotted metric names"""
+    flat = {}
+    for name, value in results.items():
+        key = f"{prefix}{name}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, key + "."))
+        elif isinstance(value, (int, float)) and not key.endswith(".count"):
+            flat[key] = float(value)
+    return flat
+
+
+def higher_is_better(metric: str) -> bool:
+    """Throughput metrics improve upwards, durations downwards"""
+    return metric.endswith("rps")
+
+
+def main():
+    """Print per-metric changes and exit non-zero on regressions beyond the threshold"""
+    parser = argparse.ArgumentParser(description='Compare two benchmark result files')
+    parser.add_argument('baseline', help='Baseline results JSON')
+    parser.add_argument('candidate', help='Candidate results JSON')
+    parser.add_argument('--threshold', type=float, default=10.0, help='Regression threshold in percent')
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = flatten(json.load(f)["results"])
+    with open(args.candidate) as f:
+        candidate = flatten(json.load(f)["results"])
+
+    regressions = 0
+    for metric in sorted(set(baseline) & set(candidate)):
+        before, after = baseline[metric], candidate[metric]
+        if before == 0:
+            continue
+        change = (after - before) / abs(before) * 100
+        worse = -change if higher_is_better(metric) else change
+        flag = ""
+        if worse > args.threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"{metric:60s} {before:12.3f} -> {after:12.3f} ({change:+6.1f}%){flag}")
+
+    if regressions:
+        print(f"\n{regressions} metric(s) regressed by more than {args.threshold}%")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Traffic Replay - Replays a recorded traffic log as open-loop load against the stub or a real upstream
+
+Requests are sent at their recorded arrival times, compressed by --speed, or at a fixed --qps,
+whether or not earlier requests have finished, so a slow upstream shows up as growing latency
+instead of a lower send rate. Messages have the recorded roles and sizes, filled with placeholder text.
+
+Usage:
+    python -m benchmarks.replay traffic.jsonl --speed 10
+    python -m benchmarks.replay traffic.jsonl --qps 50 --key "$ENCRYPTED_KEY" --output replay.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence
+
+# Add project root directory to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.run import make_key, start_upstream, summarize
+from src.llm_proxy import AsyncLLMProxy
+from src.metrics import BUCKETS
+from src.traffic import read_log, replay_offsets, synthesize_messages
+
+
+def histogram(samples: Sequence[float]) -> Dict[str, int]:
+    """Count of samples per latency bucket, keyed by the bucket's upper bound in seconds"""
+    counts = Counter()
+    for sample in samples:
+        counts[next((f"{bound:g}" for bound in BUCKETS if sample <= bound), "+Inf")] += 1
+    return {bound: counts[bound] for bound in [f"{bound:g}" for bound in BUCKETS] + ["+Inf"] if counts[bound]}
+
+
+async def replay(proxy: AsyncLLMProxy, entries: List[Dict[str, Any]], offsets: List[float]) -> Dict[str, Any]:
+    """
+    Send every entry at its offset and measure the responses
+
+    Args:
+        proxy: Proxy to send through
+        entries: Log entries in arrival order
+        offsets: Seconds after the start each entry is sent at
+
+    Returns:
+        Report of latencies and throughput
+    """
+    latencies: List[float] = []
+    first_tokens: List[float] = []
+    errors: Counter = Counter()
+    lags: List[float] = []
+
+    async def send(index: int, entry: Dict[str, Any]) -> None:
+        messages = synthesize_messages(entry, index)
+        options = {name: entry[name] for name in ("model", "temperature", "max_tokens") if name in entry}
+        started = time.perf_counter()
+        try:
+            if entry.get("stream"):
+                first = None
+                async for _ in proxy.achat_stream(messages, **options):
+                    if first is None:
+                        first = time.perf_counter() - started
+                if first is not None:
+                    first_tokens.append(first)
+            else:
+                await proxy.achat(messages, use_cache=False, **options)
+        except Exception as exc:
+            errors[type(exc).__name__] += 1
+            return
+        latencies.append(time.perf_counter() - started)
+
+    begin = time.perf_counter()
+    tasks = []
+    for index, (entry, offset) in enumerate(zip(entries, offsets)):
+        delay = begin + offset - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        # How far sending fell behind schedule, a busy client would otherwise pass for a slow upstream
+        lags.append(max(0.0, time.perf_counter() - begin - offset))
+        tasks.append(asyncio.ensure_future(send(index, entry)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - begin
+
+    span = offsets[-1] if offsets and offsets[-1] > 0 else elapsed
+    report = {
+        "requests": len(entries),
+        "completed": len(latencies),
+        "errors": dict(errors),
+        "duration_s": elapsed,
+        "offered_rps": len(entries) / span if span else 0.0,
+        "achieved_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "max_send_lag_ms": max(lags, default=0.0) * 1000,
+    }
+    if latencies:
+        report["latency"] = dict(summarize(latencies), histogram=histogram(latencies))
+    if first_tokens:
+        report["first_token"] = summarize(first_tokens)
+    recorded = [entry["latency"] for entry in entries if entry.get("status") == "ok" and "latency" in entry]
+    if recorded:
+        report["recorded_latency"] = summarize(recorded)
+    return report
+
+
+def main():
+    """Replay a traffic log and write the report as JSON"""
+    parser = argparse.ArgumentParser(description='Replay a recorded traffic log as open-loop load')
+    parser.add_argument('log', help='JSONL traffic log written by src.traffic.start_recording')
+    pace = parser.add_mutually_exclusive_group()
+    pace.add_argument('--speed', type=float, default=1.0, help='Replay speed relative to the recording (default: 1)')
+    pace.add_argument('--qps', type=float, help='Send at this fixed rate instead of the recorded arrival times')
+    parser.add_argument('--key', help='Encrypted key of the upstream to replay against (default: a local stub)')
+    parser.add_argument('--upstream-latency', type=float, default=0.02, help='Stub latency in seconds')
+    parser.add_argument('--limit', type=int, help='Replay only the first N requests')
+    parser.add_argument('--max-concurrency', type=int, help='Requests the client keeps in flight (default: no limit)')
+    parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+    args = parser.parse_args()
+
+    entries = read_log(args.log)[:args.limit]
+    if not entries:
+        parser.error(f"No requests in {args.log}")
+    offsets = replay_offsets(entries, speed=args.speed, qps=args.qps)
+
+    upstream: Optional[Any] = None
+    key = args.key
+    if key is None:
+        upstream, base_url = start_upstream(latency=args.upstream_latency)
+        key = make_key(base_url)
+    try:
+        print(f"Replaying {len(entries)} requests over {offsets[-1]:.1f}s...", file=sys.stderr)
+        proxy = AsyncLLMProxy(key, max_concurrency=args.max_concurrency)
+        report = asyncio.run(replay(proxy, entries, offsets))
+    finally:
+        if upstream is not None:
+            upstream.terminate()
+
+    report["meta"] = {
+        "log": args.log,
+        "speed": None if args.qps else args.speed,
+        "qps": args.qps,
+        "upstream": "stub" if args.key is None else "key",
+        "upstream_latency": args.upstream_latency if args.key is None else None,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,394 @@
+"""
+Benchmark Suite - Measures key handling cost, proxy overhead and throughput against a local stub upstream
+
+Usage:
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --suite keys --suite overhead
+    python -m benchmarks.compare baseline.json results.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+# Add project root directory to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from openai.types.chat import ChatCompletion
+
+from src import adapters, stub_upstream
+from src.key_generator import KeyGenerator, generate_encrypted_key
+from src.llm_proxy import AsyncLLMProxy, LLMProxy
+from src.models import LLMConfig
+
+
+MESSAGES = [{"role": "user", "content": "Benchmark prompt with a few words in it"}]
+
+# A 20-turn conversation, the latest user message is echoed back
+LONG_MESSAGES = [
+    {"role": "user" if i % 2 else "assistant", "content": "Earlier turn with a sentence or two of text. " * 4}
+    for i in range(19)
+] + MESSAGES
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """Summarize durations in seconds as milliseconds"""
+    ordered = sorted(samples)
+    count = len(ordered)
+
+    def percentile(p: float) -> float:
+        return ordered[min(count - 1, int(round(p / 100 * (count - 1))))] * 1000
+
+    return {
+        "count": count,
+        "mean_ms": sum(ordered) / count * 1000,
+        "min_ms": ordered[0] * 1000,
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def timed(fn: Callable[[], Any], iterations: int) -> List[float]:
+    """Run fn repeatedly and return each duration"""
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def start_upstream(latency: float = 0.0, chunk_delay: float = 0.0) -> Tuple[subprocess.Popen, str]:
+    """Run the stub upstream in a separate process so it does not share the GIL with the client"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    process = subprocess.Popen(
+        [sys.executable, "-m", "src.stub_upstream", "--port", str(port),
+         "--latency", str(latency), "--chunk-delay", str(chunk_delay)],
+        cwd=root,
+        # Clients abandoning streams early make the stub log disconnects, keep the report readable
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(base_url + "/v1/models", timeout=1)
+            return process, base_url
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Stub upstream did not start")
+
+
+def make_key(base_url: str, version: Optional[int] = None) -> str:
+    """Encrypted key pointing at the stub upstream"""
+    config = LLMConfig(provider="openai", base_url=base_url + "/v1", api_key="bench-key", model="stub-model")
+    return KeyGenerator.encrypt_config(config, version=version)
+
+
+def bench_keys(args: argparse.Namespace, base_url: str) -> Dict[str, Any]:
+    """Cost of encrypting and decrypting configuration keys"""
+    config = LLMConfig(provider="openai", base_url="http://stub/v1", api_key="bench-key", model="stub-model")
+    iterations = max(5, args.iterations // 20)
+    results = {}
+    for version in (1, 2):
+        token = KeyGenerator.encrypt_config(config, version=version)
+        results[f"encrypt_v{version}"] = summarize(
+            timed(lambda: KeyGenerator.encrypt_config(config, version=version), iterations))
+        results[f"decrypt_v{version}_cold"] = summarize(
+            timed(lambda: KeyGenerator.decrypt_config(token, use_cache=False), iterations))
+        KeyGenerator.decrypt_config(token)
+        results[f"decrypt_v{version}_cached"] = summarize(
+            timed(lambda: KeyGenerator.decrypt_config(token), args.iterations))
+    return results
+
+
+def bench_construction(args: argparse.Namespace, base_url: str) -> Dict[str, Any]:
+    """Cost of constructing proxies from an already decrypted key"""
+    token = make_key(base_url)
+    LLMProxy(token)
+    return {
+        "llm_proxy": summarize(timed(lambda: LLMProxy(token), args.iterations)),
+        "async_llm_proxy": summarize(timed(lambda: AsyncLLMProxy(token), args.iterations)),
+    }
+
+
+def bench_overhead(args: argparse.Namespace, base_url: str) -> Dict[str, Any]:
+    """Per-request latency added by the proxy over a direct pooled HTTP request"""
+    token = make_key(base_url)
+    proxy = LLMProxy(token)
+    body = {"model": "stub-model", "messages": MESSAGES, "temperature": 0.7}
+    headers = {"Authorization": "Bearer bench-key"}
+
+    with httpx.Client() as client:
+        def direct():
+            client.post(base_url + "/v1/chat/completions", json=body, headers=headers).json()["choices"][0]
+
+        def direct_first_chunk():
+            with client.stream("POST", base_url + "/v1/chat/completions", json=dict(body, stream=True),
+                               headers=headers) as response:
+                next(response.iter_lines())
+
+        for fn in (direct, lambda: proxy.chat(MESSAGES)):
+            timed(fn, 20)
+        direct_samples = timed(direct, args.iterations)
+        proxy_samples = timed(lambda: proxy.chat(MESSAGES), args.iterations)
+        direct_ttfb = timed(direct_first_chunk, args.iterations)
+
+    def proxy_first_delta():
+        stream = proxy.chat_stream(MESSAGES)
+        next(stream)
+        stream.close()
+
+    proxy_ttft = timed(proxy_first_delta, args.iterations)
+
+    direct_summary = summarize(direct_samples)
+    proxy_summary = summarize(proxy_samples)
+    return {
+        "direct": direct_summary,
+        "proxy": proxy_summary,
+        "added_p50_ms": proxy_summary["p50_ms"] - direct_summary["p50_ms"],
+        "added_p95_ms": proxy_summary["p95_ms"] - direct_summary["p95_ms"],
+        "added_p99_ms": proxy_summary["p99_ms"] - direct_summary["p99_ms"],
+        "stream_direct_first_chunk": summarize(direct_ttfb),
+        "stream_proxy_first_delta": summarize(proxy_ttft),
+    }
+
+
+def bench_adapters(args: argparse.Namespace, base_url: str) -> Dict[str, Any]:
+    """OpenAI SDK path versus native adapters and raw calls, with and without the fast path, and response parsing"""
+    results = {}
+    token = make_key(base_url)
+    for name, adapter in (("sdk", "sdk"), ("native", "native")):
+        for suffix, fast_path in (("", False), ("_fast", True)):
+            proxy = LLMProxy(token, adapter=adapter, fast_path=fast_path)
+            timed(lambda: proxy.chat(MESSAGES), 20)
+            results[f"openai_{name}{suffix}"] = summarize(timed(lambda: proxy.chat(MESSAGES), args.iterations))
+            # Request building grows with the conversation, the response stays the same size
+            results[f"openai_{name}{suffix}_long"] = summarize(
+                timed(lambda: proxy.chat(LONG_MESSAGES), args.iterations))
+
+    # Raw calls relay the body without parsing it into a completion
+    proxy = LLMProxy(token)
+    timed(lambda: proxy.chat_raw(MESSAGES), 20)
+    results["openai_raw"] = summarize(timed(lambda: proxy.chat_raw(MESSAGES), args.iterations))
+    results["openai_raw_stream"] = summarize(
+        timed(lambda: b"".join(proxy.chat_raw(MESSAGES, stream=True)), args.iterations))
+
+    for provider, path in (("anthropic", "/v1"), ("google", "/v1beta")):
+        proxy = LLMProxy(generate_encrypted_key(provider, base_url + path, "bench-key", "stub-model"))
+        timed(lambda: proxy.chat(MESSAGES), 20)
+        results[f"{provider}_native"] = summarize(timed(lambda: proxy.chat(MESSAGES), args.iterations))
+
+    payload = json.dumps(stub_upstream.completion_body({"messages": MESSAGES}, "word " * 200)).encode()
+    adapter = adapters.OpenAIAdapter()
+    iterations = args.iterations * 10
+    results["parse_sdk"] = summarize(timed(lambda: ChatCompletion.model_validate_json(payload), iterations))
+    results["parse_native"] = summarize(timed(lambda: adapter.parse(adapters.loads(payload)), iterations))
+    return results
+
+
+def bench_throughput(args: argparse.Namespace, base_url: str) -> Dict[str, Any]:
+    """Requests per second at rising concurrency, sync threads versus one event loop"""
+    token = make_key(base_url)
+    results = {}
+    for concurrency in args.concurrency:
+        total = max(args.iterations, concurrency * 4)
+
+        proxy = LLMProxy(token)
+
+        def one() -> float:
+            started = time.perf_counter()
+            proxy.chat(MESSAGES)
+            return time.perf_counter() - started
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(lambda _: one(), range(concurrency)))
+            started = time.perf_counter()
+            samples = list(executor.map(lambda _: one(), range(total)))
+            elapsed = time.perf_counter() - started
+        results[f"sync_c{concurrency}"] = dict(summarize(samples), rps=total / elapsed)
+
+        async def run_async():
+            async_proxy = AsyncLLMProxy(token, max_concurrency=concurrency)
+
+            async def one_async() -> float:
+                started = time.perf_counter()
+                await async_proxy.achat(MESSAGES)
+                return time.perf_counter() - started
+
+            await asyncio.gather(*[one_async() for _ in range(concurrency)])
+            started = time.perf_counter()
+            samples = await asyncio.gather(*[one_async() for _ in range(total)])
+            return samples, time.perf_counter() - started
+
+        samples, elapsed = asyncio.run(run_async())
+        results[f"async_c{concurrency}"] = dict(summarize(samples), rps=total / elapsed)
+    return results
+
+
+def bench_scheduler(args: argparse.Namespace, base_url: str) -> Dict[str, Any]:
+    """Interactive latency while a batch job floods an API key limited to a few calls in flight"""
+    def key(model: str) -> str:
+        config = LLMConfig(provider="openai", base_url=base_url + "/v1", api_key="bench-scheduler-key", model=model)
+        return KeyGenerator.encrypt_config(config)
+
+    batch_key, interactive_key = key("batch-model"), key("interactive-model")
+    # Same configuration and class for both (one FIFO queue), separate tenants, then separate classes
+    setups = {
+        "fifo": (batch_key, "batch"),
+        "fair_share": (interactive_key, "batch"),
+        "priority": (interactive_key, "interactive"),
+    }
+    results = {}
+    for name, (key_used, priority) in setups.items():
+        async def run():
+            batch = AsyncLLMProxy(batch_key, max_inflight=args.max_inflight, priority="batch")
+            interactive = AsyncLLMProxy(key_used, max_inflight=args.max_inflight, priority=priority)
+            done = asyncio.Event()
+
+            async def batch_worker():
+                while not done.is_set():
+                    await batch.achat(MESSAGES, use_cache=False)
+
+            # The batch job keeps four times as many requests outstanding as the key allows in flight
+            flood = [asyncio.ensure_future(batch_worker()) for _ in range(args.max_inflight * 4)]
+            await asyncio.sleep(0.1)
+            samples = []
+            for _ in range(20):
+                started = time.perf_counter()
+                await interactive.achat(MESSAGES)
+                samples.append(time.perf_counter() - started)
+            done.set()
+            await asyncio.gather(*flood)
+            return samples
+
+        results[name] = summarize(asyncio.run(run()))
+    return results
+
+
+# Statements timed in a fresh interpreter by the imports suite, {key} is a v2 key to the stub
+STARTUP = {
+    "key_generator": "import src.key_generator",
+    "decrypt_key": "from src.key_generator import KeyGenerator; KeyGenerator.decrypt_dict({key!r})",
+    "cli_decrypt": "from src.__main__ import main; main(['decrypt', {key!r}])",
+    "llm_proxy": "import src.llm_proxy",
+    "first_proxy": "from src.llm_proxy import LLMProxy; LLMProxy({key!r}).client",
+    "server": "import src.server",
+}
+
+# Modules whose loading the imports suite reports, each costs tens to hundreds of milliseconds
+HEAVY_MODULES = ("openai", "pydantic", "httpx", "gradio", "starlette")
+
+
+def bench_imports(args: argparse.Namespace, base_url: str) -> Dict[str, Any]:
+    """Start-up cost of common entry points, each measured in a fresh interpreter"""
+    key = make_key(base_url)
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    iterations = max(3, args.iterations // 40)
+    results = {}
+    for name, statement in STARTUP.items():
+        # Timed inside the interpreter, its own start-up would otherwise dominate
+        script = (
+            "import contextlib, io, json, sys, time\n"
+            "started = time.perf_counter()\n"
+            "with contextlib.redirect_stdout(io.StringIO()):\n"
+            f"    {statement.format(key=key)}\n"
+            "elapsed = time.perf_counter() - started\n"
+            f"print(json.dumps([elapsed, [m for m in {HEAVY_MODULES!r} if m in sys.modules]]))\n"
+        )
+        samples = []
+        for _ in range(iterations):
+            output = subprocess.check_output([sys.executable, "-c", script], cwd=root)
+            elapsed, loaded = json.loads(output.decode().strip().splitlines()[-1])
+            samples.append(elapsed)
+        results[name] = dict(summarize(samples), loaded=loaded)
+    return results
+
+
+SUITES = {
+    "keys": bench_keys,
+    "construction": bench_construction,
+    "overhead": bench_overhead,
+    "adapters": bench_adapters,
+    "throughput": bench_throughput,
+    "scheduler": bench_scheduler,
+    "imports": bench_imports,
+}
+
+
+def git_commit() -> Optional[str]:
+    """Current commit of the working tree, if available"""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=os.path.dirname(__file__), stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    """Run the selected suites and write results as JSON"""
+    parser = argparse.ArgumentParser(description='Benchmark the LLM proxy against a local stub upstream')
+    parser.add_argument('--suite', action='append', choices=list(SUITES), help='Suite to run, may repeat (default: all)')
+    parser.add_argument('--iterations', type=int, default=200, help='Samples per measurement')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32, 128],
+                        help='Concurrency levels for the throughput suite')
+    parser.add_argument('--upstream-latency', type=float, default=0.02,
+                        help='Stub latency in seconds for the throughput and scheduler suites')
+    parser.add_argument('--max-inflight', type=int, default=4,
+                        help='Calls in flight allowed through the API key in the scheduler suite')
+    parser.add_argument('--output', help='Write JSON results to this file instead of stdout')
+    args = parser.parse_args()
+
+    suites = args.suite or list(SUITES)
+    results = {}
+    fast_upstream, fast_url = start_upstream()
+    slow_upstream, slow_url = start_upstream(latency=args.upstream_latency)
+    try:
+        for name in suites:
+            print(f"Running {name}...", file=sys.stderr)
+            url = slow_url if name in ("throughput", "scheduler") else fast_url
+            results[name] = SUITES[name](args, url)
+    finally:
+        fast_upstream.terminate()
+        slow_upstream.terminate()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "iterations": args.iterations,
+            "concurrency": args.concurrency,
+            "upstream_latency": args.upstream_latency,
+        },
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
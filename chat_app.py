@@ -9,6 +9,10 @@ import sys
 # Ensure project modules can be imported
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
 
+# The application's modules read their settings as they are imported
+from dotenv import load_dotenv
+load_dotenv()
+
 from src.app import main
 
 if __name__ == "__main__":
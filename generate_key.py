@@ -9,6 +9,10 @@ import sys
 # Ensure project modules can be imported
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
 
+# The master key is read from the environment as the application's modules are imported
+from dotenv import load_dotenv
+load_dotenv()
+
 from src.key_generator_app import main
 
 if __name__ == "__main__":
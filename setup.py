@@ -7,10 +7,17 @@ setup(
     install_requires=[
         "cryptography",
         "openai",
+        "httpx",
+        "starlette",
+        "uvicorn",
         "python-dotenv",
         "gradio",
         "pydantic"
     ],
+    extras_require={
+        # Faster JSON encoding and decoding in the native provider adapters
+        "fast": ["orjson"],
+    },
     author="LLM Proxy Platform Developer",
     author_email="example@example.com",
     description="A platform for securely configuring LLM API access",
@@ -0,0 +1,159 @@
+"""
+Command Line - Fast-starting entry point for key operations, chat and the gateway
+
+Each command imports only what it uses: decrypting a key loads neither the provider SDK nor
+pydantic, and nothing but serve loads the web stack. Settings in a .env file are read before
+anything else, so they apply to every module.
+
+Usage:
+    python -m src encrypt --provider openai --base-url https://api.openai.com/v1 --api-key sk-... --model gpt-4o-mini
+    python -m src decrypt "$KEY"
+    python -m src chat --key "$KEY" "Hello"
+    python -m src serve --port 8000 --workers 4
+"""
+
+import argparse
+import json
+import os
+import sys
+from typing import Any, Dict, List, Optional
+
+
+def _pairs(values: Optional[List[str]], parse_json: bool = False) -> Dict[str, Any]:
+    """KEY=VALUE arguments as a dict, values that are valid JSON are decoded when parse_json is set"""
+    pairs = {}
+    for item in values or ():
+        name, separator, value = item.partition("=")
+        if not separator:
+            raise ValueError(f"Expected KEY=VALUE, got: {item}")
+        if parse_json:
+            try:
+                value = json.loads(value)
+            except ValueError:
+                pass
+        pairs[name] = value
+    return pairs
+
+
+def encrypt(args: argparse.Namespace) -> int:
+    """Print the encrypted key of a configuration given on the command line"""
+    from .key_generator import KeyGenerator
+    from .models import LLMConfig
+
+    config = LLMConfig(
+        provider=args.provider,
+        base_url=args.base_url,
+        api_key=args.api_key,
+        model=args.model,
+        headers=_pairs(args.header),
+        extra_body=_pairs(args.extra_body, parse_json=True),
+        rpm=args.rpm,
+        tpm=args.tpm,
+        max_inflight=args.max_inflight,
+        priority=args.priority,
+        share=args.share,
+        stream_usage=args.stream_usage,
+    )
+    print(KeyGenerator.encrypt_config(config, version=args.version, master_key=args.master_key))
+    return 0
+
+
+def decrypt(args: argparse.Namespace) -> int:
+    """Print the configuration of an encrypted key as JSON"""
+    from .key_generator import KeyGenerator
+
+    print(json.dumps(KeyGenerator.decrypt_dict(args.key, master_key=args.master_key), indent=2))
+    return 0
+
+
+def chat(args: argparse.Namespace) -> int:
+    """Send one message and print the reply, streamed as it is generated"""
+    if not args.key:
+        raise ValueError("No key given, pass --key or set LLM_PROXY_KEY")
+    message = sys.stdin.read() if args.message in (None, "-") else args.message
+
+    from .llm_proxy import LLMProxy
+
+    proxy = LLMProxy(args.key)
+    messages = ([{"role": "system", "content": args.system}] if args.system else []) + [
+        {"role": "user", "content": message}
+    ]
+    options = {"model": args.model, "temperature": args.temperature, "max_tokens": args.max_tokens}
+    if args.no_stream:
+        print(proxy.chat(messages, **options))
+        return 0
+    for delta in proxy.chat_stream(messages, **options):
+        print(delta, end="", flush=True)
+    print()
+    return 0
+
+
+def serve(args: argparse.Namespace, options: List[str]) -> int:
+    """Run the gateway server, options are those of python -m src.server"""
+    from . import server
+
+    server.main(options)
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run a command, returns the exit status"""
+    # python-dotenv is light, but only commands reading settings need it
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(prog="python -m src", description='LLM proxy command line')
+    commands = parser.add_subparsers(dest="command", metavar="command")
+    commands.required = True
+
+    encrypt_parser = commands.add_parser("encrypt", help="Encrypt a configuration into a key")
+    encrypt_parser.add_argument('--provider', required=True, help='LLM provider (openai, anthropic, google, openrouter, custom)')
+    encrypt_parser.add_argument('--base-url', required=True, help='API base URL')
+    encrypt_parser.add_argument('--api-key', required=True, help='API key')
+    encrypt_parser.add_argument('--model', required=True, help='Model name')
+    encrypt_parser.add_argument('--header', action='append', help='HTTP header, KEY=VALUE, may repeat')
+    encrypt_parser.add_argument('--extra-body', action='append', help='Extra request body parameter, KEY=VALUE with '
+                                                                      'VALUE parsed as JSON where valid, may repeat')
+    encrypt_parser.add_argument('--rpm', type=int, help='Requests per minute limit of the API key')
+    encrypt_parser.add_argument('--tpm', type=int, help='Tokens per minute limit of the API key')
+    encrypt_parser.add_argument('--max-inflight', type=int, help='Calls allowed in flight through the API key')
+    encrypt_parser.add_argument('--priority', choices=("interactive", "batch"), help='Scheduler priority class')
+    encrypt_parser.add_argument('--share', type=float, help='Fair queuing weight against other configurations')
+    encrypt_parser.add_argument('--stream-usage', action='store_true',
+                                help='Ask the upstream for the usage of streamed responses (OpenAI-compatible)')
+    encrypt_parser.add_argument('--version', type=int, choices=(1, 2), help='Token format (default: 2)')
+    encrypt_parser.add_argument('--master-key', help='Master key to encrypt with (default: LLM_PROXY_MASTER_KEY)')
+
+    decrypt_parser = commands.add_parser("decrypt", help="Print the configuration of a key as JSON")
+    decrypt_parser.add_argument('key', help='Encrypted configuration key')
+    decrypt_parser.add_argument('--master-key', help='Master key the key was encrypted with (default: LLM_PROXY_MASTER_KEY)')
+
+    chat_parser = commands.add_parser("chat", help="Send a message and print the reply")
+    chat_parser.add_argument('message', nargs='?', help='Message to send, read from stdin if omitted or "-"')
+    chat_parser.add_argument('--key', default=os.environ.get("LLM_PROXY_KEY"),
+                             help='Encrypted configuration key (default: LLM_PROXY_KEY)')
+    chat_parser.add_argument('--system', help='System prompt')
+    chat_parser.add_argument('--model', help='Model overriding the configured one')
+    chat_parser.add_argument('--temperature', type=float, default=0.7, help='Sampling temperature')
+    chat_parser.add_argument('--max-tokens', type=int, help='Maximum tokens to generate')
+    chat_parser.add_argument('--no-stream', action='store_true', help='Print the reply once it is complete')
+
+    commands.add_parser("serve", help="Run the gateway server, see python -m src serve --help", add_help=False)
+
+    args, extra = parser.parse_known_args(argv)
+    if args.command == "serve":
+        return serve(args, extra)
+    if extra:
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+
+    try:
+        return {"encrypt": encrypt, "decrypt": decrypt, "chat": chat}[args.command](args)
+    except KeyboardInterrupt:
+        return 130
+    except Exception as e:
+        print(f"Error: {type(e).__name__}: {e}" if str(e) else f"Error: {type(e).__name__}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,526 @@
+"""
+Provider Adapters - Native httpx transports for OpenAI-compatible, Anthropic Messages and Gemini APIs
+"""
+
+import json
+from typing import Any, AsyncIterator, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import httpx
+
+from .models import LLMConfig
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+
+def dumps(data: Any) -> bytes:
+    """Encode JSON, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def loads(data: Any) -> Any:
+    """Decode JSON, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class Usage(NamedTuple):
+    """Token usage, attribute-compatible with the OpenAI SDK usage object"""
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+
+
+class Completion:
+    """The parts of a completion the proxy uses, parsed without building SDK objects"""
+
+    __slots__ = ("content", "usage", "finish_reason", "model")
+
+    def __init__(self, content: Optional[str], usage: Optional[Usage] = None,
+                 finish_reason: Optional[str] = None, model: Optional[str] = None):
+        self.content = content
+        self.usage = usage
+        self.finish_reason = finish_reason
+        self.model = model
+
+
+class UpstreamError(Exception):
+    """Error reported by an upstream through a native adapter"""
+
+
+class UpstreamStatusError(UpstreamError):
+    """Upstream answered with an error status, retried and counted like the SDK's APIStatusError"""
+
+    def __init__(self, message: str, response: httpx.Response):
+        super().__init__(f"Error code: {response.status_code} - {message}")
+        self.status_code = response.status_code
+        self.response = response
+
+    @classmethod
+    def from_response(cls, response: httpx.Response) -> "UpstreamStatusError":
+        """Build from an error response whose body has been read"""
+        # OpenAI, Anthropic and Gemini all report {"error": {"message": ...}}
+        try:
+            message = loads(response.content)["error"]["message"]
+        except (ValueError, KeyError, TypeError):
+            message = response.text[:200] or response.reason_phrase
+        return cls(message, response)
+
+
+def _text(content: Any) -> str:
+    """Plain text of an OpenAI-style message content, string or list of parts"""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return "" if content is None else str(content)
+
+
+class CompiledRequest:
+    """URL, headers and pre-encoded static body of the requests to one endpoint"""
+
+    __slots__ = ("endpoint", "url", "headers", "static", "prefix")
+
+    def __init__(self, endpoint: LLMConfig, url: str, headers: Dict[str, str], static: Dict[str, Any]):
+        self.endpoint = endpoint
+        self.url = url
+        self.headers = headers
+        self.static = static
+        # '{"model":"...",' - the per-call fields are spliced in after it
+        self.prefix = dumps(static)[:-1] + b"," if static else b"{"
+
+    def content(self, fields: Dict[str, Any]) -> bytes:
+        """Encode a request body from the per-call fields, only they are serialized"""
+        if not fields:
+            return dumps(self.static)
+        return self.prefix + dumps(fields)[1:]
+
+
+class ProviderAdapter:
+    """
+    Translates OpenAI-style request parameters into one provider's HTTP API
+
+    Subclasses implement request(), fields(), parse() and parse_event(); sending, error handling
+    and server-sent event decoding are shared.
+    """
+
+    name = "base"
+    # Body fields fields() derives from the per-call parameters, the rest of the body only depends
+    # on the configuration and can be precompiled
+    DYNAMIC_FIELDS: Tuple[str, ...] = ()
+
+    def request(self,
+                endpoint: LLMConfig,
+                kwargs: Dict[str, Any],
+                stream: bool) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        """
+        Translate request parameters
+
+        Args:
+            endpoint: Backend the request goes to (base_url, api_key)
+            kwargs: Request parameters from _build_request, including extra_headers
+            stream: Whether to request a streamed response
+
+        Returns:
+            URL, headers and JSON body
+        """
+        raise NotImplementedError
+
+    def fields(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Translate the per-call parameters (messages, sampling) into DYNAMIC_FIELDS of the body"""
+        raise NotImplementedError
+
+    def compile(self, endpoint: LLMConfig, kwargs: Dict[str, Any], stream: bool) -> "CompiledRequest":
+        """
+        Precompute URL, headers and the serialized static part of the body
+
+        Args:
+            endpoint: Backend the request goes to
+            kwargs: Parameters of any request built from the configuration
+            stream: Whether responses are streamed
+
+        Returns:
+            CompiledRequest valid for every request with the same endpoint, model and stream flag
+        """
+        url, headers, body = self.request(endpoint, kwargs, stream)
+        headers["Content-Type"] = "application/json"
+        static = {name: value for name, value in body.items() if name not in self.DYNAMIC_FIELDS}
+        return CompiledRequest(endpoint, url, headers, static)
+
+    def parse(self, data: Dict[str, Any]) -> Completion:
+        """Extract the completion from a decoded response body"""
+        raise NotImplementedError
+
+    def parse_event(self, data: Dict[str, Any]) -> Tuple[Optional[str], Optional[Usage]]:
+        """Extract the text delta and any usage from a decoded stream event"""
+        raise NotImplementedError
+
+    def _http_request(self,
+                      http_client: Any,
+                      endpoint: LLMConfig,
+                      kwargs: Dict[str, Any],
+                      stream: bool,
+                      compiled: Optional["CompiledRequest"] = None,
+                      timeout: Optional[httpx.Timeout] = None) -> httpx.Request:
+        timeout = httpx.USE_CLIENT_DEFAULT if timeout is None else timeout
+        if compiled is not None:
+            return http_client.build_request("POST", compiled.url, headers=compiled.headers,
+                                             content=compiled.content(self.fields(kwargs)), timeout=timeout)
+        url, headers, body = self.request(endpoint, kwargs, stream)
+        headers["Content-Type"] = "application/json"
+        return http_client.build_request("POST", url, headers=headers, content=dumps(body), timeout=timeout)
+
+    def send(self, http_client: httpx.Client, endpoint: LLMConfig, kwargs: Dict[str, Any],
+             stream: bool = False, compiled: Optional["CompiledRequest"] = None,
+             timeout: Optional[httpx.Timeout] = None, raw: bool = False) -> Any:
+        """
+        Send a request through a pooled HTTP client
+
+        Args:
+            http_client: Pooled HTTP client
+            endpoint: Backend the request goes to
+            kwargs: Request parameters from _build_request
+            stream: Whether to stream the response
+            compiled: Result of compile() for this endpoint, model and stream flag, skips rebuilding
+                and re-encoding the static part of the request
+            timeout: Timeouts of this request, defaults to the client's
+            raw: Return the response body undecoded instead of parsing it
+
+        Returns:
+            Completion, or EventStream of text deltas when streaming. With raw, the body as bytes,
+            or RawStream of its chunks when streaming
+        """
+        request = self._http_request(http_client, endpoint, kwargs, stream, compiled, timeout)
+        response = http_client.send(request, stream=stream)
+        if response.status_code >= 400:
+            response.read()
+            response.close()
+            raise UpstreamStatusError.from_response(response)
+        if stream:
+            return RawStream(response) if raw else EventStream(self, response)
+        return response.content if raw else self.parse(loads(response.content))
+
+    async def asend(self, http_client: httpx.AsyncClient, endpoint: LLMConfig, kwargs: Dict[str, Any],
+                    stream: bool = False, compiled: Optional["CompiledRequest"] = None,
+                    timeout: Optional[httpx.Timeout] = None, raw: bool = False) -> Any:
+        """Async variant of send(), streams are AsyncEventStreams or AsyncRawStreams"""
+        request = self._http_request(http_client, endpoint, kwargs, stream, compiled, timeout)
+        response = await http_client.send(request, stream=stream)
+        if response.status_code >= 400:
+            await response.aread()
+            await response.aclose()
+            raise UpstreamStatusError.from_response(response)
+        if stream:
+            return AsyncRawStream(response) if raw else AsyncEventStream(self, response)
+        return response.content if raw else self.parse(loads(response.content))
+
+    @staticmethod
+    def _body(kwargs: Dict[str, Any], known: Tuple[str, ...]) -> Dict[str, Any]:
+        """Parameters not translated by the adapter, e.g. extra_body, passed through as is"""
+        return {name: value for name, value in kwargs.items() if name not in known and name != "extra_headers"}
+
+
+class OpenAIAdapter(ProviderAdapter):
+    """OpenAI chat completions, also used by OpenRouter and other compatible servers"""
+
+    name = "openai"
+    DYNAMIC_FIELDS = ("messages", "temperature", "max_tokens")
+
+    def request(self, endpoint, kwargs, stream):
+        headers = {"Authorization": f"Bearer {endpoint.api_key}"}
+        headers.update(kwargs.get("extra_headers") or {})
+        body = self._body(kwargs, ())
+        if stream:
+            body["stream"] = True
+        return endpoint.base_url.rstrip("/") + "/chat/completions", headers, body
+
+    def fields(self, kwargs):
+        return {name: kwargs[name] for name in self.DYNAMIC_FIELDS if name in kwargs}
+
+    def parse(self, data):
+        choice = data["choices"][0]
+        usage = data.get("usage")
+        return Completion(
+            choice["message"].get("content"),
+            Usage(usage.get("prompt_tokens") or 0, usage.get("completion_tokens") or 0,
+                  usage.get("total_tokens") or 0) if usage else None,
+            choice.get("finish_reason"),
+            data.get("model"),
+        )
+
+    def parse_event(self, data):
+        usage = data.get("usage")
+        if usage:
+            usage = Usage(usage.get("prompt_tokens") or 0, usage.get("completion_tokens") or 0,
+                          usage.get("total_tokens") or 0)
+        choices = data.get("choices")
+        if not choices:
+            return None, usage
+        return choices[0].get("delta", {}).get("content"), usage
+
+
+class AnthropicAdapter(ProviderAdapter):
+    """Anthropic Messages API"""
+
+    name = "anthropic"
+    API_VERSION = "2023-06-01"
+    # The Messages API requires max_tokens
+    DEFAULT_MAX_TOKENS = 1024
+    DYNAMIC_FIELDS = ("messages", "system", "max_tokens", "temperature")
+
+    def request(self, endpoint, kwargs, stream):
+        headers = {"x-api-key": endpoint.api_key, "anthropic-version": self.API_VERSION}
+        headers.update(kwargs.get("extra_headers") or {})
+        body = {"model": kwargs["model"]}
+        body.update(self.fields(kwargs))
+        body.update(self._body(kwargs, ("model", "messages", "max_tokens", "temperature")))
+        if stream:
+            body["stream"] = True
+        return endpoint.base_url.rstrip("/") + "/messages", headers, body
+
+    def fields(self, kwargs):
+        system = []
+        messages = []
+        for message in kwargs["messages"]:
+            if message.get("role") == "system":
+                system.append(_text(message.get("content")))
+            else:
+                messages.append({"role": message.get("role", "user"), "content": _text(message.get("content"))})
+
+        fields = {
+            "messages": messages,
+            "max_tokens": kwargs.get("max_tokens") or self.DEFAULT_MAX_TOKENS,
+        }
+        if system:
+            fields["system"] = "\n\n".join(system)
+        if kwargs.get("temperature") is not None:
+            # Anthropic accepts 0-1, OpenAI-style callers may send up to 2
+            fields["temperature"] = min(kwargs["temperature"], 1.0)
+        return fields
+
+    def parse(self, data):
+        content = "".join(block.get("text", "") for block in data.get("content", []) if block.get("type") == "text")
+        usage = data.get("usage")
+        if usage:
+            prompt = usage.get("input_tokens") or 0
+            completion = usage.get("output_tokens") or 0
+            usage = Usage(prompt, completion, prompt + completion)
+        return Completion(content, usage, data.get("stop_reason"), data.get("model"))
+
+    def parse_event(self, data):
+        kind = data.get("type")
+        if kind == "content_block_delta":
+            return data["delta"].get("text"), None
+        if kind == "message_start":
+            usage = data["message"].get("usage") or {}
+            prompt = usage.get("input_tokens") or 0
+            return None, Usage(prompt, 0, prompt)
+        if kind == "message_delta":
+            completion = (data.get("usage") or {}).get("output_tokens") or 0
+            # Prompt tokens were reported by message_start, EventStream merges the two
+            return None, Usage(0, completion, completion)
+        if kind == "error":
+            raise UpstreamError(data.get("error", {}).get("message", "Stream error"))
+        return None, None
+
+
+class GeminiAdapter(ProviderAdapter):
+    """Google Gemini generateContent API"""
+
+    name = "google"
+    DYNAMIC_FIELDS = ("contents", "systemInstruction", "generationConfig")
+    KNOWN = ("model", "messages", "max_tokens", "temperature", "generationConfig")
+
+    def request(self, endpoint, kwargs, stream):
+        headers = {"x-goog-api-key": endpoint.api_key}
+        headers.update(kwargs.get("extra_headers") or {})
+        body = self.fields(kwargs)
+        body.update(self._body(kwargs, self.KNOWN))
+        method = "streamGenerateContent?alt=sse" if stream else "generateContent"
+        return f"{endpoint.base_url.rstrip('/')}/models/{kwargs['model']}:{method}", headers, body
+
+    def fields(self, kwargs):
+        system = []
+        contents = []
+        for message in kwargs["messages"]:
+            role = message.get("role", "user")
+            if role == "system":
+                system.append({"text": _text(message.get("content"))})
+            else:
+                contents.append({
+                    "role": "model" if role == "assistant" else "user",
+                    "parts": [{"text": _text(message.get("content"))}],
+                })
+
+        generation_config = {}
+        if kwargs.get("temperature") is not None:
+            generation_config["temperature"] = kwargs["temperature"]
+        if kwargs.get("max_tokens") is not None:
+            generation_config["maxOutputTokens"] = kwargs["max_tokens"]
+
+        # generationConfig from extra_body is merged with the sampling parameters, not replaced
+        generation_config.update(kwargs.get("generationConfig") or {})
+
+        fields: Dict[str, Any] = {"contents": contents}
+        if system:
+            fields["systemInstruction"] = {"parts": system}
+        if generation_config:
+            fields["generationConfig"] = generation_config
+        return fields
+
+    @staticmethod
+    def _usage(data: Dict[str, Any]) -> Optional[Usage]:
+        usage = data.get("usageMetadata")
+        if not usage:
+            return None
+        prompt = usage.get("promptTokenCount") or 0
+        completion = usage.get("candidatesTokenCount") or 0
+        return Usage(prompt, completion, usage.get("totalTokenCount") or prompt + completion)
+
+    @staticmethod
+    def _candidate_text(data: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+        candidates = data.get("candidates")
+        if not candidates:
+            return None, None
+        parts = candidates[0].get("content", {}).get("parts", [])
+        return "".join(part.get("text", "") for part in parts), candidates[0].get("finishReason")
+
+    def parse(self, data):
+        content, finish_reason = self._candidate_text(data)
+        return Completion(content, self._usage(data), finish_reason, data.get("modelVersion"))
+
+    def parse_event(self, data):
+        return self._candidate_text(data)[0], self._usage(data)
+
+
+def _merge_usage(current: Optional[Usage], update: Usage) -> Usage:
+    """Fold an event's usage into the stream total, later non-zero counts win"""
+    if current is None:
+        return update
+    prompt = update.prompt_tokens or current.prompt_tokens
+    completion = update.completion_tokens or current.completion_tokens
+    return Usage(prompt, completion, prompt + completion)
+
+
+def _event_data(line: str) -> Optional[str]:
+    """Payload of a server-sent event data line, None for other lines"""
+    if not line.startswith("data:"):
+        return None
+    data = line[5:].strip()
+    return data or None
+
+
+class EventStream:
+    """Text deltas of a streamed response, close() releases the connection"""
+
+    def __init__(self, adapter: ProviderAdapter, response: httpx.Response):
+        self.adapter = adapter
+        self.response = response
+        self.usage: Optional[Usage] = None
+
+    def __iter__(self) -> Iterator[str]:
+        for line in self.response.iter_lines():
+            data = _event_data(line)
+            if data is None:
+                continue
+            if data == "[DONE]":
+                break
+            delta, usage = self.adapter.parse_event(loads(data))
+            if usage is not None:
+                self.usage = _merge_usage(self.usage, usage)
+            if delta:
+                yield delta
+
+    def close(self) -> None:
+        self.response.close()
+
+
+class AsyncEventStream:
+    """Async text deltas of a streamed response, await close() releases the connection"""
+
+    def __init__(self, adapter: ProviderAdapter, response: httpx.Response):
+        self.adapter = adapter
+        self.response = response
+        self.usage: Optional[Usage] = None
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        async for line in self.response.aiter_lines():
+            data = _event_data(line)
+            if data is None:
+                continue
+            if data == "[DONE]":
+                break
+            delta, usage = self.adapter.parse_event(loads(data))
+            if usage is not None:
+                self.usage = _merge_usage(self.usage, usage)
+            if delta:
+                yield delta
+
+    async def close(self) -> None:
+        await self.response.aclose()
+
+
+class RawStream:
+    """Chunks of a streamed response body as they arrive, server-sent events left unparsed"""
+
+    # No usage is parsed, kept for callers reading it off any stream
+    usage = None
+
+    def __init__(self, response: httpx.Response):
+        self.response = response
+
+    def __iter__(self) -> Iterator[bytes]:
+        return self.response.iter_bytes()
+
+    def close(self) -> None:
+        self.response.close()
+
+
+class AsyncRawStream:
+    """Async chunks of a streamed response body as they arrive, server-sent events left unparsed"""
+
+    usage = None
+
+    def __init__(self, response: httpx.Response):
+        self.response = response
+
+    def __aiter__(self) -> AsyncIterator[bytes]:
+        return self.response.aiter_bytes()
+
+    async def close(self) -> None:
+        await self.response.aclose()
+
+
+# Adapter per provider name, extend with register_adapter()
+_adapters: Dict[str, ProviderAdapter] = {
+    "openai": OpenAIAdapter(),
+    "openrouter": OpenAIAdapter(),
+    "anthropic": AnthropicAdapter(),
+    "google": GeminiAdapter(),
+}
+
+
+def register_adapter(provider: str, adapter: ProviderAdapter) -> None:
+    """
+    Serve a provider through an adapter, replacing any registered one
+
+    Args:
+        provider: Provider name as stored in configurations, e.g. "custom"
+        adapter: Adapter instance, shared by every proxy
+    """
+    _adapters[provider] = adapter
+
+
+def get_adapter(provider: str) -> Optional[ProviderAdapter]:
+    """Registered adapter of a provider, None if there is none"""
+    return _adapters.get(provider)
+
+
+def registered_providers() -> List[str]:
+    """Providers with a registered adapter"""
+    return sorted(_adapters)
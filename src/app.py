@@ -2,88 +2,157 @@
 Gradio-based LLM testing dialogue platform
 """
 
-import gradio as gr
+import inspect
 import os
-from typing import List, Tuple
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 import traceback
 
+if __name__ == "__main__":
+    # The modules imported below read their LLM_PROXY_* settings as they load, so .env goes first
+    from dotenv import load_dotenv
+    load_dotenv()
+
+from .client_pool import ClientPool
+from .conversation import Conversation
 from .key_generator import KeyGenerator
-from .llm_proxy import LLMProxy
+from .llm_proxy import AsyncLLMProxy
 from .models import LLMConfig
 
 
+# Handlers running at once across all sessions, and requests allowed to wait for a slot
+CONCURRENCY_LIMIT = int(os.environ.get("LLM_PROXY_APP_CONCURRENCY", "64"))
+MAX_QUEUE_SIZE = int(os.environ.get("LLM_PROXY_APP_QUEUE_SIZE", "256"))
+
+
+def _chatbot_options(gr) -> Dict[str, str]:
+    """Gradio 4 and 5 default the chatbot to (user, bot) tuples, later versions only know messages"""
+    return {"type": "messages"} if "type" in inspect.signature(gr.Chatbot.__init__).parameters else {}
+
+
 class LLMChatApp:
-    """LLM chat application"""
+    """LLM chat application state of one browser session"""
     
-    def __init__(self):
+    def __init__(self, pool: Optional[ClientPool] = None):
+        self.pool = pool
         self.llm_proxy = None
-        self.chat_history = []
+        self.chat_history: List[Dict[str, str]] = []
+        self.conversation = None
         self.config = None
     
     def validate_config(self, encrypted_key: str) -> str:
         """Validate the encrypted configuration key"""
         try:
-            # Try to decrypt the configuration
-            self.config = KeyGenerator.decrypt_config(encrypted_key)
-            
-            # Create LLM proxy
-            self.llm_proxy = LLMProxy(encrypted_key)
+            # Create LLM proxy, which decrypts the configuration once
+            self.llm_proxy = AsyncLLMProxy(encrypted_key, pool=self.pool)
+            self.config = self.llm_proxy.config
+            # Requests carry the earlier turns, windowed to the model's context
+            self.conversation = Conversation(self.config.model)
+            self.chat_history = []
             
             return f"✅ Configuration successful! Provider: {self.config.provider}, Model: {self.config.model}"
         except Exception as e:
             traceback.print_exc()
             return f"❌ Configuration failed: {str(e)}"
     
-    def chat(self, message: str) -> Tuple[str, List[Tuple[str, str]], str]:
-        """Process user message and update chat history"""
+    async def chat(self, message: str) -> AsyncIterator[Tuple[str, List[Dict[str, str]], str]]:
+        """Process user message and update chat history as the response streams in"""
         if not self.llm_proxy:
-            return "", self.chat_history, "Please configure LLM API first"
+            yield "", self.chat_history, "Please configure LLM API first"
+            return
+        
+        # Show the user message right away, the response fills in below it
+        self.chat_history.append({"role": "user", "content": message})
+        self.chat_history.append({"role": "assistant", "content": ""})
+        yield "", self.chat_history, ""
         
+        self.conversation.add_user(message)
+        replied = False
+        error_message = ""
         try:
-            # Send message and get response
-            response = self.llm_proxy.send_message(message)
-            
-            # Update chat history
-            self.chat_history.append((message, response))
-            
-            return "", self.chat_history, ""
+            response = ""
+            async for delta in self.llm_proxy.achat_stream(self.conversation.messages()):
+                response += delta
+                self.chat_history[-1] = {"role": "assistant", "content": response}
+                yield "", self.chat_history, ""
+            self.conversation.add_assistant(response)
+            replied = True
         except Exception as e:
             traceback.print_exc()
             error_message = f"Error: {str(e)}"
-            return "", self.chat_history, error_message
+        finally:
+            if not replied:
+                # Failed, cancelled or closed mid-stream: keep the history alternating, the unanswered
+                # message is not resent with the next one
+                self.conversation.pop()
+        if error_message:
+            yield "", self.chat_history, error_message
     
-    def clear_history(self) -> List[Tuple[str, str]]:
+    def clear_history(self) -> List[Dict[str, str]]:
         """Clear chat history"""
         self.chat_history = []
+        if self.conversation is not None:
+            self.conversation.clear()
         return self.chat_history
 
 
-def create_demo():
-    """Create Gradio demo interface"""
-    app = LLMChatApp()
+def validate_config(encrypted_key: str, session: LLMChatApp) -> str:
+    """Validate the key for the calling session"""
+    return session.validate_config(encrypted_key)
+
+
+async def chat(message: str, session: LLMChatApp) -> AsyncIterator[Tuple[str, List[Dict[str, str]], str]]:
+    """Stream the reply to a message of the calling session"""
+    async for update in session.chat(message):
+        yield update
+
+
+def clear_history(session: LLMChatApp) -> List[Dict[str, str]]:
+    """Clear the chat history of the calling session"""
+    return session.clear_history()
+
+
+def create_demo(pool: Optional[ClientPool] = None,
+                concurrency_limit: int = CONCURRENCY_LIMIT,
+                max_queue_size: int = MAX_QUEUE_SIZE):
+    """
+    Create Gradio demo interface
+    
+    Every browser session gets its own proxy and history through gr.State; the proxies share one
+    connection pool, and async handlers let many replies stream at once on the server's event loop.
+    
+    Args:
+        pool: Client pool shared by all sessions, the default pool if None
+        concurrency_limit: Handlers of each event running at once across sessions
+        max_queue_size: Requests waiting for a slot before new ones are turned away
+    """
+    # Gradio takes seconds to import, only the interface itself needs it
+    import gradio as gr
     
     with gr.Blocks(title="LLM Proxy Platform") as demo:
+        # Created by calling the factory when a session loads, never shared between sessions
+        session = gr.State(lambda: LLMChatApp(pool))
+        
         gr.Markdown("# LLM Proxy Platform - Testing Dialogue Interface")
         
         with gr.Row():
             with gr.Column(scale=4):
                 encrypted_key = gr.Textbox(
-                    label="Encrypted Configuration Key", 
+                    label="Encrypted Configuration Key",
                     placeholder="Paste encrypted configuration key...",
                     type="password"
                 )
             
             with gr.Column(scale=1):
                 validate_btn = gr.Button("Validate and Configure")
-                
+        
         config_status = gr.Markdown("*Please enter encrypted configuration key and click validate button*")
         
-        chatbot = gr.Chatbot(label="Conversation")
+        chatbot = gr.Chatbot(label="Conversation", **_chatbot_options(gr))
         
         with gr.Row():
             with gr.Column(scale=4):
                 msg = gr.Textbox(
-                    label="Message", 
+                    label="Message",
                     placeholder="Enter message...",
                     show_label=False
                 )
@@ -96,37 +165,42 @@ def create_demo():
         
         # Bind events
         validate_btn.click(
-            fn=app.validate_config,
-            inputs=[encrypted_key],
-            outputs=[config_status]
+            fn=validate_config,
+            inputs=[encrypted_key, session],
+            outputs=[config_status],
+            api_name="validate_config"
         )
         
         submit_btn.click(
-            fn=app.chat,
-            inputs=[msg],
-            outputs=[msg, chatbot, error_box]
+            fn=chat,
+            inputs=[msg, session],
+            outputs=[msg, chatbot, error_box],
+            api_name="chat"
         )
         
         msg.submit(
-            fn=app.chat,
-            inputs=[msg],
-            outputs=[msg, chatbot, error_box]
+            fn=chat,
+            inputs=[msg, session],
+            outputs=[msg, chatbot, error_box],
+            api_name=False
         )
         
         clear_btn.click(
-            fn=app.clear_history,
-            inputs=[],
-            outputs=[chatbot]
+            fn=clear_history,
+            inputs=[session],
+            outputs=[chatbot],
+            api_name="clear_history"
         )
-        
+    
+    demo.queue(default_concurrency_limit=concurrency_limit, max_size=max_queue_size)
     return demo
 
 
 def main():
-    """Main function"""
+    """Main function, .env is loaded by whatever imported this module first"""
     demo = create_demo()
     demo.launch(share=False)
 
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
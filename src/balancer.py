@@ -0,0 +1,172 @@
+"""
+Load Balancer - Latency-aware backend selection for multi-backend configurations
+"""
+
+import hashlib
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from .cache import TTLCache
+from .models import LLMConfig
+from .resilience import BreakerRegistry, CircuitBreaker, default_breakers, is_upstream_failure
+
+
+class BackendState:
+    """Live statistics of one backend"""
+
+    def __init__(self, config: LLMConfig, weight: float, breaker: CircuitBreaker):
+        """
+        Initialize backend state
+
+        Args:
+            config: Single-endpoint configuration of the backend
+            weight: Relative share of traffic the backend should receive
+            breaker: Circuit breaker of the backend endpoint
+        """
+        self.config = config
+        self.weight = weight
+        self.breaker = breaker
+        self.ewma_latency = 0.0
+        self.inflight = 0
+        self.requests = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    @property
+    def healthy(self) -> bool:
+        """Whether the backend should receive traffic, open breakers are drained"""
+        return self.breaker.state != CircuitBreaker.OPEN
+
+    def score(self) -> float:
+        """Expected cost of sending a request here, lower is better"""
+        return self.ewma_latency * (self.inflight + 1) / self.weight
+
+    def start(self) -> float:
+        """Mark a request in flight, returns its start time"""
+        with self._lock:
+            self.inflight += 1
+            self.requests += 1
+        return time.monotonic()
+
+    def finish(self, started: float, error: Optional[BaseException], alpha: float, failure_penalty: float) -> None:
+        """Mark a request done and fold its latency into the EWMA, only upstream failures are penalised"""
+        latency = time.monotonic() - started
+        with self._lock:
+            self.inflight -= 1
+            if error is not None and not isinstance(error, Exception):
+                # Cancelled, e.g. a losing hedge, which says nothing about the backend and has no latency to tell
+                return
+            if error is not None and is_upstream_failure(error):
+                self.failures += 1
+                latency += failure_penalty
+            if self.ewma_latency == 0.0:
+                self.ewma_latency = latency
+            else:
+                self.ewma_latency = alpha * latency + (1 - alpha) * self.ewma_latency
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return statistics for monitoring"""
+        return {
+            "base_url": self.config.base_url,
+            "weight": self.weight,
+            "ewma_latency": self.ewma_latency,
+            "inflight": self.inflight,
+            "requests": self.requests,
+            "failures": self.failures,
+            "healthy": self.healthy,
+        }
+
+
+class LoadBalancer:
+    """Weighted power-of-two-choices over EWMA latency and in-flight requests"""
+
+    def __init__(self,
+                 config: LLMConfig,
+                 breakers: Optional[BreakerRegistry] = None,
+                 alpha: float = 0.3,
+                 failure_penalty: float = 1.0):
+        """
+        Initialize load balancer
+
+        Args:
+            config: Configuration, its backends (or its own endpoint) become the candidates
+            breakers: Circuit breaker registry, defaults to the shared registry
+            alpha: EWMA smoothing factor, higher reacts faster
+            failure_penalty: Seconds added to the latency sample of a failed request
+        """
+        breakers = breakers or default_breakers
+        weights = [backend.weight for backend in config.backends] or [1.0]
+        self.backends = [
+            BackendState(backend_config, weight, breakers.get(backend_config.base_url))
+            for backend_config, weight in zip(config.backend_configs(), weights)
+        ]
+        self.alpha = alpha
+        self.failure_penalty = failure_penalty
+
+    def pick(self, exclude: Optional[List[BackendState]] = None) -> BackendState:
+        """
+        Choose the backend for the next request
+
+        Args:
+            exclude: Backends to avoid if any other is available, e.g. those already serving the request
+
+        Returns:
+            Backend state
+        """
+        if len(self.backends) == 1:
+            return self.backends[0]
+
+        candidates = [backend for backend in self.backends if backend.healthy] or self.backends
+        if exclude:
+            candidates = [backend for backend in candidates if backend not in exclude] or candidates
+        if len(candidates) == 1:
+            return candidates[0]
+        weights = [backend.weight for backend in candidates]
+        first, second = random.choices(candidates, weights=weights, k=2)
+        return first if first.score() <= second.score() else second
+
+    def finish(self, backend: BackendState, started: float, error: Optional[BaseException] = None) -> None:
+        """Record the outcome of a request started with backend.start()"""
+        backend.finish(started, error, self.alpha, self.failure_penalty)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Return statistics of every backend"""
+        return [backend.snapshot() for backend in self.backends]
+
+
+class BalancerRegistry:
+    """Load balancers shared by every proxy built from the same configuration"""
+
+    def __init__(self, breakers: Optional[BreakerRegistry] = None, maxsize: int = 1024):
+        """
+        Initialize registry
+
+        Args:
+            breakers: Breaker registry of balancers created without one
+            maxsize: Balancers kept, least recently used first out
+        """
+        self.breakers = breakers
+        self._lock = threading.Lock()
+        self._balancers = TTLCache(maxsize=maxsize, ttl=None)
+
+    def get(self, config: LLMConfig, breakers: Optional[BreakerRegistry] = None) -> LoadBalancer:
+        """Get or create the balancer of a configuration"""
+        # extra_body is applied per request, everything else shapes the backends. The backends carry
+        # the API key, so it is part of the key, but only hashed
+        digest = hashlib.sha256(config.model_dump_json(exclude={"extra_body"}).encode()).hexdigest()
+        # The registry itself rather than its id, which a new registry could reuse once it is collected
+        key = (breakers, digest)
+        balancer = self._balancers.get(key)
+        if balancer is None:
+            with self._lock:
+                balancer = self._balancers.get(key)
+                if balancer is None:
+                    balancer = LoadBalancer(config, breakers or self.breakers)
+                    self._balancers.set(key, balancer)
+        return balancer
+
+
+# Shared so per-request proxies accumulate latency statistics together
+default_balancers = BalancerRegistry()
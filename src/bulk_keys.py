@@ -0,0 +1,270 @@
+"""
+Bulk Keys - Encrypt, decrypt and rotate many configuration keys in parallel
+
+Usage:
+    python -m src.bulk_keys encrypt teams.csv -o keys.jsonl
+    python -m src.bulk_keys rotate tokens.txt --master-key OLD --new-master-key NEW -o rotated.jsonl
+    python -m src.bulk_keys decrypt tokens.jsonl --master-key OLD
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from pydantic import ValidationError
+
+from .key_generator import KeyGenerator
+from .models import LLMConfig
+
+
+OPERATIONS = ("encrypt", "decrypt", "rotate")
+
+# Configuration fields that CSV cells carry as JSON
+JSON_FIELDS = ("headers", "extra_body", "backends")
+INT_FIELDS = ("rpm", "tpm", "max_inflight")
+FLOAT_FIELDS = ("share",)
+
+
+def _detect_format(path: str) -> str:
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return "csv"
+    if extension in (".jsonl", ".ndjson", ".json"):
+        return "jsonl"
+    return "text"
+
+
+def _csv_record(row: Dict[str, str]) -> Dict[str, Any]:
+    """Turn a CSV row into a record, empty cells are dropped and JSON cells decoded"""
+    record = {}
+    for name, value in row.items():
+        if name is None or value is None or value == "":
+            continue
+        if name in JSON_FIELDS:
+            value = json.loads(value)
+        elif name in INT_FIELDS:
+            value = int(value)
+        elif name in FLOAT_FIELDS:
+            value = float(value)
+        record[name] = value
+    return record
+
+
+def read_records(source: TextIO, fmt: str) -> Iterator[Dict[str, Any]]:
+    """
+    Read input records lazily
+
+    Args:
+        source: Open text file
+        fmt: "csv" (header row of configuration fields or a token column), "jsonl" (one object per line)
+            or "text" (one token per line)
+
+    Returns:
+        Iterator of records: configuration fields and/or "token", plus an optional "id" echoed in the output;
+        unreadable lines become records that fail when processed, so line numbers stay aligned
+    """
+    if fmt == "csv":
+        for row in csv.DictReader(source):
+            try:
+                yield _csv_record(row)
+            except ValueError as e:
+                yield {"_invalid": f"Unreadable CSV row: {e}"}
+        return
+    for line in source:
+        line = line.strip()
+        if not line:
+            continue
+        if fmt == "text":
+            yield {"token": line}
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            record = {"_invalid": f"Unreadable JSON line: {e}"}
+        yield record if isinstance(record, dict) else {"_invalid": "JSON line is not an object"}
+
+
+def process_record(operation: str,
+                   record: Dict[str, Any],
+                   master_key: Optional[str] = None,
+                   new_master_key: Optional[str] = None,
+                   version: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Apply one operation to one record
+
+    Args:
+        operation: "encrypt", "decrypt" or "rotate"
+        record: Input record
+        master_key: Master key to encrypt with, or that existing tokens were encrypted with
+        new_master_key: Master key of rotated tokens, defaults to master_key
+        version: Token format for encrypt, defaults to KeyGenerator.TOKEN_VERSION
+
+    Returns:
+        {"token": ...} or {"config": ...}, with the record's "id" if it had one
+    """
+    if "_invalid" in record:
+        raise ValueError(record["_invalid"])
+    result = {"id": record["id"]} if "id" in record else {}
+    if operation == "encrypt":
+        config = LLMConfig(**{name: value for name, value in record.items() if name != "id"})
+        result["token"] = KeyGenerator.encrypt_config(config, version=version, master_key=master_key)
+    elif operation == "decrypt":
+        config = KeyGenerator.decrypt_config(record["token"], use_cache=False, master_key=master_key)
+        result["config"] = config.model_dump()
+    elif operation == "rotate":
+        result["token"] = KeyGenerator.migrate_config(record["token"], master_key, new_master_key)
+    else:
+        raise ValueError(f"Unknown operation: {operation}")
+    return result
+
+
+def _describe(error: Exception) -> str:
+    """Error message that never echoes the input, it may hold an API key"""
+    if isinstance(error, ValidationError):
+        return "; ".join(f"{'.'.join(map(str, e['loc'])) or 'record'}: {e['msg']}" for e in error.errors())
+    return f"{type(error).__name__}: {error}" if str(error) else type(error).__name__
+
+
+def _process_chunk(operation: str,
+                   chunk: List[Tuple[int, Dict[str, Any]]],
+                   master_key: Optional[str],
+                   new_master_key: Optional[str],
+                   version: Optional[int]) -> List[Dict[str, Any]]:
+    """Worker entry point, failures are reported per record instead of failing the chunk"""
+    results = []
+    for line, record in chunk:
+        try:
+            result = process_record(operation, record, master_key, new_master_key, version)
+        except Exception as e:
+            result = {"id": record["id"]} if "id" in record else {}
+            result["error"] = _describe(e)
+        result["line"] = line
+        results.append(result)
+    return results
+
+
+def _chunks(records: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Tuple[int, Dict[str, Any]]]]:
+    chunk = []
+    for line, record in enumerate(records, 1):
+        chunk.append((line, record))
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def bulk_process(records: Iterable[Dict[str, Any]],
+                 operation: str,
+                 master_key: Optional[str] = None,
+                 new_master_key: Optional[str] = None,
+                 version: Optional[int] = None,
+                 workers: Optional[int] = None,
+                 chunksize: int = 256,
+                 progress: Optional[Callable[[int, int], None]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Process records across a process pool, yielding results in input order as they complete
+
+    Each worker stretches the master keys once and reuses them for every record, so the
+    cost per key is one HKDF and one Fernet operation for v2 tokens. Only a bounded number
+    of chunks is in flight, so arbitrarily large inputs are streamed.
+
+    Args:
+        records: Input records, see read_records
+        operation: "encrypt", "decrypt" or "rotate"
+        master_key: Master key to encrypt with, or that existing tokens were encrypted with
+        new_master_key: Master key of rotated tokens, defaults to master_key
+        version: Token format for encrypt
+        workers: Worker processes, defaults to the CPU count; 1 processes in the calling process
+        chunksize: Records sent to a worker at a time
+        progress: Called with (processed, failed) after every chunk
+
+    Returns:
+        Iterator of result records, each with its 1-based input "line"
+    """
+    if operation not in OPERATIONS:
+        raise ValueError(f"Unknown operation: {operation}")
+    workers = workers or os.cpu_count() or 1
+    # Resolve defaults here, workers started with spawn would not see a key set at runtime
+    master_key = master_key or KeyGenerator.MASTER_KEY
+    processed = failed = 0
+
+    def report(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        nonlocal processed, failed
+        processed += len(results)
+        failed += sum(1 for result in results if "error" in result)
+        if progress is not None:
+            progress(processed, failed)
+        return results
+
+    chunks = _chunks(records, chunksize)
+    if workers == 1:
+        for chunk in chunks:
+            yield from report(_process_chunk(operation, chunk, master_key, new_master_key, version))
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(_process_chunk, operation, chunk, master_key, new_master_key, version))
+            # Keep every worker busy without reading the whole input ahead
+            if len(pending) >= workers * 2:
+                yield from report(pending.popleft().result())
+        while pending:
+            yield from report(pending.popleft().result())
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the bulk tool from the command line, returns the exit status"""
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description='Encrypt, decrypt or rotate configuration keys in bulk')
+    parser.add_argument('operation', choices=OPERATIONS, help='Operation applied to every record')
+    parser.add_argument('input', help='CSV, JSONL or text file (one token per line), "-" for stdin')
+    parser.add_argument('--format', choices=('csv', 'jsonl', 'text'), help='Input format (default: from extension)')
+    parser.add_argument('-o', '--output', help='JSONL output file (default: stdout)')
+    parser.add_argument('--master-key', default=os.environ.get("LLM_PROXY_MASTER_KEY"),
+                        help='Master key to encrypt with or that tokens were encrypted with (default: LLM_PROXY_MASTER_KEY)')
+    parser.add_argument('--new-master-key', default=os.environ.get("LLM_PROXY_NEW_MASTER_KEY"),
+                        help='Master key for rotated tokens (default: LLM_PROXY_NEW_MASTER_KEY, else --master-key)')
+    parser.add_argument('--version', type=int, choices=(1, 2), help='Token format for encrypt')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: CPU count)')
+    parser.add_argument('--chunksize', type=int, default=256, help='Records per worker task')
+    parser.add_argument('--quiet', action='store_true', help='Do not report progress on stderr')
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ("text" if args.input == "-" else _detect_format(args.input))
+    source = sys.stdin if args.input == "-" else open(args.input, newline="" if fmt == "csv" else None)
+    output = open(args.output, "w") if args.output else sys.stdout
+    started = time.perf_counter()
+
+    def progress(processed: int, failed: int) -> None:
+        if not args.quiet:
+            rate = processed / max(time.perf_counter() - started, 1e-9)
+            print(f"\r{processed} processed, {failed} failed, {rate:.0f}/s", end="", file=sys.stderr, flush=True)
+
+    failures = 0
+    try:
+        for result in bulk_process(read_records(source, fmt), args.operation, args.master_key,
+                                   args.new_master_key, args.version, args.workers, args.chunksize, progress):
+            failures += "error" in result
+            output.write(json.dumps(result) + "\n")
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+        if not args.quiet:
+            print(file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,271 @@
+"""
+Cache utilities - Bounded, thread-safe LRU caches with TTL expiry, in memory or in SQLite
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe, size-bounded LRU cache whose entries expire after a TTL"""
+
+    def __init__(self,
+                 maxsize: int = 1024,
+                 ttl: Optional[float] = 300.0,
+                 timer: Callable[[], float] = time.monotonic):
+        """
+        Initialize cache
+
+        Args:
+            maxsize: Maximum number of entries kept, least recently used entries are evicted first
+            ttl: Seconds an entry stays valid, None keeps entries until evicted
+            timer: Monotonic clock used for expiry, replaceable in tests
+        """
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._timer = timer
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return cached value for key, or default if missing or expired"""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= self._timer():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Store value under key, evicting the least recently used entry if full"""
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = self._timer() + ttl if ttl is not None else None
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+            self._data[key] = (value, expires_at)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> bool:
+        """Remove key from the cache, returns whether it was present"""
+        with self._lock:
+            return self._data.pop(key, _MISSING) is not _MISSING
+
+    def clear(self) -> None:
+        """Remove all entries, counters are kept"""
+        with self._lock:
+            self._data.clear()
+
+    def items(self) -> List[Tuple[Hashable, Any]]:
+        """Return unexpired entries, least recently used first, without counting as lookups"""
+        now = self._timer()
+        with self._lock:
+            return [(key, value) for key, (value, expires_at) in self._data.items()
+                    if expires_at is None or expires_at > now]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return a snapshot of size and hit/miss counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return False
+            expires_at = entry[1]
+            return expires_at is None or expires_at > self._timer()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+
+class SQLiteCache:
+    """
+    Persistent key/value tier with TTL expiry and a cap on stored entries
+
+    The database runs in WAL mode, so several processes can open the same file and share its entries:
+    one worker's writes are read by the others without blocking them. Each process opens its own
+    connection, a cache created before a fork reconnects in the child on first use.
+    """
+
+    # Inserts between size checks, keeps the cap cheap to enforce
+    PRUNE_INTERVAL = 64
+    # Seconds a read entry's access time may lag, reads within it of the last recorded access write nothing
+    TOUCH_INTERVAL = 60.0
+    # Access times buffered in memory before they are written in one batch
+    TOUCH_BATCH = 64
+
+    def __init__(self,
+                 path: str,
+                 ttl: Optional[float] = 86400.0,
+                 max_entries: int = 100000,
+                 table: str = "responses"):
+        """
+        Initialize SQLite tier
+
+        Args:
+            path: Database file, created if missing
+            ttl: Seconds an entry stays valid, None keeps entries until pruned
+            max_entries: Maximum number of stored entries, least recently used entries are pruned first
+            table: Table holding the entries, caches sharing a file keep apart by using different tables
+        """
+        if not table.isidentifier():
+            raise ValueError(f"Invalid table name: {table}")
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.table = table
+        self._inserts = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._connect()
+
+    def _connect(self) -> None:
+        """Open this process's connection and create the table if missing"""
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._touched: Dict[str, float] = {}
+        # Writers from other processes hold the file briefly, wait for them rather than failing
+        self._conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_accessed ON {self.table} (accessed_at)")
+
+    def _connection(self) -> sqlite3.Connection:
+        """Connection of the calling process, a connection inherited across fork is never used"""
+        if self._pid != os.getpid():
+            self._connect()
+        return self._conn
+
+    def get(self, key: str) -> Optional[str]:
+        """Return stored value, or None if missing or expired"""
+        now = time.time()
+        conn = self._connection()
+        with self._lock:
+            row = conn.execute(
+                f"SELECT value, expires_at, accessed_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at, accessed_at = row
+            if expires_at is not None and expires_at <= now:
+                conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                return None
+            # Reads stay read-only, access times only order pruning and are written in batches
+            if now - accessed_at >= self.TOUCH_INTERVAL:
+                self._touched[key] = now
+                if len(self._touched) >= self.TOUCH_BATCH:
+                    self._flush(conn)
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        """Store value under key"""
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl is not None else None
+        conn = self._connection()
+        with self._lock:
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, expires_at, now),
+            )
+            self._inserts += 1
+            if self._inserts % self.PRUNE_INTERVAL == 0:
+                self._prune(conn, now)
+
+    def invalidate(self, key: str) -> bool:
+        """Remove key, returns whether it was present"""
+        conn = self._connection()
+        with self._lock:
+            return conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,)).rowcount > 0
+
+    def prune(self) -> None:
+        """Remove expired entries and enforce the size cap"""
+        conn = self._connection()
+        with self._lock:
+            self._prune(conn, time.time())
+
+    def _flush(self, conn: sqlite3.Connection) -> None:
+        """Write buffered access times, never moving an entry's access time backwards"""
+        if not self._touched:
+            return
+        touched, self._touched = self._touched, {}
+        # One transaction for the whole batch, the connection autocommits every statement otherwise
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                f"UPDATE {self.table} SET accessed_at = MAX(accessed_at, ?) WHERE key = ?",
+                [(accessed_at, key) for key, accessed_at in touched.items()],
+            )
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _prune(self, conn: sqlite3.Connection, now: float) -> None:
+        self._flush(conn)
+        conn.execute(f"DELETE FROM {self.table} WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+        count = conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        if count > self.max_entries:
+            conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN "
+                f"(SELECT key FROM {self.table} ORDER BY accessed_at LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def clear(self) -> None:
+        """Remove all entries"""
+        conn = self._connection()
+        with self._lock:
+            self._touched.clear()
+            conn.execute(f"DELETE FROM {self.table}")
+
+    def __len__(self) -> int:
+        conn = self._connection()
+        with self._lock:
+            return conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def close(self) -> None:
+        """Write buffered access times and close the database connection"""
+        with self._lock:
+            if self._pid == os.getpid():
+                self._flush(self._conn)
+            self._conn.close()
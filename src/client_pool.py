@@ -0,0 +1,278 @@
+"""
+Client Pool - Process-wide registry of LLM clients sharing keep-alive HTTP connections
+"""
+
+import asyncio
+import atexit
+import hashlib
+import os
+import threading
+import weakref
+from typing import TYPE_CHECKING, Any, Dict, Optional, Set, Tuple
+
+import httpx
+
+from . import metrics
+from .cache import TTLCache
+from .models import LLMConfig
+
+if TYPE_CHECKING:
+    # The SDK takes most of a second to import, it is loaded when the first SDK client is built
+    from openai import AsyncOpenAI, OpenAI
+
+
+class ClientPool:
+    """Registry of provider clients keyed by provider, base URL and a digest of the API key"""
+
+    def __init__(self,
+                 max_connections: int = 100,
+                 max_keepalive_connections: int = 20,
+                 keepalive_expiry: float = 30.0,
+                 timeout: float = 600.0,
+                 connect_timeout: float = 10.0,
+                 transport: Optional[Any] = None,
+                 max_clients: int = 1024):
+        """
+        Initialize client pool
+
+        Args:
+            max_connections: Maximum concurrent connections across all upstreams
+            max_keepalive_connections: Maximum idle connections kept open for reuse
+            keepalive_expiry: Seconds an idle connection is kept open
+            timeout: Default read/write timeout in seconds
+            connect_timeout: Timeout for establishing a connection in seconds
+            transport: Optional httpx transport, e.g. httpx.MockTransport in tests
+            max_clients: Provider clients kept per event loop (and for sync calls), least recently used
+                first out. They hold no connections of their own, the shared HTTP client does
+        """
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.transport = transport
+        self.max_clients = max_clients
+        self._lock = threading.Lock()
+        self._http_client: Optional[httpx.Client] = None
+        self._clients = TTLCache(maxsize=max_clients, ttl=None)
+        # Async connections belong to the event loop that opened them, so async state is per loop
+        self._async_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+            weakref.WeakKeyDictionary())
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, TTLCache]" = (
+            weakref.WeakKeyDictionary())
+        # Closes scheduled on other event loops, referenced until they are done
+        self._closing: Set["asyncio.Future[None]"] = set()
+
+    @property
+    def limits(self) -> httpx.Limits:
+        """Connection pool limits applied to new HTTP clients"""
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    @property
+    def timeouts(self) -> httpx.Timeout:
+        """Timeouts applied to new HTTP clients"""
+        return httpx.Timeout(self.timeout, connect=self.connect_timeout)
+
+    def configure(self, **settings: Any) -> None:
+        """
+        Change pool settings, existing clients are closed so new ones pick them up
+
+        Args:
+            settings: Any of the constructor arguments
+        """
+        for name, value in settings.items():
+            if name not in ("max_connections", "max_keepalive_connections", "keepalive_expiry",
+                            "timeout", "connect_timeout"):
+                raise ValueError(f"Unknown pool setting: {name}")
+            setattr(self, name, value)
+        self.close()
+
+    @staticmethod
+    def _key(config: LLMConfig) -> Tuple[str, str, str]:
+        # Hashed, the registry outlives the requests and should not hold every API key it has seen
+        return (config.provider, config.base_url, hashlib.sha256(config.api_key.encode()).hexdigest())
+
+    def _shared_http_client(self) -> httpx.Client:
+        """HTTP client whose connection pool is shared by every provider client"""
+        if self._http_client is None or self._http_client.is_closed:
+            self._http_client = httpx.Client(
+                limits=self.limits,
+                timeout=self.timeouts,
+                transport=self.transport,
+                # Feed connection and time-to-first-byte timings of instrumented requests
+                event_hooks={"request": [metrics.on_request], "response": [metrics.on_response]},
+            )
+        return self._http_client
+
+    def _shared_async_http_client(self, loop: asyncio.AbstractEventLoop) -> httpx.AsyncClient:
+        """Async HTTP client shared by every provider client on one event loop"""
+        http_client = self._async_http_clients.get(loop)
+        if http_client is None or http_client.is_closed:
+            http_client = httpx.AsyncClient(
+                limits=self.limits,
+                timeout=self.timeouts,
+                transport=self.transport,
+                event_hooks={"request": [metrics.aon_request], "response": [metrics.aon_response]},
+            )
+            self._async_http_clients[loop] = http_client
+        return http_client
+
+    def get_http_client(self) -> httpx.Client:
+        """
+        Get the pooled HTTP client, for raw upstream requests
+
+        Returns:
+            HTTP client shared with the provider clients
+        """
+        with self._lock:
+            return self._shared_http_client()
+
+    def get_async_http_client(self) -> httpx.AsyncClient:
+        """
+        Get the pooled async HTTP client of the running event loop, for raw upstream requests
+
+        Returns:
+            Async HTTP client shared with the async provider clients
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            return self._shared_async_http_client(loop)
+
+    def get_client(self, config: LLMConfig) -> "OpenAI":
+        """
+        Get the shared OpenAI-compatible client for a configuration
+
+        Args:
+            config: Decrypted LLM configuration
+
+        Returns:
+            Client reusing pooled connections
+        """
+        key = self._key(config)
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                from openai import OpenAI
+                client = OpenAI(
+                    base_url=config.base_url,
+                    api_key=config.api_key,
+                    timeout=self.timeouts,
+                    # Retries are handled by the proxy's RetryPolicy
+                    max_retries=0,
+                    http_client=self._shared_http_client(),
+                )
+                self._clients.set(key, client)
+            return client
+
+    def get_async_client(self, config: LLMConfig) -> "AsyncOpenAI":
+        """
+        Get the shared async OpenAI-compatible client for a configuration on the running event loop
+
+        Args:
+            config: Decrypted LLM configuration
+
+        Returns:
+            Async client reusing pooled connections
+        """
+        loop = asyncio.get_running_loop()
+        key = self._key(config)
+        clients = self._async_clients.get(loop)
+        client = clients.get(key) if clients is not None else None
+        if client is not None:
+            return client
+
+        with self._lock:
+            clients = self._async_clients.get(loop)
+            if clients is None:
+                clients = self._async_clients[loop] = TTLCache(maxsize=self.max_clients, ttl=None)
+            client = clients.get(key)
+            if client is None:
+                from openai import AsyncOpenAI
+                client = AsyncOpenAI(
+                    base_url=config.base_url,
+                    api_key=config.api_key,
+                    timeout=self.timeouts,
+                    max_retries=0,
+                    http_client=self._shared_async_http_client(loop),
+                )
+                clients.set(key, client)
+            return client
+
+    def stats(self) -> Dict[str, Any]:
+        """Return number of registered clients and pool settings"""
+        return {
+            "clients": len(self._clients),
+            "async_clients": sum(len(clients) for clients in list(self._async_clients.values())),
+            "max_connections": self.max_connections,
+            "max_keepalive_connections": self.max_keepalive_connections,
+            "keepalive_expiry": self.keepalive_expiry,
+            "timeout": self.timeout,
+            "connect_timeout": self.connect_timeout,
+        }
+
+    def close(self) -> None:
+        """Close all pooled connections and forget registered clients"""
+        with self._lock:
+            self._clients.clear()
+            if self._http_client is not None:
+                self._http_client.close()
+                self._http_client = None
+            async_http_clients = list(self._async_http_clients.items())
+            self._async_clients.clear()
+            self._async_http_clients.clear()
+        # Async connections can only be closed on their own loop, the close is scheduled there
+        for loop, http_client in async_http_clients:
+            self._schedule_aclose(loop, http_client)
+
+    def _schedule_aclose(self, loop: asyncio.AbstractEventLoop, http_client: httpx.AsyncClient) -> None:
+        """Close an async HTTP client on its event loop once the loop next runs"""
+        if http_client.is_closed or loop.is_closed():
+            # A closed loop has taken its connections' transports down with it
+            return
+
+        def start() -> None:
+            task = loop.create_task(http_client.aclose())
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            start()
+        else:
+            try:
+                loop.call_soon_threadsafe(start)
+            except RuntimeError:
+                # Closed in the meantime
+                pass
+
+    async def aclose(self) -> None:
+        """Close the async connections opened on the running event loop"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._async_clients.pop(loop, None)
+            http_client = self._async_http_clients.pop(loop, None)
+        if http_client is not None:
+            await http_client.aclose()
+
+
+# Pool shared by every LLMProxy that does not bring its own
+default_pool = ClientPool(
+    max_connections=int(os.environ.get("LLM_PROXY_POOL_MAX_CONNECTIONS", "100")),
+    max_keepalive_connections=int(os.environ.get("LLM_PROXY_POOL_MAX_KEEPALIVE", "20")),
+    keepalive_expiry=float(os.environ.get("LLM_PROXY_POOL_KEEPALIVE_EXPIRY", "30")),
+    timeout=float(os.environ.get("LLM_PROXY_TIMEOUT", "600")),
+    connect_timeout=float(os.environ.get("LLM_PROXY_CONNECT_TIMEOUT", "10")),
+)
+
+atexit.register(default_pool.close)
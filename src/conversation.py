@@ -0,0 +1,174 @@
+"""
+Conversation - Multi-turn chat history windowed to a model's token budget
+"""
+
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from .tokens import DEFAULT_COMPLETION_TOKENS, context_window, estimate_message_tokens
+
+
+# Summarizer signature: (previous summary or None, messages dropped from the window) -> new summary
+Summarizer = Callable[[Optional[str], List[Dict[str, Any]]], str]
+
+
+class Conversation:
+    """
+    Chat history that always yields a messages list fitting the prompt budget
+
+    Token counts are computed once per message when it is added and kept next to it, along with
+    a running total, so adding a turn and trimming the window cost the same however long the
+    conversation has been going. The oldest turns are dropped first (system prompts are kept);
+    with a summarizer they are folded into a running summary sent after the system prompts.
+    """
+
+    SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+    def __init__(self,
+                 model: Optional[str] = None,
+                 system_prompt: Optional[str] = None,
+                 max_prompt_tokens: Optional[int] = None,
+                 reserve_tokens: int = DEFAULT_COMPLETION_TOKENS,
+                 summarizer: Optional[Summarizer] = None):
+        """
+        Initialize conversation
+
+        Args:
+            model: Model name, used to look up its context window when max_prompt_tokens is not set
+            system_prompt: System message sent with every request
+            max_prompt_tokens: Budget for the messages list, defaults to the model's context window
+                minus reserve_tokens
+            reserve_tokens: Tokens left free for the completion
+            summarizer: Called with the current summary and the dropped messages, returns the new summary
+        """
+        if max_prompt_tokens is None:
+            if model is None:
+                raise ValueError("Either model or max_prompt_tokens is required")
+            max_prompt_tokens = context_window(model) - reserve_tokens
+        if max_prompt_tokens <= 0:
+            raise ValueError("max_prompt_tokens must be positive")
+        self.max_prompt_tokens = max_prompt_tokens
+        self.summarizer = summarizer
+        self._system: List[Tuple[Dict[str, Any], int]] = []
+        self._turns: Deque[Tuple[Dict[str, Any], int]] = deque()
+        self._summary: Optional[Tuple[Dict[str, Any], int]] = None
+        self._system_tokens = 0
+        self._turn_tokens = 0
+        self.dropped = 0
+        if system_prompt:
+            self.add_system(system_prompt)
+
+    @property
+    def tokens(self) -> int:
+        """Estimated prompt tokens of the current messages list"""
+        summary_tokens = self._summary[1] if self._summary else 0
+        return self._system_tokens + summary_tokens + self._turn_tokens
+
+    @property
+    def summary(self) -> Optional[str]:
+        """Running summary of the dropped turns, if a summarizer is set"""
+        return self._summary[0]["content"][len(self.SUMMARY_PREFIX):] if self._summary else None
+
+    def add_system(self, content: str) -> None:
+        """Add a system message, system messages are never dropped"""
+        message = {"role": "system", "content": content}
+        tokens = estimate_message_tokens(message)
+        self._system.append((message, tokens))
+        self._system_tokens += tokens
+        self._trim()
+
+    def add(self, message: Dict[str, Any]) -> None:
+        """
+        Add a message and trim the window to the budget
+
+        Args:
+            message: Chat message, as sent to LLMProxy.chat
+        """
+        tokens = estimate_message_tokens(message)
+        self._turns.append((message, tokens))
+        self._turn_tokens += tokens
+        self._trim()
+
+    def add_user(self, content: str) -> None:
+        """Add a user message"""
+        self.add({"role": "user", "content": content})
+
+    def add_assistant(self, content: str) -> None:
+        """Add an assistant message"""
+        self.add({"role": "assistant", "content": content})
+
+    def pop(self) -> Optional[Dict[str, Any]]:
+        """Remove and return the newest message, e.g. a user message whose request failed"""
+        if not self._turns:
+            return None
+        message, tokens = self._turns.pop()
+        self._turn_tokens -= tokens
+        return message
+
+    def messages(self) -> List[Dict[str, Any]]:
+        """Return the messages list to send, within max_prompt_tokens"""
+        messages = [message for message, _ in self._system]
+        if self._summary:
+            messages.append(self._summary[0])
+        messages.extend(message for message, _ in self._turns)
+        return messages
+
+    def clear(self) -> None:
+        """Drop every turn and the summary, system messages are kept"""
+        self._turns.clear()
+        self._turn_tokens = 0
+        self._summary = None
+
+    def _set_summary(self, summary: str) -> None:
+        message = {"role": "system", "content": self.SUMMARY_PREFIX + summary}
+        self._summary = (message, estimate_message_tokens(message))
+
+    def _trim(self) -> None:
+        """Drop the oldest turns until the window fits, the newest message is always kept"""
+        if self.tokens <= self.max_prompt_tokens:
+            return
+        dropped = []
+        while len(self._turns) > 1 and self.tokens > self.max_prompt_tokens:
+            message, tokens = self._turns.popleft()
+            self._turn_tokens -= tokens
+            dropped.append(message)
+            # Start the window at a user message so no reply is left without its question
+            while len(self._turns) > 1 and self._turns[0][0].get("role") != "user":
+                message, tokens = self._turns.popleft()
+                self._turn_tokens -= tokens
+                dropped.append(message)
+        self.dropped += len(dropped)
+
+        if self.summarizer is not None and dropped:
+            self._set_summary(self.summarizer(self.summary, dropped))
+            # A summary longer than the room left is cut from the front, the latest part matters most
+            room = self.max_prompt_tokens - self._system_tokens - self._turn_tokens
+            while self._summary[1] > max(room, 0) and self.summary:
+                summary = self.summary
+                self._set_summary(summary[max(1, len(summary) // 4):])
+            if not self.summary:
+                self._summary = None
+
+
+def proxy_summarizer(proxy: Any, max_tokens: int = 256) -> Summarizer:
+    """
+    Summarizer that asks the model behind a proxy to condense the dropped turns
+
+    Args:
+        proxy: LLMProxy used for summarizing
+        max_tokens: Length limit of the summary
+
+    Returns:
+        Summarizer for Conversation
+    """
+    def summarize(summary: Optional[str], dropped: List[Dict[str, Any]]) -> str:
+        transcript = "\n".join(f"{message['role']}: {message.get('content') or ''}" for message in dropped)
+        if summary:
+            transcript = f"Earlier summary: {summary}\n{transcript}"
+        return proxy.chat([
+            {"role": "system", "content": "Summarize the conversation below in a few sentences, "
+                                          "keeping names, facts and decisions the assistant may need later."},
+            {"role": "user", "content": transcript},
+        ], max_tokens=max_tokens, temperature=0)
+
+    return summarize
@@ -0,0 +1,190 @@
+"""
+Deadlines - Per-call time budgets and cooperative cancellation
+"""
+
+import asyncio
+import socket
+import threading
+import time
+from typing import Any, Callable, List, Optional, Union
+
+import httpx
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a call runs out of the time its caller gave it"""
+
+    def __init__(self, timeout: Optional[float] = None):
+        super().__init__("Deadline exceeded" if timeout is None else f"Deadline of {timeout:g}s exceeded")
+        self.timeout = timeout
+
+
+class RequestCancelled(Exception):
+    """Raised in a call whose CancelToken was cancelled"""
+
+    def __init__(self):
+        super().__init__("Request cancelled")
+
+
+class Deadline:
+    """Point on the monotonic clock a call must finish by, shared by its attempts and retries"""
+
+    __slots__ = ("timeout", "at")
+
+    def __init__(self, timeout: float):
+        """
+        Initialize deadline
+
+        Args:
+            timeout: Seconds from now the call may take
+        """
+        self.timeout = timeout
+        self.at = time.monotonic() + timeout
+
+    @classmethod
+    def of(cls, timeout: Union[None, float, "Deadline"]) -> Optional["Deadline"]:
+        """Deadline for a timeout in seconds, an existing deadline is passed through"""
+        if timeout is None or isinstance(timeout, Deadline):
+            return timeout
+        return cls(timeout)
+
+    def remaining(self) -> float:
+        """Seconds left, 0 once the deadline has passed"""
+        return max(0.0, self.at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.at
+
+    def check(self) -> None:
+        """Raise DeadlineExceeded once the deadline has passed"""
+        if self.expired:
+            raise DeadlineExceeded(self.timeout)
+
+    def cap(self, seconds: float) -> float:
+        """A wait of at most seconds that ends by the deadline"""
+        return min(seconds, self.remaining())
+
+    def http_timeout(self, base: Optional[httpx.Timeout] = None) -> httpx.Timeout:
+        """
+        Connect, read, write and pool timeouts ending by the deadline
+
+        Args:
+            base: Client timeouts, each phase keeps its own limit when that is shorter
+
+        Returns:
+            Timeouts for one upstream attempt
+        """
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(self.timeout)
+        if base is None:
+            return httpx.Timeout(remaining)
+        return httpx.Timeout(
+            connect=_shorter(base.connect, remaining),
+            read=_shorter(base.read, remaining),
+            write=_shorter(base.write, remaining),
+            pool=_shorter(base.pool, remaining),
+        )
+
+
+def _shorter(limit: Optional[float], remaining: float) -> float:
+    return remaining if limit is None else min(limit, remaining)
+
+
+class CancelToken:
+    """
+    Cancels calls from another thread
+
+    Calls check the token before each attempt, between streamed chunks and while backing off,
+    and a blocking stream read is aborted at once. A blocking call that has not received its
+    response headers yet finishes its current attempt first, bound by its deadline if it has
+    one. Async callers can simply cancel their task instead.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], Any]] = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self) -> None:
+        """Cancel every call holding this token"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def check(self) -> None:
+        """Raise RequestCancelled once the token is cancelled"""
+        if self._event.is_set():
+            raise RequestCancelled()
+
+    def wait(self, timeout: float) -> bool:
+        """Sleep for timeout seconds or until cancelled, whichever comes first"""
+        return self._event.wait(timeout)
+
+    async def asleep(self, timeout: float) -> bool:
+        """Async variant of wait(), the token can still be cancelled from any thread"""
+        loop = asyncio.get_running_loop()
+        woken = loop.create_future()
+        forget = self.on_cancel(lambda: loop.is_closed() or loop.call_soon_threadsafe(_wake, woken))
+        try:
+            await asyncio.wait({woken}, timeout=timeout)
+        finally:
+            forget()
+            woken.cancel()
+        return self.cancelled
+
+    def on_cancel(self, callback: Callable[[], Any]) -> Callable[[], None]:
+        """
+        Run a callback when the token is cancelled, at once if it already is
+
+        Args:
+            callback: Function run in the cancelling thread
+
+        Returns:
+            Function unregistering the callback
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._remove(callback)
+        callback()
+        return lambda: None
+
+    def _remove(self, callback: Callable[[], Any]) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+
+def _wake(future: "asyncio.Future[None]") -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+def abort_response(response: Optional[httpx.Response]) -> None:
+    """
+    Abort a response being read in another thread
+
+    Closing a response does not wake a thread blocked reading it, shutting its socket down does.
+    The reader then fails with a transport error and closes the response itself.
+
+    Args:
+        response: Streamed response, None is ignored
+    """
+    stream = response.extensions.get("network_stream") if response is not None else None
+    sock = stream.get_extra_info("socket") if stream is not None else None
+    if sock is None:
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
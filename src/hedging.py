@@ -0,0 +1,290 @@
+"""
+Hedging - Race a duplicate request against a straggler once it is slower than usual
+"""
+
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple, TypeVar
+
+
+T = TypeVar("T")
+
+# Threads running blocking calls that hold a hedge, each holds up to two
+HEDGE_THREADS = int(os.environ.get("LLM_PROXY_HEDGE_THREADS", "64"))
+
+
+class HedgePolicy:
+    """
+    When to send a hedge, and how many hedges the process can afford
+
+    The hedge delay is a quantile (p95 by default) of recent call latencies per model, so
+    only the slowest few percent of calls are duplicated. A budget credited with max_extra
+    of a hedge per call caps hedges at that fraction of all requests, with a small burst.
+    """
+
+    # Observations between recomputations of the quantile
+    REFRESH_EVERY = 20
+
+    def __init__(self,
+                 quantile: float = 0.95,
+                 delay: Optional[float] = None,
+                 min_delay: float = 0.05,
+                 max_extra: float = 0.05,
+                 burst: float = 10.0,
+                 window: int = 1000,
+                 min_samples: int = 20,
+                 alternate: bool = True):
+        """
+        Initialize hedge policy
+
+        Args:
+            quantile: Latency quantile after which a call is hedged
+            delay: Fixed hedge delay in seconds instead of the quantile
+            min_delay: Lower bound of the hedge delay
+            max_extra: Hedges allowed per request, e.g. 0.05 for at most 5% extra requests
+            burst: Hedges that can be sent in a row once budget has built up
+            window: Recent latencies kept per model
+            min_samples: Latencies needed before a model is hedged on the quantile
+            alternate: Send the hedge to another backend of the configuration when there is one
+        """
+        if not 0 < quantile < 1:
+            raise ValueError("quantile must be between 0 and 1")
+        self.quantile = quantile
+        self.fixed_delay = delay
+        self.min_delay = min_delay
+        self.max_extra = max_extra
+        self.burst = burst
+        self.window = window
+        self.min_samples = min_samples
+        self.alternate = alternate
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._observed: Dict[str, int] = {}
+        self._delays: Dict[str, Tuple[int, float]] = {}
+        self._credit = 0.0
+        self.requests = 0
+        self.hedges = 0
+        self.wins = 0
+        self.denied = 0
+
+    def observe(self, key: str, latency: float) -> None:
+        """Record the latency of a completed call"""
+        with self._lock:
+            latencies = self._latencies.get(key)
+            if latencies is None:
+                latencies = self._latencies[key] = deque(maxlen=self.window)
+            latencies.append(latency)
+            self._observed[key] = self._observed.get(key, 0) + 1
+
+    def delay(self, key: str) -> Optional[float]:
+        """Seconds to wait before hedging a call, None while too few latencies are known"""
+        if self.fixed_delay is not None:
+            return self.fixed_delay
+        with self._lock:
+            latencies = self._latencies.get(key)
+            if latencies is None or len(latencies) < self.min_samples:
+                return None
+            observed = self._observed[key]
+            cached = self._delays.get(key)
+            # Sorting the window on every call would cost more than it is worth, refresh every few calls
+            if cached is None or observed - cached[0] >= self.REFRESH_EVERY:
+                ordered = sorted(latencies)
+                index = min(len(ordered) - 1, int(self.quantile * len(ordered)))
+                cached = self._delays[key] = (observed, ordered[index])
+            return max(self.min_delay, cached[1])
+
+    def start(self) -> None:
+        """Count a request and credit the hedge budget"""
+        with self._lock:
+            self.requests += 1
+            self._credit = min(self.burst, self._credit + self.max_extra)
+
+    def try_hedge(self) -> bool:
+        """Take one hedge from the budget, False when it is spent"""
+        if not self.reserve():
+            self._count("denied")
+            return False
+        self._count("hedges")
+        return True
+
+    def reserve(self) -> bool:
+        """Set one hedge aside from the budget before a call starts, False when it is spent"""
+        with self._lock:
+            if self._credit < 1:
+                return False
+            self._credit -= 1
+            return True
+
+    def release(self) -> None:
+        """Return a reserved hedge the call finished without"""
+        with self._lock:
+            self._credit = min(self.burst, self._credit + 1)
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def won(self) -> None:
+        """Count a hedge that finished before the original request"""
+        with self._lock:
+            self.wins += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hedge counters"""
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "hedges": self.hedges,
+                "wins": self.wins,
+                "denied": self.denied,
+                "hedge_rate": self.hedges / self.requests if self.requests else 0.0,
+                "win_rate": self.wins / self.hedges if self.hedges else 0.0,
+            }
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=HEDGE_THREADS, thread_name_prefix="llm-proxy-hedge")
+    return _executor
+
+
+def hedged_call(policy: HedgePolicy, key: str, call: Callable[[bool], T],
+                on_hedge: Optional[Callable[[bool], None]] = None) -> T:
+    """
+    Run a blocking call, racing a hedge against it once it takes longer than the hedge delay
+
+    Blocking HTTP requests cannot be interrupted from another thread, so the losing call is
+    abandoned: its result is discarded and its connection returns to the pool when it ends.
+    Calls run in the caller's thread unless a hedge can be afforded, only those that hold one
+    from the budget run on the hedge threads, so the pool does not bound the calls in flight.
+
+    Args:
+        policy: Hedge policy
+        key: Latency key of the call, e.g. provider and model
+        call: Function performing the call, given True for the hedge
+        on_hedge: Called with whether the hedge won, once a hedged call has a winner
+
+    Returns:
+        Result of the first call to succeed
+    """
+    policy.start()
+    delay = policy.delay(key)
+    started = time.perf_counter()
+    if delay is None or not policy.reserve():
+        try:
+            result = call(False)
+        finally:
+            if delay is not None and time.perf_counter() - started > delay:
+                # Slow enough to hedge, but the budget was spent
+                policy._count("denied")
+        policy.observe(key, time.perf_counter() - started)
+        return result
+
+    executor = _get_executor()
+    running = threading.Event()
+    context = contextvars.copy_context()
+
+    def run_primary() -> T:
+        running.set()
+        # Calls keep the caller's context variables, e.g. the metrics record
+        return context.run(call, False)
+
+    primary = executor.submit(run_primary)
+    # The delay counts from when the call is sent, not from when it was queued for a thread
+    running.wait()
+    started = time.perf_counter()
+    done, _ = wait([primary], timeout=delay)
+    if done:
+        policy.release()
+        result = primary.result()
+        policy.observe(key, time.perf_counter() - started)
+        return result
+
+    policy._count("hedges")
+    hedge = executor.submit(contextvars.copy_context().run, call, True)
+    pending = {primary, hedge}
+    while True:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        winner = next((future for future in done if future.exception() is None), None)
+        if winner is not None or not pending:
+            break
+    # The primary is still running when the hedge wins, its latency is at least this much
+    policy.observe(key, time.perf_counter() - started)
+    if winner is None:
+        # Both failed, report the original request's error
+        return primary.result()
+    for future in pending:
+        future.cancel()
+    if winner is hedge:
+        policy.won()
+    if on_hedge is not None:
+        on_hedge(winner is hedge)
+    return winner.result()
+
+
+async def hedged_acall(policy: HedgePolicy, key: str, call: Callable[[bool], Awaitable[T]],
+                       on_hedge: Optional[Callable[[bool], None]] = None) -> T:
+    """
+    Async variant of hedged_call(), the losing call is cancelled
+
+    Args:
+        policy: Hedge policy
+        key: Latency key of the call, e.g. provider and model
+        call: Coroutine function performing the call, given True for the hedge
+        on_hedge: Called with whether the hedge won, once a hedged call has a winner
+
+    Returns:
+        Result of the first call to succeed
+    """
+    policy.start()
+    delay = policy.delay(key)
+    started = time.perf_counter()
+    if delay is None:
+        result = await call(False)
+        policy.observe(key, time.perf_counter() - started)
+        return result
+
+    primary = asyncio.ensure_future(call(False))
+    pending = {primary}
+    try:
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        if done or not policy.try_hedge():
+            result = await primary
+            policy.observe(key, time.perf_counter() - started)
+            return result
+
+        hedge = asyncio.ensure_future(call(True))
+        pending.add(hedge)
+        while True:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            winner = next((task for task in done if task.exception() is None), None)
+            if winner is not None or not pending:
+                break
+        policy.observe(key, time.perf_counter() - started)
+        if winner is None:
+            return primary.result()
+        if winner is hedge:
+            policy.won()
+        if on_hedge is not None:
+            on_hedge(winner is hedge)
+        return winner.result()
+    finally:
+        # Losers and, when the caller is cancelled, both calls
+        for task in pending:
+            task.cancel()
+
+
+# Shared by proxies created with hedge=True, so the hedge budget covers the whole process
+default_hedge_policy = HedgePolicy()
@@ -3,15 +3,25 @@ Key Generator - Responsible for encrypting and decrypting LLM configuration info
 """
 
 import base64
+import functools
+import hashlib
+import hmac
 import json
 import os
 import secrets
-from cryptography.fernet import Fernet
+import sqlite3
+import threading
+from cryptography.fernet import Fernet, InvalidToken
 from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from typing import Dict, Any, Optional, Union
+from typing import TYPE_CHECKING, Dict, Any, List, Optional, Union
 
-from .models import LLMConfig, LLMProvider
+from .cache import SQLiteCache, TTLCache
+
+if TYPE_CHECKING:
+    # Loading pydantic costs more than the key operations themselves, the model is imported where it is built
+    from .models import LLMConfig
 
 
 class KeyGenerator:
@@ -20,30 +30,96 @@ class KeyGenerator:
     # Master key used to derive encryption key, should be stored in a secure environment variable in production
     MASTER_KEY = os.environ.get("LLM_PROXY_MASTER_KEY", "this_is_a_default_master_key_please_change_in_production")
     
+    # Salt for the once-per-process master key stretch used by v2 tokens
+    MASTER_SALT = os.environ.get("LLM_PROXY_MASTER_SALT", "llm-proxy-master-salt-v2")
+    
+    # PBKDF2 iterations for v1 per-token keys and the v2 master stretch
+    KDF_ITERATIONS = 100000
+    
+    # Token format used for newly encrypted configurations
+    TOKEN_VERSION = 2
+    
+    # Prefix marking v2 tokens, "." never appears in urlsafe base64 so v1 tokens cannot collide
+    V2_PREFIX = "v2."
+    
+    # Decrypted configurations, so the key derivation only runs once per token
+    config_cache = TTLCache(
+        maxsize=int(os.environ.get("LLM_PROXY_CONFIG_CACHE_SIZE", "1024")),
+        ttl=float(os.environ.get("LLM_PROXY_CONFIG_CACHE_TTL", "300")),
+    )
+    
+    # Decrypted configurations shared with other processes through SQLite, see share_cache
+    shared_cache: Optional[SQLiteCache] = None
+    # Whether shared_cache is settled, it is opened from LLM_PROXY_SHARED_CACHE on first use otherwise
+    _shared_opened = False
+    _shared_lock = threading.Lock()
+    
+    @classmethod
+    def _cache_key(cls, encrypted_key: str, master_key: Optional[str] = None) -> str:
+        """Digest of the token, bound to the master key"""
+        master_key = master_key or cls.MASTER_KEY
+        return hmac.new(master_key.encode(), encrypted_key.encode(), hashlib.sha256).hexdigest()
+    
     @classmethod
-    def _derive_key(cls, salt: bytes) -> bytes:
+    def _derive_key(cls, salt: bytes, master_key: Optional[str] = None) -> bytes:
         """Derive encryption key from master key"""
         kdf = PBKDF2HMAC(
             algorithm=hashes.SHA256(),
             length=32,
             salt=salt,
-            iterations=100000,
+            iterations=cls.KDF_ITERATIONS,
         )
-        return base64.urlsafe_b64encode(kdf.derive(cls.MASTER_KEY.encode()))
+        return base64.urlsafe_b64encode(kdf.derive((master_key or cls.MASTER_KEY).encode()))
     
     @classmethod
-    def encrypt_config(cls, config: Union[LLMConfig, Dict[str, Any]]) -> str:
-        """Encrypt LLM configuration information"""
-        if isinstance(config, LLMConfig):
-            config_dict = config.dict()
-        else:
+    def _master_secret(cls, master_key: Optional[str] = None) -> bytes:
+        """Stretch the master key once per process for v2 tokens"""
+        return _stretch_master_key(master_key or cls.MASTER_KEY, cls.MASTER_SALT, cls.KDF_ITERATIONS)
+    
+    @classmethod
+    def _derive_subkey(cls, nonce: bytes, master_key: Optional[str] = None) -> bytes:
+        """Derive a per-token v2 encryption key from the stretched master key"""
+        hkdf = HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=nonce,
+            info=b"llm-proxy config token v2",
+        )
+        return base64.urlsafe_b64encode(hkdf.derive(cls._master_secret(master_key)))
+    
+    @classmethod
+    def encrypt_config(cls,
+                       config: Union["LLMConfig", Dict[str, Any]],
+                       version: Optional[int] = None,
+                       master_key: Optional[str] = None) -> str:
+        """
+        Encrypt LLM configuration information
+        
+        Args:
+            config: Configuration to encrypt
+            version: Token format, 1 (per-token PBKDF2) or 2 (per-token HKDF), defaults to TOKEN_VERSION
+            master_key: Master key to encrypt with, defaults to MASTER_KEY
+            
+        Returns:
+            Encrypted configuration key
+        """
+        if isinstance(config, dict):
             config_dict = config
+        else:
+            config_dict = config.dict()
+        
+        version = version or cls.TOKEN_VERSION
+        if version not in (1, 2):
+            raise ValueError(f"Unsupported token version: {version}")
             
-        # Generate random salt
+        # Generate random salt (v1) or nonce (v2)
         salt = secrets.token_bytes(16)
         
         # Derive encryption key
-        key = cls._derive_key(salt)
+        if version == 2:
+            key = cls._derive_subkey(salt, master_key)
+        else:
+            key = cls._derive_key(salt, master_key)
         
         # Encrypt configuration
         f = Fernet(key)
@@ -52,11 +128,175 @@ class KeyGenerator:
         
         # Combine salt and encrypted configuration
         result = base64.urlsafe_b64encode(salt + encrypted_config).decode()
+        if version == 2:
+            result = cls.V2_PREFIX + result
         return result
     
     @classmethod
-    def decrypt_config(cls, encrypted_key: str) -> LLMConfig:
-        """Decrypt LLM configuration information"""
+    def decrypt_config(cls,
+                       encrypted_key: str,
+                       use_cache: bool = True,
+                       master_key: Optional[str] = None) -> "LLMConfig":
+        """
+        Decrypt LLM configuration information, accepts both v1 and v2 tokens
+        
+        Args:
+            encrypted_key: Encrypted configuration key
+            use_cache: Look up and store the result in the decrypted configuration cache
+            master_key: Master key to decrypt with, defaults to MASTER_KEY
+            
+        Returns:
+            Decrypted configuration, a private copy the caller may modify
+        """
+        if not use_cache:
+            return cls._decrypt(encrypted_key, master_key)
+        
+        cache_key = cls._cache_key(encrypted_key, master_key)
+        config = cls.config_cache.get(cache_key)
+        if config is None:
+            config = cls._shared_get(cache_key, encrypted_key, master_key)
+            if config is None:
+                config = cls._decrypt(encrypted_key, master_key)
+                cls._shared_set(cache_key, encrypted_key, config, master_key)
+            cls.config_cache.set(cache_key, config)
+        return config.model_copy(deep=True)
+    
+    @classmethod
+    def share_cache(cls, path: Optional[str]) -> None:
+        """
+        Share decrypted configurations with other processes using the same SQLite file
+        
+        A v1 key decrypted by one process is then a cache hit in the others. The file holds each
+        configuration re-encrypted as a v2 token, never in plain text, so reading it back costs a v2
+        decryption and needs the master key.
+        
+        Args:
+            path: Database file, None stops sharing
+        """
+        with cls._shared_lock:
+            if cls.shared_cache is not None:
+                cls.shared_cache.close()
+            cls.shared_cache = None if path is None else cls._open_shared(path)
+            cls._shared_opened = True
+    
+    @classmethod
+    def _open_shared(cls, path: str) -> SQLiteCache:
+        return SQLiteCache(path, ttl=cls.config_cache.ttl, max_entries=cls.config_cache.maxsize, table="configs")
+    
+    @classmethod
+    def _shared(cls) -> Optional[SQLiteCache]:
+        """
+        Shared tier, opened on first use from LLM_PROXY_SHARED_CACHE unless share_cache() settled it
+        
+        Worker processes of a multi-process server find the file in their environment. Opening it
+        here rather than at import keeps imports cheap and the connection out of forked parents.
+        """
+        if not cls._shared_opened:
+            with cls._shared_lock:
+                if not cls._shared_opened:
+                    path = os.environ.get("LLM_PROXY_SHARED_CACHE")
+                    cls.shared_cache = cls._open_shared(path) if path else None
+                    cls._shared_opened = True
+        return cls.shared_cache
+    
+    @classmethod
+    def _shared_get(cls, cache_key: str, encrypted_key: str,
+                    master_key: Optional[str] = None) -> Optional["LLMConfig"]:
+        """Configuration another process stored under the cache key, None on a miss"""
+        # Only v1 keys are ever stored, a v2 key is not worth the lookup
+        if cls.token_version(encrypted_key) != 1:
+            return None
+        shared_cache = cls._shared()
+        if shared_cache is None:
+            return None
+        try:
+            token = shared_cache.get(cache_key)
+            return None if token is None else cls._decrypt(token, master_key)
+        except (sqlite3.Error, InvalidToken, ValueError):
+            # The shared tier only saves work, fall back to decrypting the key itself
+            return None
+    
+    @classmethod
+    def _shared_set(cls, cache_key: str, encrypted_key: str, config: "LLMConfig",
+                    master_key: Optional[str] = None) -> None:
+        """Store a decrypted v1 configuration for other processes"""
+        # A v2 key decrypts as fast as its shared copy would, only v1 keys are worth sharing
+        if cls.token_version(encrypted_key) != 1:
+            return
+        shared_cache = cls._shared()
+        if shared_cache is None:
+            return
+        try:
+            shared_cache.set(cache_key, cls.encrypt_config(config, version=2, master_key=master_key))
+        except sqlite3.Error:
+            pass
+    
+    @classmethod
+    def token_version(cls, encrypted_key: str) -> int:
+        """Return the format version of an encrypted configuration key"""
+        return 2 if encrypted_key.startswith(cls.V2_PREFIX) else 1
+    
+    @classmethod
+    def migrate_config(cls,
+                       encrypted_key: str,
+                       master_key: Optional[str] = None,
+                       new_master_key: Optional[str] = None) -> str:
+        """
+        Re-encrypt a key in the v2 format, optionally under a new master key
+        
+        Args:
+            encrypted_key: Existing v1 or v2 encrypted configuration key
+            master_key: Master key the existing key was encrypted with, defaults to MASTER_KEY
+            new_master_key: Master key for the new token, defaults to master_key
+            
+        Returns:
+            v2 encrypted configuration key, the input itself if it is already v2 and the master key is unchanged
+        """
+        if cls.token_version(encrypted_key) == 2 and new_master_key in (None, master_key):
+            return encrypted_key
+        config = cls._decrypt(encrypted_key, master_key)
+        return cls.encrypt_config(config, version=2, master_key=new_master_key or master_key)
+    
+    @classmethod
+    def invalidate_cache(cls, encrypted_key: Optional[str] = None) -> None:
+        """Drop one token from the decrypted configuration cache, or all of them"""
+        if encrypted_key is None:
+            cls.config_cache.clear()
+            shared_cache = cls._shared()
+            if shared_cache is not None:
+                shared_cache.clear()
+        else:
+            cache_key = cls._cache_key(encrypted_key)
+            cls.config_cache.invalidate(cache_key)
+            shared_cache = cls._shared()
+            if shared_cache is not None:
+                shared_cache.invalidate(cache_key)
+    
+    @classmethod
+    def rotate_master_key(cls, master_key: str) -> None:
+        """Switch to a new master key and discard everything decrypted with the old one"""
+        cls.MASTER_KEY = master_key
+        cls.invalidate_cache()
+    
+    @classmethod
+    def decrypt_dict(cls, encrypted_key: str, master_key: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Decrypt a key to the configuration it was encrypted from, as a dict, without validating it
+        
+        Skips the configuration model, and loading pydantic with it, for tools that only inspect keys.
+        Does not consult the cache.
+        
+        Args:
+            encrypted_key: v1 or v2 encrypted configuration key
+            master_key: Master key to decrypt with, defaults to MASTER_KEY
+            
+        Returns:
+            Configuration dict
+        """
+        version = cls.token_version(encrypted_key)
+        if version == 2:
+            encrypted_key = encrypted_key[len(cls.V2_PREFIX):]
+        
         # Decode encrypted key
         raw_data = base64.urlsafe_b64decode(encrypted_key.encode())
         
@@ -64,14 +304,33 @@ class KeyGenerator:
         salt, encrypted_config = raw_data[:16], raw_data[16:]
         
         # Derive encryption key
-        key = cls._derive_key(salt)
+        if version == 2:
+            key = cls._derive_subkey(salt, master_key)
+        else:
+            key = cls._derive_key(salt, master_key)
         
         # Decrypt configuration
         f = Fernet(key)
         decrypted_config = f.decrypt(encrypted_config)
-        config_dict = json.loads(decrypted_config)
-        
-        return LLMConfig(**config_dict)
+        return json.loads(decrypted_config)
+    
+    @classmethod
+    def _decrypt(cls, encrypted_key: str, master_key: Optional[str] = None) -> "LLMConfig":
+        """Decrypt a token without consulting the cache"""
+        from .models import LLMConfig
+        return LLMConfig(**cls.decrypt_dict(encrypted_key, master_key))
+
+
+@functools.lru_cache(maxsize=8)
+def _stretch_master_key(master_key: str, salt: str, iterations: int) -> bytes:
+    """PBKDF2 stretch of the master key, memoized so it runs once per process and key"""
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=salt.encode(),
+        iterations=iterations,
+    )
+    return kdf.derive(master_key.encode())
 
 
 def generate_encrypted_key(
@@ -80,7 +339,14 @@ def generate_encrypted_key(
     api_key: str,
     model: str,
     headers: Optional[Dict[str, str]] = None,
-    extra_body: Optional[Dict[str, Any]] = None
+    extra_body: Optional[Dict[str, Any]] = None,
+    backends: Optional[List[Dict[str, Any]]] = None,
+    rpm: Optional[int] = None,
+    tpm: Optional[int] = None,
+    max_inflight: Optional[int] = None,
+    priority: Optional[str] = None,
+    share: Optional[float] = None,
+    stream_usage: bool = False
 ) -> str:
     """
     Generate encrypted LLM configuration key
@@ -92,17 +358,46 @@ def generate_encrypted_key(
         model: Model name
         headers: Optional HTTP headers
         extra_body: Optional extra request body parameters
+        backends: Optional list of weighted backends ({"base_url", "api_key", "model", "weight", "headers"})
+            to balance requests across instead of base_url/api_key
+        rpm: Optional requests per minute limit of the API key
+        tpm: Optional tokens per minute limit of the API key
+        max_inflight: Optional number of calls allowed in flight through the API key
+        priority: Optional scheduler priority class, "interactive" or "batch"
+        share: Optional fair queuing weight against other configurations sharing the API key
+        stream_usage: Ask OpenAI-compatible upstreams for the usage of streamed responses (stream_options)
         
     Returns:
         Encrypted configuration key
     """
+    from .models import LLMConfig
     config = LLMConfig(
         provider=provider,
         base_url=base_url,
         api_key=api_key,
         model=model,
         headers=headers or {},
-        extra_body=extra_body or {}
+        extra_body=extra_body or {},
+        backends=backends or [],
+        rpm=rpm,
+        tpm=tpm,
+        max_inflight=max_inflight,
+        priority=priority,
+        share=share,
+        stream_usage=stream_usage
     )
     
-    return KeyGenerator.encrypt_config(config) 
\ No newline at end of file
+    return KeyGenerator.encrypt_config(config)
+
+
+def migrate_encrypted_key(encrypted_key: str) -> str:
+    """
+    Convert an encrypted configuration key to the fast v2 format
+    
+    Args:
+        encrypted_key: v1 or v2 encrypted configuration key
+        
+    Returns:
+        v2 encrypted configuration key
+    """
+    return KeyGenerator.migrate_config(encrypted_key)
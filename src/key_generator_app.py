@@ -2,7 +2,6 @@
 Gradio-based LLM configuration key generator application
 """
 
-import gradio as gr
 import os
 import sys
 import json
@@ -11,6 +10,11 @@ from typing import Dict, Any, List, Tuple
 # Ensure project modules can be imported
 sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
 
+if __name__ == "__main__":
+    # The master key is read from the environment as src.key_generator loads, so .env goes first
+    from dotenv import load_dotenv
+    load_dotenv()
+
 from src.key_generator import generate_encrypted_key
 from src.models import LLMProvider
 
@@ -86,6 +90,8 @@ Please save this key securely and provide it to applications that need to access
 
 def create_demo():
     """Create Gradio demo interface"""
+    # Gradio takes seconds to import, only the interface itself needs it
+    import gradio as gr
     
     with gr.Blocks(title="LLM Configuration Key Generator") as demo:
         gr.Markdown("# LLM Configuration Key Generator")
@@ -145,7 +151,7 @@ def create_demo():
 
 
 def main():
-    """Main function"""
+    """Main function, .env is loaded by whatever imported this module first"""
     demo = create_demo()
     demo.launch(share=False)
 
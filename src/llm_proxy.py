@@ -2,115 +2,1184 @@
 LLM Proxy - Responsible for handling communication with various LLM providers
 """
 
+import asyncio
+import functools
+import inspect
 import os
-from typing import Dict, List, Any, Optional, Union
-import openai
-from openai import OpenAI
-from dotenv import load_dotenv
+import time
+from typing import (TYPE_CHECKING, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Any, Optional, Tuple,
+                    Union)
 
+from . import metrics
+from .adapters import CompiledRequest, Completion, ProviderAdapter, get_adapter
+from .balancer import BackendState, default_balancers
+from .client_pool import ClientPool, default_pool
+from .deadlines import CancelToken, Deadline, DeadlineExceeded, RequestCancelled, abort_response
+from .hedging import HedgePolicy, default_hedge_policy, hedged_acall, hedged_call
 from .key_generator import KeyGenerator
 from .models import LLMConfig, LLMProvider, Message, ChatRequest
+from .rate_limit import RateLimiter, Reservation, default_limiters
+from .request_template import default_templates
+from .resilience import (BreakerRegistry, RetryPolicy, acall_with_retries, call_with_retries,
+                         default_breakers, default_retry_policy)
+from .response_cache import ResponseCache
+from .scheduler import DEFAULT_PRIORITY, PRIORITIES, Scheduler, Slot, default_schedulers
+from .single_flight import SingleFlight, default_single_flight
+from .tokens import estimate_tokens
 
-load_dotenv()
+if TYPE_CHECKING:
+    # The SDK takes most of a second to import, it is loaded with the first SDK client
+    from openai import AsyncOpenAI, OpenAI
 
 
-class LLMProxy:
-    """LLM proxy class, handles communication with LLM service providers"""
-    
-    def __init__(self, encrypted_key: str):
+# What a stream holds until it is closed: scheduler slots, rate limit reservations and concurrency slots
+Held = Union[Slot, Reservation, asyncio.Semaphore]
+
+# Providers served through the OpenAI-compatible client
+OPENAI_COMPATIBLE_PROVIDERS = (LLMProvider.OPENAI.value, LLMProvider.OPENROUTER.value)
+
+# stream_options asking OpenAI-compatible upstreams to end a stream with a usage chunk
+STREAM_USAGE = {"include_usage": True}
+
+# Transport of OpenAI-compatible providers: "sdk" (OpenAI client) or "native" (httpx adapter)
+DEFAULT_ADAPTER = os.environ.get("LLM_PROXY_ADAPTER", "sdk")
+
+# Send precompiled request bodies, skipping the SDK's per-call parameter transform
+FAST_PATH = os.environ.get("LLM_PROXY_FAST_PATH", "1") != "0"
+
+
+@functools.lru_cache(maxsize=None)
+def _sdk_types() -> Tuple[Any, Any, Any]:
+    """Completion, stream and async stream types the SDK parses responses into"""
+    from openai import AsyncStream, Stream
+    from openai.types.chat import ChatCompletion, ChatCompletionChunk
+    return ChatCompletion, Stream[ChatCompletionChunk], AsyncStream[ChatCompletionChunk]
+
+
+@functools.lru_cache(maxsize=None)
+def _posts_content(client_cls: type) -> bool:
+    """Whether an SDK client's post() takes a pre-encoded body, early 1.x releases only take a dict"""
+    return "content" in inspect.signature(client_cls.post).parameters
+
+
+class BaseLLMProxy:
+    """Configuration and request building shared by the sync and async proxies"""
+
+    def __init__(self,
+                 encrypted_key: str,
+                 pool: Optional[ClientPool] = None,
+                 response_cache: Optional[ResponseCache] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 breakers: Optional[BreakerRegistry] = None,
+                 rpm: Optional[int] = None,
+                 tpm: Optional[int] = None,
+                 rate_limit_wait: float = 30.0,
+                 adapter: Union[None, str, ProviderAdapter] = None,
+                 single_flight: Union[None, bool, SingleFlight] = None,
+                 fast_path: Optional[bool] = None,
+                 hedge: Union[None, bool, HedgePolicy] = None,
+                 max_inflight: Optional[int] = None,
+                 priority: Optional[str] = None,
+                 share: Optional[float] = None):
         """
         Initialize LLM proxy
-        
+
         Args:
             encrypted_key: Encrypted LLM configuration key
+            pool: Client pool to draw connections from, defaults to the process-wide pool
+            response_cache: Optional cache of responses to deterministic requests
+            retry_policy: Retry policy for transient upstream errors, defaults to the shared policy
+            breakers: Circuit breaker registry, defaults to the shared registry
+            rpm: Requests per minute budget per API key, overrides the configuration
+            tpm: Tokens per minute budget per API key, overrides the configuration
+            rate_limit_wait: Longest a request queues for rate limit budget before RateLimitTimeout
+            adapter: "sdk", "native" or a ProviderAdapter instance, defaults to LLM_PROXY_ADAPTER for
+                OpenAI-compatible providers and to the registered native adapter for the others
+            single_flight: Coalesce identical concurrent chat requests into one upstream call, True uses
+                the process-wide group
+            fast_path: Send requests from precompiled templates, defaults to LLM_PROXY_FAST_PATH
+            hedge: Race a second request against chat calls slower than the policy's delay, True uses
+                the process-wide policy and budget
+            max_inflight: Calls allowed in flight per API key, overrides the configuration, further
+                requests queue in the shared scheduler
+            priority: Scheduler priority class, "interactive" or "batch", overrides the configuration
+            share: Weight against other configurations queued for the same API key, overrides the configuration
         """
+        started = time.perf_counter()
         self.config = KeyGenerator.decrypt_config(encrypted_key)
+        # Reported with the first instrumented request of this proxy
+        self._decrypt_seconds = time.perf_counter() - started
+        self.pool = pool or default_pool
+        self.response_cache = response_cache
+        self.single_flight = default_single_flight if single_flight is True else single_flight or None
+        self.template = default_templates.get(self.config)
+        self.fast_path = FAST_PATH if fast_path is None else fast_path
+        self.hedge = default_hedge_policy if hedge is True else hedge or None
+        self.retry_policy = retry_policy or default_retry_policy
+        self.balancer = default_balancers.get(self.config, breakers)
+        self.breaker = self.balancer.backends[0].breaker
+        self.rpm = rpm
+        self.tpm = tpm
+        self.rate_limit_wait = rate_limit_wait
+        self.max_inflight = max_inflight
+        self.priority = priority or self.config.priority or DEFAULT_PRIORITY
+        if self.priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {self.priority}")
+        self.share = share or self.config.share or 1.0
+        # Fair queuing tells configurations apart by their request template, there is one per configuration
+        self.tenant = self.template
+        self.adapter = self._check_provider(adapter)
         self._setup_client()
-    
+
     def _setup_client(self):
-        """Set up appropriate client based on configuration"""
-        if self.config.provider == LLMProvider.OPENAI.value:
-            self.client = OpenAI(
-                base_url=self.config.base_url,
-                api_key=self.config.api_key,
-            )
-        elif self.config.provider == LLMProvider.ANTHROPIC.value:
-            # Need to import Anthropic client here
-            # For simplicity, we only implement OpenAI interface for now
-            raise NotImplementedError("Anthropic client not yet implemented")
-        elif self.config.provider == LLMProvider.GOOGLE.value:
-            # Need to import Google client here
-            # For simplicity, we only implement OpenAI interface for now
-            raise NotImplementedError("Google client not yet implemented")
-        elif self.config.provider == LLMProvider.OPENROUTER.value:
-            # OpenRouter actually uses OpenAI-compatible interface
-            self.client = OpenAI(
-                base_url=self.config.base_url,
-                api_key=self.config.api_key,
-            )
+        """Set up clients eagerly, subclasses that need them do so here"""
+
+    def _check_provider(self, adapter: Union[None, str, ProviderAdapter] = None) -> Optional[ProviderAdapter]:
+        """
+        Choose how the provider is reached
+
+        Args:
+            adapter: Adapter requested by the caller
+
+        Returns:
+            Native adapter, or None to use the OpenAI SDK client
+        """
+        if isinstance(adapter, ProviderAdapter):
+            return adapter
+        provider = self.config.provider
+        choice = adapter or (DEFAULT_ADAPTER if provider in OPENAI_COMPATIBLE_PROVIDERS else "native")
+        if choice == "sdk":
+            if provider not in OPENAI_COMPATIBLE_PROVIDERS:
+                raise ValueError(f"The OpenAI SDK cannot serve provider: {provider}")
+            return None
+        if choice != "native":
+            raise ValueError(f"Unknown adapter: {choice}")
+        native = get_adapter(provider)
+        if native is None:
+            raise ValueError(f"Unsupported provider: {provider}")
+        return native
+
+    def _build_request(self,
+                       messages: List[Dict[str, Any]],
+                       model: Optional[str] = None,
+                       temperature: float = 0.7,
+                       max_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Build keyword arguments for chat.completions.create
+
+        Args:
+            messages: List of messages
+            model: Optional model name
+            temperature: Temperature parameter
+            max_tokens: Maximum tokens to generate
+
+        Returns:
+            Request parameters including extra_headers, in OpenAI form for every provider
+        """
+        # Model, extra_body and headers were merged once per configuration
+        return self.template.build(messages, model, temperature, max_tokens)
+
+    def _prepare(self, backend: BackendState, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Adapt request parameters to the backend chosen for this attempt"""
+        if not self.config.backends:
+            return kwargs
+        kwargs = dict(kwargs)
+        # A backend may name the default model differently, e.g. with an OpenRouter vendor prefix
+        if kwargs["model"] == self.config.model:
+            kwargs["model"] = backend.config.model
+        kwargs["extra_headers"] = backend.config.headers
+        return kwargs
+
+    @staticmethod
+    def _stream_usage(backend: BackendState, kwargs: Dict[str, Any], stream: bool, raw: bool) -> bool:
+        """Whether to ask for a final usage chunk, only parsed streams of configurations opting in do"""
+        config = backend.config
+        return (stream and not raw and config.stream_usage and config.provider in OPENAI_COMPATIBLE_PROVIDERS
+                and "stream_options" not in kwargs)
+
+    def _compiled(self, backend: BackendState, kwargs: Dict[str, Any], stream: bool,
+                  adapter: Optional[ProviderAdapter] = None) -> Optional[CompiledRequest]:
+        """Precompiled native request for the backend, None when the fast path is off"""
+        if not self.fast_path:
+            return None
+        return self.template.compile(adapter or self.adapter, backend.config, kwargs, stream)
+
+    def _raw_adapter(self) -> ProviderAdapter:
+        """Adapter raw calls are sent through, the native one of providers otherwise served by the SDK"""
+        return self.adapter or get_adapter(self.config.provider)
+
+    def _sdk_post(self, backend: BackendState, kwargs: Dict[str, Any], stream: bool,
+                  timeout: Any = None) -> Dict[str, Any]:
+        """Arguments for the SDK client's post() from the template, with the attempt's timeouts"""
+        post = self.template.sdk_post(backend.config, kwargs, stream)
+        if timeout is not None:
+            post["options"]["timeout"] = timeout
+        return post
+
+    def _scheduler(self, backend: BackendState) -> Optional[Scheduler]:
+        """Shared scheduler of the backend's API key, None when its calls in flight are not limited"""
+        endpoint = backend.config
+        return default_schedulers.get(
+            endpoint.base_url,
+            endpoint.api_key,
+            self.max_inflight if self.max_inflight is not None else endpoint.max_inflight,
+        )
+
+    @staticmethod
+    def _cost(kwargs: Dict[str, Any]) -> int:
+        """Work a request is charged for in fair queuing, its estimated tokens"""
+        return max(1, estimate_tokens(kwargs["messages"], kwargs.get("max_tokens")))
+
+    def _scheduled(self, record: Optional[metrics.RequestRecord], slot: Slot) -> None:
+        """Note the time a request queued in the scheduler on its record"""
+        if record is not None:
+            record.priority = self.priority
+            record.add("schedule", slot.waited)
+
+    @staticmethod
+    def _hold(slot: Union[Slot, asyncio.Semaphore], slots: Optional[List[Held]], stream: bool) -> None:
+        """Release the slot of a finished attempt, a stream keeps it until it is closed"""
+        if stream and slots is not None:
+            slots.append(slot)
         else:
-            raise ValueError(f"Unsupported provider: {self.config.provider}")
-    
+            slot.release()
+
+    @staticmethod
+    def _release_held(held: List[Held], tokens: Optional[int]) -> None:
+        """Release what a closed stream held, its rate limit reservations reconciled to the tokens it reported"""
+        for item in held:
+            if isinstance(item, Reservation):
+                item.release(tokens)
+            else:
+                item.release()
+
+    @staticmethod
+    def _stream_tokens(stream: Any, usage: Any) -> Optional[int]:
+        """Total tokens of a stream, from its final usage chunk or as summed up by a native stream"""
+        tokens = getattr(usage, "total_tokens", None)
+        return tokens if tokens is not None else BaseLLMProxy._usage_tokens(stream)
+
+    def _limiter(self, backend: BackendState) -> Optional[RateLimiter]:
+        """Shared rate limiter of the backend's API key, None when it has no limits"""
+        endpoint = backend.config
+        return default_limiters.get(
+            endpoint.base_url,
+            endpoint.api_key,
+            self.rpm if self.rpm is not None else endpoint.rpm,
+            self.tpm if self.tpm is not None else endpoint.tpm,
+        )
+
+    @staticmethod
+    def _usage_tokens(result: Any) -> Optional[int]:
+        """Total tokens reported by a completion, None if not reported"""
+        usage = getattr(result, "usage", None)
+        return getattr(usage, "total_tokens", None)
+
+    def _cache_lookup(self, kwargs: Dict[str, Any], use_cache: bool) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Look a request up in the response cache
+
+        Args:
+            kwargs: Request parameters from _build_request
+            use_cache: False bypasses the cache for this call
+
+        Returns:
+            Cache key (None if the request is not cacheable) and cached response (None on a miss)
+        """
+        if self.response_cache is None or not use_cache or not self.response_cache.accepts(kwargs):
+            return None, None
+        cache_key = ResponseCache.make_key(self.config, kwargs)
+        return cache_key, self.response_cache.get(cache_key)
+
+    def _cache_store(self, cache_key: Optional[str], content: Optional[str]) -> None:
+        """Store a response under a key returned by _cache_lookup"""
+        if cache_key is not None and content is not None:
+            self.response_cache.set(cache_key, content)
+
+    def _flight_key(self, kwargs: Dict[str, Any], cache_key: Optional[str], deadline: Optional[Deadline] = None,
+                    cancel: Optional[CancelToken] = None) -> Optional[str]:
+        """Key shared by identical requests in flight, None when the request is not coalesced"""
+        if self.single_flight is None or not self.single_flight.accepts(kwargs):
+            return None
+        # A coalesced call runs under its first caller's deadline and token, calls bringing their own go alone
+        if deadline is not None or cancel is not None:
+            return None
+        return cache_key or ResponseCache.make_key(self.config, kwargs)
+
+    def _hedge_key(self, kwargs: Dict[str, Any]) -> str:
+        """Latency key hedge delays are tracked under"""
+        return f"{self.config.provider}:{kwargs['model']}"
+
+    @staticmethod
+    def _hedge_outcome(record: Optional[metrics.RequestRecord]) -> Optional[Callable[[bool], None]]:
+        """Callback marking a hedged request's record with whether the hedge won"""
+        if record is None:
+            return None
+
+        def on_hedge(won: bool) -> None:
+            record.hedge = "won" if won else "lost"
+
+        return on_hedge
+
+    @staticmethod
+    def _attempt_record(record: Optional[metrics.RequestRecord]) -> Optional[metrics.RequestRecord]:
+        """
+        Record the original request of a hedged call fills in
+
+        A winning hedge leaves the original request running (or, async, cancelled but not yet
+        unwound), so it writes into a record of its own rather than one already finished.
+        """
+        return record.attempt() if record is not None else None
+
+    @staticmethod
+    def _merge_attempt(record: Optional[metrics.RequestRecord], own: Optional[metrics.RequestRecord]) -> None:
+        """Fold the original request's record into the request's, unless a hedge won and it may still run"""
+        if record is not None and record.hedge != "won":
+            record.merge(own)
+
+    def _attempt_failed(self, backend: BackendState, started: float, exc: BaseException,
+                        deadline: Optional[Deadline]) -> BaseException:
+        """
+        Record a failed attempt on its backend
+
+        Args:
+            backend: Backend the attempt went to
+            started: Value returned by backend.start()
+            exc: Error the attempt raised
+            deadline: Deadline of the call, if any
+
+        Returns:
+            Error to raise, DeadlineExceeded when the attempt ran out of the caller's time
+        """
+        if not isinstance(exc, Exception):
+            # Cancelled, e.g. a losing hedge, the probe it may hold is given back without an outcome
+            self.balancer.finish(backend, started, exc)
+            backend.breaker.release()
+            return exc
+        error = exc
+        if deadline is not None and deadline.expired:
+            # The caller ran out of time, which says nothing about the backend's health
+            error = DeadlineExceeded(deadline.timeout)
+        self.balancer.finish(backend, started, error)
+        backend.breaker.record(error)
+        return error
+
+    @staticmethod
+    def _stream_error(exc: BaseException, deadline: Optional[Deadline],
+                      cancel: Optional[CancelToken]) -> BaseException:
+        """Error to raise for a failed stream, the cancellation or deadline behind a transport error"""
+        if not isinstance(exc, Exception) or isinstance(exc, (RequestCancelled, DeadlineExceeded)):
+            return exc
+        if cancel is not None and cancel.cancelled:
+            return RequestCancelled()
+        if deadline is not None and deadline.expired:
+            return DeadlineExceeded(deadline.timeout)
+        return exc
+
+    def _start_record(self, kwargs: Dict[str, Any], started: float,
+                      stream: bool = False) -> Optional[metrics.RequestRecord]:
+        """
+        Begin the metrics record of a request, None when no metrics hook is registered
+
+        Args:
+            kwargs: Request parameters from _build_request
+            started: perf_counter() value taken when the call began
+            stream: Whether the response is streamed
+
+        Returns:
+            Record with the decrypt and build phases filled in
+        """
+        record = metrics.hub.start(self.config.provider, kwargs["model"], stream, started, self.config)
+        if record is not None:
+            record.request = kwargs
+            record.add("build", time.perf_counter() - started)
+            if self._decrypt_seconds:
+                record.add("decrypt", self._decrypt_seconds)
+                self._decrypt_seconds = 0.0
+        return record
+
+
+class LLMProxy(BaseLLMProxy):
+    """LLM proxy class, handles communication with LLM service providers"""
+
+    @property
+    def client(self) -> Optional["OpenAI"]:
+        """Pooled SDK client, built on first use, None when a native adapter serves the configuration"""
+        # OpenRouter actually uses OpenAI-compatible interface, native adapters use the pooled HTTP client
+        return self.pool.get_client(self.config) if self.adapter is None else None
+
+    def _send(self,
+              kwargs: Dict[str, Any],
+              record: Optional[metrics.RequestRecord] = None,
+              tried: Optional[List[BackendState]] = None,
+              deadline: Optional[Deadline] = None,
+              cancel: Optional[CancelToken] = None,
+              slots: Optional[List[Held]] = None,
+              **options: Any) -> Any:
+        """
+        Make one upstream attempt on the backend chosen by the load balancer
+
+        Args:
+            kwargs: Request parameters from _build_request
+            record: Metrics record of the request, if instrumented
+            tried: Backends already serving the request, the pick avoids them and is added
+            deadline: Deadline of the call, bounding the scheduler and rate limit waits and the attempt's timeouts
+            cancel: Token cancelling the call
+            slots: Scheduler slots and rate limit reservations held by a stream are added here, to be
+                released when it is closed
+            options: Extra arguments for chat.completions.create, e.g. stream, and raw to get the
+                response body unparsed from the native adapter
+
+        Returns:
+            Completion, or stream when streaming
+        """
+        if cancel is not None:
+            cancel.check()
+        if deadline is not None:
+            deadline.check()
+        backend = self.balancer.pick(tried)
+        if tried is not None:
+            tried.append(backend)
+        # Fail fast while the circuit is open, the probe itself is only taken once the call is admitted
+        backend.breaker.check()
+
+        # Queue for rate limit budget rather than provoke a 429. Budget comes first, a request waiting
+        # for it must not hold a scheduler slot that a higher priority request could use
+        limiter = self._limiter(backend)
+        estimated = 0
+        if limiter is not None:
+            estimated = estimate_tokens(kwargs["messages"], kwargs.get("max_tokens"))
+            wait = self.rate_limit_wait if deadline is None else deadline.cap(self.rate_limit_wait)
+            waited = limiter.acquire(estimated, wait)
+            if record is not None:
+                record.add("queue", waited)
+
+        # Wait for a slot among the API key's calls in flight, in priority and fair share order
+        scheduler = self._scheduler(backend)
+        if scheduler is None:
+            return self._call_backend(backend, kwargs, record, deadline, slots, limiter, estimated, **options)
+        try:
+            slot = scheduler.acquire(self.tenant, self.priority, self.share, self._cost(kwargs), deadline, cancel)
+        except BaseException:
+            # Shed or cancelled, the request never went out
+            if limiter is not None:
+                limiter.refund(estimated, request=True)
+            raise
+        self._scheduled(record, slot)
+        try:
+            result = self._call_backend(backend, kwargs, record, deadline, slots, limiter, estimated, **options)
+        except BaseException:
+            slot.release()
+            raise
+        self._hold(slot, slots, options.get("stream", False))
+        return result
+
+    def _call_backend(self,
+                      backend: BackendState,
+                      kwargs: Dict[str, Any],
+                      record: Optional[metrics.RequestRecord],
+                      deadline: Optional[Deadline],
+                      slots: Optional[List[Held]],
+                      limiter: Optional[RateLimiter],
+                      estimated: int,
+                      **options: Any) -> Any:
+        """Send an admitted attempt, holding estimated tokens of limiter's budget, to its backend, see _send"""
+        # Raw calls skip the SDK, which would parse the response
+        raw = options.pop("raw", False)
+        adapter = self._raw_adapter() if raw else self.adapter
+        if adapter is None:
+            client = self.pool.get_client(backend.config)
+        else:
+            http_client = self.pool.get_http_client()
+
+        stream = options.get("stream", False)
+        try:
+            prepared = self._prepare(backend, kwargs)
+            timeout = None if deadline is None else deadline.http_timeout(self.pool.timeouts)
+            if timeout is not None and adapter is None:
+                options["timeout"] = timeout
+            # SDK releases whose post() cannot send the precompiled body go through create()
+            sdk_post = adapter is None and self.fast_path and _posts_content(type(client))
+            if sdk_post:
+                # Loaded with the first call, the time it takes is not the backend's
+                completion_cls, stream_cls, _ = _sdk_types()
+            if self._stream_usage(backend, prepared, stream, raw):
+                # The final chunk then reports usage, which rate limiting reconciles the reservation to
+                if adapter is None and not sdk_post:
+                    options["extra_body"] = {"stream_options": STREAM_USAGE}
+                else:
+                    prepared = dict(prepared, stream_options=STREAM_USAGE)
+            # The probe is taken once nothing but the call itself can fail, a RateLimitTimeout or a
+            # DeadlineExceeded before it is sent must not keep it
+            backend.breaker.before_request()
+        except BaseException:
+            # Nothing was sent, the request and its tokens go back to the budget
+            if limiter is not None:
+                limiter.refund(estimated, request=True)
+            raise
+        started = backend.start()
+        token = metrics.bind(record)
+        try:
+            if sdk_post:
+                result = client.post(cast_to=completion_cls, stream=stream, stream_cls=stream_cls,
+                                     **self._sdk_post(backend, prepared, stream, timeout))
+            elif adapter is None:
+                result = client.chat.completions.create(**prepared, **options)
+            else:
+                result = adapter.send(http_client, backend.config, prepared, stream=stream,
+                                      compiled=self._compiled(backend, prepared, stream, adapter), timeout=timeout,
+                                      raw=raw)
+        except BaseException as exc:
+            metrics.unbind(token)
+            if limiter is not None:
+                limiter.refund(estimated)
+            error = self._attempt_failed(backend, started, exc, deadline)
+            if error is exc:
+                raise
+            raise error from exc
+        metrics.unbind(token)
+        self.balancer.finish(backend, started)
+        backend.breaker.record(None)
+        if limiter is not None:
+            if stream and slots is not None:
+                # A stream's usage is known once it ends, its reservation is reconciled when it is closed
+                slots.append(Reservation(limiter, estimated))
+            else:
+                limiter.reconcile(estimated, self._usage_tokens(result))
+        if record is not None and not options.get("stream"):
+            record.generation_done()
+            record.set_usage(getattr(result, "usage", None))
+        return result
+
     def send_message(self, message: str, model: Optional[str] = None) -> str:
         """
         Send a single message to the LLM and get a response
-        
+
         Args:
             message: User message
             model: Optional model name, if not provided uses default model from configuration
-            
+
         Returns:
             LLM response text
         """
         return self.chat([{"role": "user", "content": message}], model)
-    
-    def chat(self, 
-             messages: List[Dict[str, Any]], 
+
+    def chat(self,
+             messages: List[Dict[str, Any]],
              model: Optional[str] = None,
              temperature: float = 0.7,
-             max_tokens: Optional[int] = None) -> str:
+             max_tokens: Optional[int] = None,
+             use_cache: bool = True,
+             timeout: Union[None, float, Deadline] = None,
+             cancel: Optional[CancelToken] = None) -> str:
         """
         Send chat messages to LLM and get a response
-        
+
         Args:
             messages: List of messages
             model: Optional model name
             temperature: Temperature parameter
             max_tokens: Maximum tokens to generate
-            
+            use_cache: False bypasses the response cache for this call
+            timeout: Seconds the call may take including retries, or a Deadline shared with other calls
+            cancel: Token cancelling the call from another thread
+
         Returns:
             LLM response text
         """
-        model = model or self.config.model
-        
-        if self.config.provider in [LLMProvider.OPENAI.value, LLMProvider.OPENROUTER.value]:
-            # Build request parameters
-            kwargs = {
-                "model": model,
-                "messages": messages,
-                "temperature": temperature
-            }
-            
-            # Add max_tokens if provided
-            if max_tokens is not None:
-                kwargs["max_tokens"] = max_tokens
-                
-            # Add extra request body parameters
-            if self.config.extra_body:
-                kwargs.update(self.config.extra_body)
-                
-            # Add extra headers
-            extra_headers = {}
-            if self.config.headers:
-                extra_headers = self.config.headers
-                
-            # Send request
-            completion = self.client.chat.completions.create(
-                **kwargs,
-                extra_headers=extra_headers
-            )
-            
-            # Return response text
-            return completion.choices[0].message.content
+        started = time.perf_counter()
+        kwargs = self._build_request(messages, model, temperature, max_tokens)
+        cache_key, cached = self._cache_lookup(kwargs, use_cache)
+        record = self._start_record(kwargs, started)
+        if cached is not None:
+            if record is not None:
+                record.cached = True
+                metrics.hub.finish(record)
+            return cached
+
+        # Send request, retrying transient errors
+        deadline = Deadline.of(timeout)
+        tried = [] if self.hedge is not None and self.hedge.alternate else None
+
+        def attempt(target: Optional[metrics.RequestRecord] = record):
+            return self._send(kwargs, target, tried, deadline, cancel)
+
+        def retried(call):
+            # Backoff ends early when the call is cancelled
+            return call_with_retries(call, self.retry_policy, sleep=time.sleep if cancel is None else cancel.wait,
+                                     deadline=deadline)
+
+        sent = []
+
+        def send():
+            sent.append(True)
+            if self.hedge is None:
+                return retried(attempt)
+            # The hedge is a single extra request, it is not retried, and leaves the record alone
+            own = self._attempt_record(record)
+            try:
+                return hedged_call(self.hedge, self._hedge_key(kwargs),
+                                   lambda hedge: attempt(None) if hedge else retried(lambda: attempt(own)),
+                                   self._hedge_outcome(record))
+            finally:
+                self._merge_attempt(record, own)
+
+        flight_key = self._flight_key(kwargs, cache_key, deadline, cancel)
+        try:
+            completion = send() if flight_key is None else self.single_flight.do(flight_key, send)
+            if record is not None and not sent:
+                record.coalesced = True
+        except BaseException as exc:
+            metrics.hub.finish(record, exc)
+            raise
+        metrics.hub.finish(record)
+
+        # Return response text
+        content = _completion_content(completion)
+        self._cache_store(cache_key, content)
+        return content
+
+    def chat_stream(self,
+                    messages: List[Dict[str, Any]],
+                    model: Optional[str] = None,
+                    temperature: float = 0.7,
+                    max_tokens: Optional[int] = None,
+                    timeout: Union[None, float, Deadline] = None,
+                    cancel: Optional[CancelToken] = None) -> Iterator[str]:
+        """
+        Send chat messages to LLM and yield the response text as it is generated
+
+        Args:
+            messages: List of messages
+            model: Optional model name
+            temperature: Temperature parameter
+            max_tokens: Maximum tokens to generate
+            timeout: Seconds the stream may take from start to end, or a Deadline shared with other calls
+            cancel: Token cancelling the stream from another thread, aborting a blocked read
+
+        Returns:
+            Iterator of response text deltas
+        """
+        return self._stream(messages, model, temperature, max_tokens, timeout, cancel)
+
+    def chat_raw(self,
+                 messages: List[Dict[str, Any]],
+                 model: Optional[str] = None,
+                 temperature: float = 0.7,
+                 max_tokens: Optional[int] = None,
+                 stream: bool = False,
+                 timeout: Union[None, float, Deadline] = None,
+                 cancel: Optional[CancelToken] = None) -> Union[bytes, Iterator[bytes]]:
+        """
+        Send chat messages to LLM and get the upstream response body as is, for relaying it onward
+
+        The request is built like chat()'s, with the configuration's headers and extra_body, and sent
+        through the provider's native adapter on the pooled HTTP client. The response is neither
+        parsed nor cached, so it is in the provider's own format.
+
+        Args:
+            messages: List of messages
+            model: Optional model name
+            temperature: Temperature parameter
+            max_tokens: Maximum tokens to generate
+            stream: Request a streamed response and iterate over its server-sent event bytes
+            timeout: Seconds the call may take including retries, or a Deadline shared with other calls
+            cancel: Token cancelling the call from another thread
+
+        Returns:
+            Response body, or iterator of its chunks when streaming
+        """
+        if stream:
+            return self._stream(messages, model, temperature, max_tokens, timeout, cancel, raw=True)
+        started = time.perf_counter()
+        kwargs = self._build_request(messages, model, temperature, max_tokens)
+        record = self._start_record(kwargs, started)
+        deadline = Deadline.of(timeout)
+        try:
+            body = call_with_retries(lambda: self._send(kwargs, record, None, deadline, cancel, raw=True),
+                                     self.retry_policy, sleep=time.sleep if cancel is None else cancel.wait,
+                                     deadline=deadline)
+        except BaseException as exc:
+            metrics.hub.finish(record, exc)
+            raise
+        metrics.hub.finish(record)
+        return body
+
+    def _stream(self,
+                messages: List[Dict[str, Any]],
+                model: Optional[str],
+                temperature: float,
+                max_tokens: Optional[int],
+                timeout: Union[None, float, Deadline],
+                cancel: Optional[CancelToken],
+                raw: bool = False) -> Iterator[Any]:
+        """Streamed call of chat_stream(), yielding body chunks instead of text deltas when raw"""
+        started = time.perf_counter()
+        kwargs = self._build_request(messages, model, temperature, max_tokens)
+        record = self._start_record(kwargs, started, stream=True)
+        deadline = Deadline.of(timeout)
+        slots: List[Held] = []
+        try:
+            stream = call_with_retries(lambda: self._send(kwargs, record, None, deadline, cancel, slots, stream=True,
+                                                          raw=raw),
+                                       self.retry_policy, sleep=time.sleep if cancel is None else cancel.wait,
+                                       deadline=deadline)
+        except BaseException as exc:
+            metrics.hub.finish(record, exc)
+            raise
+        # Cancelling from another thread aborts a read blocked on the upstream
+        forget = None if cancel is None else cancel.on_cancel(lambda: abort_response(getattr(stream, "response", None)))
+        error = None
+        usage = None
+        try:
+            for chunk in stream:
+                if cancel is not None:
+                    cancel.check()
+                if deadline is not None:
+                    deadline.check()
+                if not raw:
+                    usage = getattr(chunk, "usage", None) or usage
+                content = chunk if raw else _delta_content(chunk)
+                if content:
+                    if record is not None:
+                        record.delta_received()
+                    yield content
+        except GeneratorExit:
+            raise
+        except BaseException as exc:
+            error = self._stream_error(exc, deadline, cancel)
+            if error is exc:
+                raise
+            raise error from exc
+        finally:
+            if forget is not None:
+                forget()
+            # Release the connection and scheduler slot even if the caller stops iterating early
+            stream.close()
+            self._release_held(slots, self._stream_tokens(stream, usage))
+            if record is not None:
+                record.generation_done()
+                metrics.hub.finish(record, error)
+
+
+class AsyncLLMProxy(BaseLLMProxy):
+    """Asyncio LLM proxy, many requests can be in flight on a single event loop"""
+
+    def __init__(self, encrypted_key: str, max_concurrency: Optional[int] = None, **options: Any):
+        """
+        Initialize async LLM proxy
+
+        Args:
+            encrypted_key: Encrypted LLM configuration key
+            max_concurrency: Maximum requests this proxy keeps in flight, None for no limit
+            options: Any BaseLLMProxy argument (pool, response_cache, retry_policy, ...)
+        """
+        super().__init__(encrypted_key, **options)
+        self.max_concurrency = max_concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @property
+    def client(self) -> "AsyncOpenAI":
+        """Pooled async client for the running event loop"""
+        return self.pool.get_async_client(self.config)
+
+    def _get_semaphore(self) -> Optional[asyncio.Semaphore]:
+        """Create the concurrency semaphore lazily, inside the event loop"""
+        if self.max_concurrency is not None and self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def _asend(self,
+                     kwargs: Dict[str, Any],
+                     record: Optional[metrics.RequestRecord] = None,
+                     tried: Optional[List[BackendState]] = None,
+                     deadline: Optional[Deadline] = None,
+                     cancel: Optional[CancelToken] = None,
+                     slots: Optional[List[Held]] = None,
+                     **options: Any) -> Any:
+        """
+        Make one upstream attempt on the backend chosen by the load balancer
+
+        Args:
+            kwargs: Request parameters from _build_request
+            record: Metrics record of the request, if instrumented
+            tried: Backends already serving the request, the pick avoids them and is added
+            deadline: Deadline of the call, bounding the scheduler and rate limit waits and the attempt's timeouts
+            cancel: Token cancelling the call
+            slots: Scheduler slots and rate limit reservations held by a stream are added here, to be
+                released when it is closed
+            options: Extra arguments for chat.completions.create, e.g. stream, and raw to get the
+                response body unparsed from the native adapter
+
+        Returns:
+            Completion, or stream when streaming
+        """
+        if cancel is not None:
+            cancel.check()
+        if deadline is not None:
+            deadline.check()
+        backend = self.balancer.pick(tried)
+        if tried is not None:
+            tried.append(backend)
+        # Fail fast while the circuit is open, the probe itself is only taken once the call is admitted
+        backend.breaker.check()
+
+        # Queue for rate limit budget rather than provoke a 429. Budget comes first, a request waiting
+        # for it must not hold a concurrency or scheduler slot that another request could use
+        limiter = self._limiter(backend)
+        estimated = 0
+        if limiter is not None:
+            estimated = estimate_tokens(kwargs["messages"], kwargs.get("max_tokens"))
+            wait = self.rate_limit_wait if deadline is None else deadline.cap(self.rate_limit_wait)
+            waited = await limiter.aacquire(estimated, wait)
+            if record is not None:
+                record.add("queue", waited)
+
+        # Take a concurrency slot, then wait for a slot among the API key's calls in flight, in priority
+        # and fair share order. Both are held by the attempt and then by a stream it opens, never
+        # during backoff
+        semaphore = self._get_semaphore()
+        scheduler = self._scheduler(backend)
+        admitted: List[Union[Slot, asyncio.Semaphore]] = []
+        try:
+            if semaphore is not None:
+                await semaphore.acquire()
+                admitted.append(semaphore)
+            if scheduler is not None:
+                slot = await scheduler.aacquire(self.tenant, self.priority, self.share, self._cost(kwargs), deadline,
+                                                cancel)
+                admitted.append(slot)
+                self._scheduled(record, slot)
+        except BaseException:
+            # Shed or cancelled, the request never went out
+            for item in admitted:
+                item.release()
+            if limiter is not None:
+                limiter.refund(estimated, request=True)
+            raise
+        try:
+            result = await self._acall_backend(backend, kwargs, record, deadline, slots, limiter, estimated, **options)
+        except BaseException:
+            for item in admitted:
+                item.release()
+            raise
+        for item in admitted:
+            self._hold(item, slots, options.get("stream", False))
+        return result
+
+    async def _acall_backend(self,
+                             backend: BackendState,
+                             kwargs: Dict[str, Any],
+                             record: Optional[metrics.RequestRecord],
+                             deadline: Optional[Deadline],
+                             slots: Optional[List[Held]],
+                             limiter: Optional[RateLimiter],
+                             estimated: int,
+                             **options: Any) -> Any:
+        """Send an admitted attempt, holding estimated tokens of limiter's budget, to its backend, see _asend"""
+        # Raw calls skip the SDK, which would parse the response
+        raw = options.pop("raw", False)
+        adapter = self._raw_adapter() if raw else self.adapter
+        if adapter is None:
+            client = self.pool.get_async_client(backend.config)
         else:
-            raise NotImplementedError(f"Chat functionality not yet implemented for {self.config.provider}") 
\ No newline at end of file
+            http_client = self.pool.get_async_http_client()
+
+        stream = options.get("stream", False)
+        try:
+            prepared = self._prepare(backend, kwargs)
+            timeout = None if deadline is None else deadline.http_timeout(self.pool.timeouts)
+            if timeout is not None and adapter is None:
+                options["timeout"] = timeout
+            # SDK releases whose post() cannot send the precompiled body go through create()
+            sdk_post = adapter is None and self.fast_path and _posts_content(type(client))
+            if sdk_post:
+                # Loaded with the first call, the time it takes is not the backend's
+                completion_cls, _, stream_cls = _sdk_types()
+            if self._stream_usage(backend, prepared, stream, raw):
+                # The final chunk then reports usage, which rate limiting reconciles the reservation to
+                if adapter is None and not sdk_post:
+                    options["extra_body"] = {"stream_options": STREAM_USAGE}
+                else:
+                    prepared = dict(prepared, stream_options=STREAM_USAGE)
+            # The probe is taken once nothing but the call itself can fail, a RateLimitTimeout or a
+            # DeadlineExceeded before it is sent must not keep it
+            backend.breaker.before_request()
+        except BaseException:
+            # Nothing was sent, the request and its tokens go back to the budget
+            if limiter is not None:
+                limiter.refund(estimated, request=True)
+            raise
+        started = backend.start()
+        token = metrics.bind(record)
+        try:
+            if sdk_post:
+                result = await client.post(cast_to=completion_cls, stream=stream, stream_cls=stream_cls,
+                                           **self._sdk_post(backend, prepared, stream, timeout))
+            elif adapter is None:
+                result = await client.chat.completions.create(**prepared, **options)
+            else:
+                result = await adapter.asend(http_client, backend.config, prepared, stream=stream,
+                                             compiled=self._compiled(backend, prepared, stream, adapter),
+                                             timeout=timeout, raw=raw)
+        except BaseException as exc:
+            metrics.unbind(token)
+            if limiter is not None:
+                limiter.refund(estimated)
+            error = self._attempt_failed(backend, started, exc, deadline)
+            if error is exc:
+                raise
+            raise error from exc
+        metrics.unbind(token)
+        self.balancer.finish(backend, started)
+        backend.breaker.record(None)
+        if limiter is not None:
+            if stream and slots is not None:
+                # A stream's usage is known once it ends, its reservation is reconciled when it is closed
+                slots.append(Reservation(limiter, estimated))
+            else:
+                limiter.reconcile(estimated, self._usage_tokens(result))
+        if record is not None and not options.get("stream"):
+            record.generation_done()
+            record.set_usage(getattr(result, "usage", None))
+        return result
+
+    async def asend_message(self, message: str, model: Optional[str] = None) -> str:
+        """
+        Send a single message to the LLM and get a response
+
+        Args:
+            message: User message
+            model: Optional model name, if not provided uses default model from configuration
+
+        Returns:
+            LLM response text
+        """
+        return await self.achat([{"role": "user", "content": message}], model)
+
+    async def achat(self,
+                    messages: List[Dict[str, Any]],
+                    model: Optional[str] = None,
+                    temperature: float = 0.7,
+                    max_tokens: Optional[int] = None,
+                    use_cache: bool = True,
+                    timeout: Union[None, float, Deadline] = None,
+                    cancel: Optional[CancelToken] = None) -> str:
+        """
+        Send chat messages to LLM and get a response
+
+        Args:
+            messages: List of messages
+            model: Optional model name
+            temperature: Temperature parameter
+            max_tokens: Maximum tokens to generate
+            use_cache: False bypasses the response cache for this call
+            timeout: Seconds the call may take including retries, or a Deadline shared with other calls
+            cancel: Token cancelling the call from another thread
+
+        Returns:
+            LLM response text
+        """
+        started = time.perf_counter()
+        kwargs = self._build_request(messages, model, temperature, max_tokens)
+        cache_key, cached = self._cache_lookup(kwargs, use_cache)
+        record = self._start_record(kwargs, started)
+        if cached is not None:
+            if record is not None:
+                record.cached = True
+                metrics.hub.finish(record)
+            return cached
+
+        deadline = Deadline.of(timeout)
+        tried = [] if self.hedge is not None and self.hedge.alternate else None
+
+        async def attempt(target: Optional[metrics.RequestRecord] = record):
+            return await self._asend(kwargs, target, tried, deadline, cancel)
+
+        def retried(call):
+            # Backoff ends early when the call is cancelled
+            return acall_with_retries(call, self.retry_policy, sleep=asyncio.sleep if cancel is None else cancel.asleep,
+                                      deadline=deadline)
+
+        sent = []
+
+        async def send():
+            sent.append(True)
+            if self.hedge is None:
+                return await retried(attempt)
+            # The hedge is a single extra request, it is not retried, and leaves the record alone
+            own = self._attempt_record(record)
+            try:
+                return await hedged_acall(self.hedge, self._hedge_key(kwargs),
+                                          lambda hedge: attempt(None) if hedge else retried(lambda: attempt(own)),
+                                          self._hedge_outcome(record))
+            finally:
+                self._merge_attempt(record, own)
+
+        flight_key = self._flight_key(kwargs, cache_key, deadline, cancel)
+        try:
+            completion = await (send() if flight_key is None else self.single_flight.ado(flight_key, send))
+            if record is not None and not sent:
+                record.coalesced = True
+        except BaseException as exc:
+            metrics.hub.finish(record, exc)
+            raise
+        metrics.hub.finish(record)
+
+        content = _completion_content(completion)
+        self._cache_store(cache_key, content)
+        return content
+
+    def achat_stream(self,
+                     messages: List[Dict[str, Any]],
+                     model: Optional[str] = None,
+                     temperature: float = 0.7,
+                     max_tokens: Optional[int] = None,
+                     timeout: Union[None, float, Deadline] = None,
+                     cancel: Optional[CancelToken] = None) -> AsyncIterator[str]:
+        """
+        Send chat messages to LLM and yield the response text as it is generated
+
+        Args:
+            messages: List of messages
+            model: Optional model name
+            temperature: Temperature parameter
+            max_tokens: Maximum tokens to generate
+            timeout: Seconds the stream may take from start to end, or a Deadline shared with other calls
+            cancel: Token cancelling the stream, checked between chunks, cancelling the task works at once
+
+        Returns:
+            Async iterator of response text deltas
+        """
+        return self._astream(messages, model, temperature, max_tokens, timeout, cancel)
+
+    def achat_raw(self,
+                  messages: List[Dict[str, Any]],
+                  model: Optional[str] = None,
+                  temperature: float = 0.7,
+                  max_tokens: Optional[int] = None,
+                  stream: bool = False,
+                  timeout: Union[None, float, Deadline] = None,
+                  cancel: Optional[CancelToken] = None) -> Union[Awaitable[bytes], AsyncIterator[bytes]]:
+        """
+        Send chat messages to LLM and get the upstream response body as is, see LLMProxy.chat_raw
+
+        Args:
+            messages: List of messages
+            model: Optional model name
+            temperature: Temperature parameter
+            max_tokens: Maximum tokens to generate
+            stream: Request a streamed response and iterate over its server-sent event bytes
+            timeout: Seconds the call may take including retries, or a Deadline shared with other calls
+            cancel: Token cancelling the call
+
+        Returns:
+            Awaitable response body, or async iterator of its chunks when streaming
+        """
+        if stream:
+            return self._astream(messages, model, temperature, max_tokens, timeout, cancel, raw=True)
+        return self._araw(messages, model, temperature, max_tokens, timeout, cancel)
+
+    async def _araw(self,
+                    messages: List[Dict[str, Any]],
+                    model: Optional[str],
+                    temperature: float,
+                    max_tokens: Optional[int],
+                    timeout: Union[None, float, Deadline],
+                    cancel: Optional[CancelToken]) -> bytes:
+        """Unstreamed call of achat_raw()"""
+        started = time.perf_counter()
+        kwargs = self._build_request(messages, model, temperature, max_tokens)
+        record = self._start_record(kwargs, started)
+        deadline = Deadline.of(timeout)
+
+        try:
+            body = await acall_with_retries(lambda: self._asend(kwargs, record, None, deadline, cancel, raw=True),
+                                            self.retry_policy,
+                                            sleep=asyncio.sleep if cancel is None else cancel.asleep,
+                                            deadline=deadline)
+        except BaseException as exc:
+            metrics.hub.finish(record, exc)
+            raise
+        metrics.hub.finish(record)
+        return body
+
+    async def _astream(self,
+                       messages: List[Dict[str, Any]],
+                       model: Optional[str],
+                       temperature: float,
+                       max_tokens: Optional[int],
+                       timeout: Union[None, float, Deadline],
+                       cancel: Optional[CancelToken],
+                       raw: bool = False) -> AsyncIterator[Any]:
+        """Streamed call of achat_stream(), yielding body chunks instead of text deltas when raw"""
+        started = time.perf_counter()
+        kwargs = self._build_request(messages, model, temperature, max_tokens)
+        record = self._start_record(kwargs, started, stream=True)
+        deadline = Deadline.of(timeout)
+        slots: List[Held] = []
+
+        def attempt():
+            return self._asend(kwargs, record, None, deadline, cancel, slots, stream=True, raw=raw)
+
+        error = None
+        stream = usage = None
+        try:
+            stream = await acall_with_retries(attempt, self.retry_policy,
+                                              sleep=asyncio.sleep if cancel is None else cancel.asleep,
+                                              deadline=deadline)
+            try:
+                async for chunk in stream:
+                    if cancel is not None:
+                        cancel.check()
+                    if deadline is not None:
+                        deadline.check()
+                    if not raw:
+                        usage = getattr(chunk, "usage", None) or usage
+                    content = chunk if raw else _delta_content(chunk)
+                    if content:
+                        if record is not None:
+                            record.delta_received()
+                        yield content
+            finally:
+                await stream.close()
+                if record is not None:
+                    record.generation_done()
+        except GeneratorExit:
+            raise
+        except BaseException as exc:
+            error = self._stream_error(exc, deadline, cancel)
+            if error is exc:
+                raise
+            raise error from exc
+        finally:
+            self._release_held(slots, self._stream_tokens(stream, usage))
+            metrics.hub.finish(record, error)
+
+    async def aclose(self) -> None:
+        """Close connections of a dedicated pool, the shared default pool stays open"""
+        if self.pool is not default_pool:
+            await self.pool.aclose()
+
+    async def __aenter__(self) -> "AsyncLLMProxy":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.aclose()
+
+
+def _completion_content(completion: Any) -> Optional[str]:
+    """Extract the response text from an SDK or native adapter completion"""
+    if isinstance(completion, Completion):
+        return completion.content
+    return completion.choices[0].message.content
+
+
+def _delta_content(chunk: Any) -> Optional[str]:
+    """Extract the text delta from a streamed chat completion chunk"""
+    # Native adapter streams yield the text itself
+    if isinstance(chunk, str):
+        return chunk
+    if not chunk.choices:
+        return None
+    return chunk.choices[0].delta.content
@@ -0,0 +1,414 @@
+"""
+Metrics - Per-request phase timings, counters and a Prometheus text exposition
+"""
+
+import contextvars
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from . import resilience, scheduler
+
+
+# Phases a request is broken into, in seconds:
+#   decrypt     key decryption when the proxy was constructed, reported with its first request
+#   build       request building and response cache lookup
+#   schedule    waiting in the scheduler for a slot among the API key's calls in flight
+#   queue       waiting for rate limit budget
+#   connect     TCP connect and TLS handshake, zero when a pooled connection is reused
+#   ttfb        upstream call started until response headers arrive, includes connect
+#   first_token upstream call started until the first streamed content delta
+#   generation  first streamed delta (or response headers) until the response is complete
+#   total       whole call as seen by the caller
+PHASES = ("decrypt", "build", "schedule", "queue", "connect", "ttfb", "first_token", "generation", "total")
+
+# Record of the request whose upstream call is running in the current thread or task
+_current: "contextvars.ContextVar[Optional[RequestRecord]]" = contextvars.ContextVar(
+    "llm_proxy_request_record", default=None
+)
+
+
+class RequestRecord:
+    """Timings and outcome of one proxied request"""
+
+    __slots__ = ("provider", "model", "model_label", "stream", "status", "error", "cached", "coalesced", "hedge",
+                 "priority", "request", "phases", "prompt_tokens", "completion_tokens", "started", "_marks")
+
+    def __init__(self, provider: str, model: str, stream: bool = False, started: Optional[float] = None,
+                 model_label: Optional[str] = None):
+        self.provider = provider
+        self.model = model
+        # Model as labelled in aggregated metrics, see model_label()
+        self.model_label = model if model_label is None else model_label
+        self.stream = stream
+        self.status = "ok"
+        self.error: Optional[str] = None
+        self.cached = False
+        # Answered by an identical request already in flight
+        self.coalesced = False
+        # "won" or "lost" once a hedge was raced against the request
+        self.hedge: Optional[str] = None
+        # Scheduler priority class, set when the request went through a scheduler
+        self.priority: Optional[str] = None
+        # Parameters the request was sent with (model, messages, sampling), by reference, for hooks to inspect
+        self.request: Optional[Dict[str, Any]] = None
+        self.phases: Dict[str, float] = {}
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.started = started if started is not None else time.perf_counter()
+        self._marks: Dict[str, float] = {}
+
+    def add(self, phase: str, seconds: float) -> None:
+        """Accumulate time into a phase, retries add up"""
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def mark(self, name: str) -> float:
+        """Remember the current time under name"""
+        now = time.perf_counter()
+        self._marks[name] = now
+        return now
+
+    def since(self, name: str) -> float:
+        """Seconds since a mark, zero if it was never set"""
+        mark = self._marks.get(name)
+        return time.perf_counter() - mark if mark is not None else 0.0
+
+    def trace(self, event: str, info: Dict[str, Any]) -> None:
+        """httpcore trace callback, collects connection setup time"""
+        if event in ("connection.connect_tcp.started", "connection.start_tls.started"):
+            self.mark("connect")
+        elif event in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+            self.add("connect", self.since("connect"))
+
+    async def atrace(self, event: str, info: Dict[str, Any]) -> None:
+        """Async httpcore trace callback"""
+        self.trace(event, info)
+
+    def delta_received(self) -> None:
+        """Note a streamed content delta, the first one ends the first_token phase"""
+        if "first" not in self._marks:
+            self.add("first_token", self.since("sent"))
+            self.mark("first")
+
+    def generation_done(self) -> None:
+        """Close the generation phase once the whole response has been read"""
+        started = self._marks.get("first", self._marks.get("headers"))
+        if started is not None:
+            self.add("generation", time.perf_counter() - started)
+
+    def attempt(self) -> "RequestRecord":
+        """Blank record of the same request for one attempt of it, folded back with merge()"""
+        return RequestRecord(self.provider, self.model, self.stream, self.started, self.model_label)
+
+    def merge(self, attempt: "RequestRecord") -> None:
+        """Take the phases, token counts and priority of an attempt that has ended"""
+        for phase, seconds in attempt.phases.items():
+            self.add(phase, seconds)
+        self.prompt_tokens = attempt.prompt_tokens or self.prompt_tokens
+        self.completion_tokens = attempt.completion_tokens or self.completion_tokens
+        if attempt.priority is not None:
+            self.priority = attempt.priority
+
+    def set_usage(self, usage: Any) -> None:
+        """Take token counts from a completion's usage object or dict"""
+        if usage is None:
+            return
+        if isinstance(usage, dict):
+            self.prompt_tokens = usage.get("prompt_tokens") or 0
+            self.completion_tokens = usage.get("completion_tokens") or 0
+        else:
+            self.prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+            self.completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+
+
+class MetricsHub:
+    """Dispatches finished request records to registered hooks"""
+
+    def __init__(self):
+        self._hooks: List[Callable[[RequestRecord], None]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        """Whether any hook is registered, requests are only instrumented if so"""
+        return bool(self._hooks)
+
+    def add_hook(self, hook: Callable[[RequestRecord], None]) -> None:
+        """Register a callable receiving every finished RequestRecord"""
+        with self._lock:
+            if hook not in self._hooks:
+                self._hooks = self._hooks + [hook]
+
+    def remove_hook(self, hook: Callable[[RequestRecord], None]) -> None:
+        """Unregister a hook"""
+        with self._lock:
+            self._hooks = [h for h in self._hooks if h != hook]
+
+    def start(self, provider: str, model: str, stream: bool = False,
+              started: Optional[float] = None, config: Any = None) -> Optional[RequestRecord]:
+        """Begin a record, None when no hooks are registered, config bounds its model label to the configured models"""
+        if not self._hooks:
+            return None
+        return RequestRecord(provider, model, stream, started, None if config is None else model_label(config, model))
+
+    def finish(self, record: Optional[RequestRecord], error: Optional[BaseException] = None) -> None:
+        """Complete a record and hand it to every hook"""
+        if record is None:
+            return
+        record.add("total", time.perf_counter() - record.started)
+        if error is not None:
+            record.status = "error"
+            record.error = type(error).__name__
+        for hook in self._hooks:
+            try:
+                hook(record)
+            except Exception:
+                # A broken exporter must not fail the request
+                pass
+
+
+def bind(record: Optional[RequestRecord]) -> Optional[contextvars.Token]:
+    """Make record current while its upstream call runs, pair with unbind"""
+    if record is None:
+        return None
+    record.mark("sent")
+    return _current.set(record)
+
+
+def unbind(token: Optional[contextvars.Token]) -> None:
+    """Undo bind"""
+    if token is not None:
+        _current.reset(token)
+
+
+def on_request(request: Any) -> None:
+    """httpx request hook, attaches the connection trace of the current record"""
+    record = _current.get()
+    if record is not None:
+        request.extensions["trace"] = record.trace
+
+
+def on_response(response: Any) -> None:
+    """httpx response hook, response headers have arrived"""
+    record = _current.get()
+    if record is not None:
+        record.add("ttfb", record.since("sent"))
+        record.mark("headers")
+
+
+async def aon_request(request: Any) -> None:
+    """Async httpx request hook"""
+    record = _current.get()
+    if record is not None:
+        request.extensions["trace"] = record.atrace
+
+
+async def aon_response(response: Any) -> None:
+    """Async httpx response hook"""
+    on_response(response)
+
+
+# Label of models the configuration does not name, callers choose the model but must not choose label values
+OTHER_MODEL = "other"
+
+
+def model_label(config: Any, model: str) -> str:
+    """
+    Label a request's model is aggregated under, bounding the label values to the configured models
+
+    Args:
+        config: Configuration the request is sent with
+        model: Model the caller asked for
+
+    Returns:
+        The model if the configuration or one of its backends names it, else OTHER_MODEL
+    """
+    if model == config.model or any(model == backend.model for backend in config.backends or ()):
+        return model
+    return OTHER_MODEL
+
+
+# Histogram buckets in seconds, spanning in-process overhead to long generations
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _labels(**labels: Any) -> str:
+    escaped = []
+    for name, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        escaped.append(f'{name}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+def _observe(histograms: Dict[Any, List[float]], key: Any, seconds: float) -> None:
+    """Count a duration into a histogram of BUCKETS"""
+    histogram = histograms.get(key)
+    if histogram is None:
+        # Bucket counts, then sum and count
+        histogram = histograms[key] = [0] * len(BUCKETS) + [0.0, 0]
+    for i, bound in enumerate(BUCKETS):
+        if seconds <= bound:
+            histogram[i] += 1
+    histogram[-2] += seconds
+    histogram[-1] += 1
+
+
+class PrometheusCollector:
+    """Hook aggregating records into counters and histograms, rendered as Prometheus text"""
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests: Dict[Tuple[str, str, str], int] = {}
+        self.errors: Dict[Tuple[str, str, str], int] = {}
+        self.tokens: Dict[Tuple[str, str, str], int] = {}
+        self.hedges: Dict[Tuple[str, str, str], int] = {}
+        self.histograms: Dict[Tuple[str, str, str], List[float]] = {}
+        self.schedule_waits: Dict[str, List[float]] = {}
+
+    def __call__(self, record: RequestRecord) -> None:
+        status = "cached" if record.cached else "coalesced" if record.coalesced else record.status
+        with self._lock:
+            key = (record.provider, record.model_label, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            if record.error is not None:
+                key = (record.provider, record.model_label, record.error)
+                self.errors[key] = self.errors.get(key, 0) + 1
+            for kind, count in (("prompt", record.prompt_tokens), ("completion", record.completion_tokens)):
+                if count:
+                    key = (record.provider, record.model_label, kind)
+                    self.tokens[key] = self.tokens.get(key, 0) + count
+            if record.hedge is not None:
+                key = (record.provider, record.model_label, record.hedge)
+                self.hedges[key] = self.hedges.get(key, 0) + 1
+            for phase, seconds in record.phases.items():
+                _observe(self.histograms, (record.provider, record.model_label, phase), seconds)
+            if record.priority is not None and "schedule" in record.phases:
+                _observe(self.schedule_waits, record.priority, record.phases["schedule"])
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            lines.append("# HELP llm_proxy_requests_total Proxied chat requests")
+            lines.append("# TYPE llm_proxy_requests_total counter")
+            for (provider, model, status), count in sorted(self.requests.items()):
+                lines.append(f"llm_proxy_requests_total{_labels(provider=provider, model=model, status=status)} {count}")
+
+            lines.append("# HELP llm_proxy_errors_total Failed chat requests by error type")
+            lines.append("# TYPE llm_proxy_errors_total counter")
+            for (provider, model, error), count in sorted(self.errors.items()):
+                lines.append(f"llm_proxy_errors_total{_labels(provider=provider, model=model, error=error)} {count}")
+
+            lines.append("# HELP llm_proxy_tokens_total Tokens reported by upstream usage")
+            lines.append("# TYPE llm_proxy_tokens_total counter")
+            for (provider, model, kind), count in sorted(self.tokens.items()):
+                lines.append(f"llm_proxy_tokens_total{_labels(provider=provider, model=model, type=kind)} {count}")
+
+            lines.append("# HELP llm_proxy_hedges_total Hedge requests sent, by whether they beat the original")
+            lines.append("# TYPE llm_proxy_hedges_total counter")
+            for (provider, model, outcome), count in sorted(self.hedges.items()):
+                lines.append(f"llm_proxy_hedges_total{_labels(provider=provider, model=model, outcome=outcome)} {count}")
+
+            lines.append("# HELP llm_proxy_phase_seconds Time spent per request phase")
+            lines.append("# TYPE llm_proxy_phase_seconds histogram")
+            for (provider, model, phase), histogram in sorted(self.histograms.items()):
+                for bound, count in zip(BUCKETS, histogram):
+                    labels = _labels(provider=provider, model=model, phase=phase, le=bound)
+                    lines.append(f"llm_proxy_phase_seconds_bucket{labels} {count}")
+                labels = _labels(provider=provider, model=model, phase=phase, le="+Inf")
+                lines.append(f"llm_proxy_phase_seconds_bucket{labels} {histogram[-1]}")
+                labels = _labels(provider=provider, model=model, phase=phase)
+                lines.append(f"llm_proxy_phase_seconds_sum{labels} {histogram[-2]}")
+                lines.append(f"llm_proxy_phase_seconds_count{labels} {histogram[-1]}")
+
+            lines.append("# HELP llm_proxy_scheduler_wait_seconds Time requests queued for a scheduler slot")
+            lines.append("# TYPE llm_proxy_scheduler_wait_seconds histogram")
+            for priority, histogram in sorted(self.schedule_waits.items()):
+                for bound, count in zip(BUCKETS, histogram):
+                    labels = _labels(priority=priority, le=bound)
+                    lines.append(f"llm_proxy_scheduler_wait_seconds_bucket{labels} {count}")
+                labels = _labels(priority=priority, le="+Inf")
+                lines.append(f"llm_proxy_scheduler_wait_seconds_bucket{labels} {histogram[-1]}")
+                labels = _labels(priority=priority)
+                lines.append(f"llm_proxy_scheduler_wait_seconds_sum{labels} {histogram[-2]}")
+                lines.append(f"llm_proxy_scheduler_wait_seconds_count{labels} {histogram[-1]}")
+
+        retries = resilience.default_retry_policy.stats()
+        lines.append("# HELP llm_proxy_upstream_attempts_total Upstream attempts including retries")
+        lines.append("# TYPE llm_proxy_upstream_attempts_total counter")
+        lines.append(f"llm_proxy_upstream_attempts_total {retries['attempts']}")
+        lines.append("# HELP llm_proxy_retries_total Retried upstream attempts")
+        lines.append("# TYPE llm_proxy_retries_total counter")
+        lines.append(f"llm_proxy_retries_total {retries['retries']}")
+        lines.append("# HELP llm_proxy_circuit_open Whether the endpoint circuit breaker is open")
+        lines.append("# TYPE llm_proxy_circuit_open gauge")
+        for endpoint, state in sorted(resilience.default_breakers.snapshot().items()):
+            lines.append(f"llm_proxy_circuit_open{_labels(endpoint=endpoint)} {int(state['state'] == 'open')}")
+
+        schedulers = sorted(scheduler.default_schedulers.snapshot().items())
+        lines.append("# HELP llm_proxy_scheduler_inflight Calls in flight through a scheduled API key")
+        lines.append("# TYPE llm_proxy_scheduler_inflight gauge")
+        for endpoint, stats in schedulers:
+            lines.append(f"llm_proxy_scheduler_inflight{_labels(endpoint=endpoint)} {stats['inflight']}")
+        lines.append("# HELP llm_proxy_scheduler_queued Requests waiting for a scheduler slot")
+        lines.append("# TYPE llm_proxy_scheduler_queued gauge")
+        for endpoint, stats in schedulers:
+            for priority, count in sorted(stats["queued"].items()):
+                lines.append(f"llm_proxy_scheduler_queued{_labels(endpoint=endpoint, priority=priority)} {count}")
+        lines.append("# HELP llm_proxy_scheduler_shed_total Requests shed by the scheduler")
+        lines.append("# TYPE llm_proxy_scheduler_shed_total counter")
+        for endpoint, stats in schedulers:
+            for key, count in sorted(stats["shed"].items()):
+                priority, reason = key.split(":")
+                labels = _labels(endpoint=endpoint, priority=priority, reason=reason)
+                lines.append(f"llm_proxy_scheduler_shed_total{labels} {count}")
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide hub used by the proxies
+hub = MetricsHub()
+
+# Collector backing the /metrics endpoint, registered by enable_prometheus()
+prometheus = PrometheusCollector()
+
+
+def enable_prometheus() -> PrometheusCollector:
+    """Start aggregating requests into the shared Prometheus collector"""
+    hub.add_hook(prometheus)
+    return prometheus
+
+
+def start_http_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """
+    Serve the Prometheus collector on /metrics from a background thread
+
+    Args:
+        port: Port to listen on
+        host: Interface to bind
+
+    Returns:
+        Running server, call shutdown() to stop it
+    """
+    collector = enable_prometheus()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = collector.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", PrometheusCollector.CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
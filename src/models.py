@@ -16,6 +16,25 @@ class LLMProvider(str, Enum):
     CUSTOM = "custom"
 
 
+class Backend(BaseModel):
+    """One upstream account or endpoint serving a configuration"""
+    base_url: str
+    api_key: str
+    model: Optional[str] = None
+    weight: float = 1.0
+    headers: Optional[Dict[str, str]] = Field(default_factory=dict)
+    # Provider limits of this backend's API key, default to the configuration's
+    rpm: Optional[int] = None
+    tpm: Optional[int] = None
+    max_inflight: Optional[int] = None
+
+    @validator('weight')
+    def validate_weight(cls, v):
+        if v <= 0:
+            raise ValueError("Backend weight must be positive")
+        return v
+
+
 class LLMConfig(BaseModel):
     """LLM configuration model"""
     provider: LLMProvider
@@ -24,6 +43,18 @@ class LLMConfig(BaseModel):
     model: str
     headers: Optional[Dict[str, str]] = Field(default_factory=dict)
     extra_body: Optional[Dict[str, Any]] = Field(default_factory=dict)
+    # When set, requests are balanced across these instead of base_url/api_key
+    backends: Optional[List[Backend]] = Field(default_factory=list)
+    # Requests and tokens per minute allowed for the API key, enforced client-side when set
+    rpm: Optional[int] = None
+    tpm: Optional[int] = None
+    # Calls allowed in flight through the API key, further requests are queued by the scheduler
+    max_inflight: Optional[int] = None
+    # Scheduler priority class of this configuration's requests and its weight against other configurations
+    priority: Optional[str] = None
+    share: Optional[float] = None
+    # Ask OpenAI-compatible upstreams to end parsed streams with a usage chunk, for servers accepting stream_options
+    stream_usage: bool = False
     
     class Config:
         use_enum_values = True
@@ -34,6 +65,30 @@ class LLMConfig(BaseModel):
             raise ValueError(f"Unsupported provider: {v}")
         return v
 
+    @validator('share')
+    def validate_share(cls, v):
+        if v is not None and v <= 0:
+            raise ValueError("Share must be positive")
+        return v
+
+    def backend_configs(self) -> List["LLMConfig"]:
+        """Expand into one single-endpoint configuration per backend"""
+        if not self.backends:
+            return [self]
+        return [
+            self.model_copy(update={
+                "base_url": backend.base_url,
+                "api_key": backend.api_key,
+                "model": backend.model or self.model,
+                "headers": {**(self.headers or {}), **(backend.headers or {})},
+                "rpm": backend.rpm if backend.rpm is not None else self.rpm,
+                "tpm": backend.tpm if backend.tpm is not None else self.tpm,
+                "max_inflight": backend.max_inflight if backend.max_inflight is not None else self.max_inflight,
+                "backends": [],
+            })
+            for backend in self.backends
+        ]
+
 
 class Message(BaseModel):
     """Chat message model"""
@@ -0,0 +1,277 @@
+"""
+Rate Limiting - Client-side RPM/TPM token buckets that queue requests instead of provoking 429s
+"""
+
+import asyncio
+import hashlib
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from .cache import TTLCache
+
+
+class RateLimitTimeout(Exception):
+    """Raised when a request would have to wait longer than allowed for rate limit budget"""
+
+    def __init__(self, wait: float, max_wait: float):
+        super().__init__(f"Rate limit budget available in {wait:.1f}s, longer than the {max_wait:.1f}s allowed")
+        self.wait = wait
+        self.max_wait = max_wait
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at rate per second up to capacity"""
+
+    def __init__(self, rate: float, capacity: float, timer: Callable[[], float] = time.monotonic):
+        """
+        Initialize bucket
+
+        Args:
+            rate: Tokens added per second
+            capacity: Maximum tokens held, the largest burst allowed
+            timer: Monotonic clock, replaceable in tests
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._timer = timer
+        self._updated = timer()
+
+    def _refill(self) -> None:
+        now = self._timer()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount tokens are available, after earlier reservations"""
+        self._refill()
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    def consume(self, amount: float) -> None:
+        """Take tokens, the balance may go negative to queue later reservations behind this one"""
+        self.tokens -= amount
+
+    def refund(self, amount: float) -> None:
+        """Return tokens, e.g. when a request used fewer than reserved"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def resize(self, rate: float, capacity: float) -> None:
+        """Change rate and capacity, keeping the current balance up to the new capacity"""
+        self._refill()
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = min(self.capacity, self.tokens)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute budget of one API key"""
+
+    def __init__(self,
+                 rpm: Optional[int] = None,
+                 tpm: Optional[int] = None,
+                 max_wait: float = 30.0,
+                 timer: Callable[[], float] = time.monotonic):
+        """
+        Initialize rate limiter
+
+        Args:
+            rpm: Requests per minute, None for no request limit
+            tpm: Tokens per minute, None for no token limit
+            max_wait: Longest a request may queue for budget before RateLimitTimeout
+            timer: Monotonic clock, replaceable in tests
+        """
+        self.max_wait = max_wait
+        self._timer = timer
+        self._lock = threading.Lock()
+        self.requests: Optional[TokenBucket] = None
+        self.tokens: Optional[TokenBucket] = None
+        self.configure(rpm, tpm)
+        self.queued = 0
+        self.rejected = 0
+        self.waited = 0.0
+
+    def configure(self, rpm: Optional[int], tpm: Optional[int]) -> None:
+        """Change limits, existing buckets are resized and keep their balance so a change grants no new burst"""
+        with self._lock:
+            self.rpm = rpm
+            self.tpm = tpm
+            self.requests = self._bucket(self.requests, rpm)
+            self.tokens = self._bucket(self.tokens, tpm)
+
+    def _bucket(self, bucket: Optional[TokenBucket], per_minute: Optional[int]) -> Optional[TokenBucket]:
+        if per_minute is None:
+            return None
+        if bucket is None:
+            return TokenBucket(per_minute / 60.0, per_minute, self._timer)
+        if bucket.capacity != per_minute:
+            bucket.resize(per_minute / 60.0, per_minute)
+        return bucket
+
+    def reserve(self, estimated_tokens: int = 0, max_wait: Optional[float] = None) -> float:
+        """
+        Reserve budget for one request
+
+        Args:
+            estimated_tokens: Tokens the request is expected to use
+            max_wait: Overrides the limiter's max_wait for this request
+
+        Returns:
+            Seconds the caller must wait before sending
+        """
+        max_wait = self.max_wait if max_wait is None else max_wait
+        with self._lock:
+            wait = 0.0
+            if self.requests is not None:
+                wait = self.requests.wait_time(1)
+            if self.tokens is not None and estimated_tokens:
+                wait = max(wait, self.tokens.wait_time(min(estimated_tokens, self.tokens.capacity)))
+            if wait > max_wait:
+                self.rejected += 1
+                raise RateLimitTimeout(wait, max_wait)
+            if self.requests is not None:
+                self.requests.consume(1)
+            if self.tokens is not None and estimated_tokens:
+                self.tokens.consume(estimated_tokens)
+            if wait > 0:
+                self.queued += 1
+                self.waited += wait
+            return wait
+
+    def acquire(self, estimated_tokens: int = 0, max_wait: Optional[float] = None) -> float:
+        """Reserve budget and block until it is available, returns the time waited"""
+        wait = self.reserve(estimated_tokens, max_wait)
+        if wait > 0:
+            try:
+                time.sleep(wait)
+            except BaseException:
+                # Interrupted while queued, the request never went out
+                self.refund(estimated_tokens, request=True)
+                raise
+        return wait
+
+    async def aacquire(self, estimated_tokens: int = 0, max_wait: Optional[float] = None) -> float:
+        """Reserve budget and wait without blocking the event loop, returns the time waited"""
+        wait = self.reserve(estimated_tokens, max_wait)
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except BaseException:
+                # Cancelled while queued, the request never went out
+                self.refund(estimated_tokens, request=True)
+                raise
+        return wait
+
+    def refund(self, estimated_tokens: int = 0, request: bool = False) -> None:
+        """
+        Give back budget reserved for a request that used none of it
+
+        Args:
+            estimated_tokens: Tokens reserved for the request
+            request: Also return the request itself, for requests never sent
+        """
+        with self._lock:
+            if request and self.requests is not None:
+                self.requests.refund(1)
+            if self.tokens is not None and estimated_tokens:
+                self.tokens.refund(estimated_tokens)
+
+    def reconcile(self, estimated_tokens: int, actual_tokens: Optional[int]) -> None:
+        """Correct the token budget once the response reports actual usage"""
+        if self.tokens is None or actual_tokens is None:
+            return
+        with self._lock:
+            difference = estimated_tokens - actual_tokens
+            if difference > 0:
+                self.tokens.refund(difference)
+            elif difference < 0:
+                self.tokens.consume(-difference)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return limits and queueing counters"""
+        with self._lock:
+            return {
+                "rpm": self.rpm,
+                "tpm": self.tpm,
+                "queued": self.queued,
+                "rejected": self.rejected,
+                "waited_seconds": self.waited,
+            }
+
+
+class Reservation:
+    """Tokens reserved for a streamed request, reconciled once the stream is closed and its usage known"""
+
+    def __init__(self, limiter: RateLimiter, estimated_tokens: int):
+        self.limiter = limiter
+        self.estimated_tokens = estimated_tokens
+        self._released = False
+
+    def release(self, actual_tokens: Optional[int] = None) -> None:
+        """Reconcile with the tokens the stream reported, the estimate stands if it reported none"""
+        if self._released:
+            return
+        self._released = True
+        self.limiter.reconcile(self.estimated_tokens, actual_tokens)
+
+
+def _smallest(current: Optional[int], requested: Optional[int]) -> Optional[int]:
+    """Stricter of two limits, None meaning no limit"""
+    if current is None or requested is None:
+        return requested if current is None else current
+    return min(current, requested)
+
+
+class LimiterRegistry:
+    """Rate limiters shared per (base_url, api_key), since providers enforce limits per key"""
+
+    def __init__(self, max_wait: float = 30.0, maxsize: int = 1024):
+        """
+        Initialize registry
+
+        Args:
+            max_wait: Longest a request may queue for budget, for every limiter
+            maxsize: Limiters kept, least recently used first out
+        """
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._limiters = TTLCache(maxsize=maxsize, ttl=None)
+
+    def get(self, base_url: str, api_key: str, rpm: Optional[int], tpm: Optional[int]) -> Optional[RateLimiter]:
+        """
+        Get the limiter of an API key, None when neither limit is set
+
+        Args:
+            base_url: Upstream base URL
+            api_key: API key the limits apply to
+            rpm: Requests per minute
+            tpm: Tokens per minute
+
+        Returns:
+            Shared limiter, holding the smallest limits any caller configured for the key
+        """
+        if rpm is None and tpm is None:
+            return None
+        # The API key is only kept hashed
+        key = (base_url, hashlib.sha256(api_key.encode()).hexdigest())
+        with self._lock:
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                limiter = RateLimiter(rpm, tpm, self.max_wait)
+                self._limiters.set(key, limiter)
+                return limiter
+            # Callers disagreeing on a key's limits must not flip it back and forth, the strictest one holds
+            rpm, tpm = _smallest(limiter.rpm, rpm), _smallest(limiter.tpm, tpm)
+            if limiter.rpm != rpm or limiter.tpm != tpm:
+                limiter.configure(rpm, tpm)
+        return limiter
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Return stats of every limiter, keyed by base URL"""
+        return {f"{base_url}#{index}": limiter.stats()
+                for index, ((base_url, _), limiter) in enumerate(self._limiters.items())}
+
+
+# Shared so every proxy using the same key draws from one budget
+default_limiters = LimiterRegistry()
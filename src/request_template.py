@@ -0,0 +1,142 @@
+"""
+Request Templates - The static part of each configuration's requests, computed once
+"""
+
+import hashlib
+import threading
+from typing import Any, Dict, List, Optional
+
+from .adapters import CompiledRequest, OpenAIAdapter, ProviderAdapter
+from .cache import TTLCache
+from .models import LLMConfig
+
+
+class SDKAdapter(OpenAIAdapter):
+    """Compiles bodies for the OpenAI SDK client's post(), which adds base URL and authentication itself"""
+
+    name = "sdk"
+
+    def request(self, endpoint, kwargs, stream):
+        _, _, body = super().request(endpoint, kwargs, stream)
+        return "/chat/completions", dict(kwargs.get("extra_headers") or {}), body
+
+
+sdk_adapter = SDKAdapter()
+
+
+class RequestTemplate:
+    """
+    Model, extra_body and headers of a configuration, merged once instead of on every call
+
+    Compiled requests (URL, headers and the JSON-encoded static body) are cached per endpoint,
+    model and stream flag, so a call only encodes its messages and sampling parameters.
+    """
+
+    def __init__(self, config: LLMConfig, maxsize: int = 256):
+        """
+        Initialize request template
+
+        Args:
+            config: Configuration the requests are built from
+            maxsize: Compiled requests kept, least recently used first out, callers choose the model
+        """
+        self.model = config.model
+        self.extra_body = dict(config.extra_body or {})
+        self.extra_headers = config.headers or {}
+        self._compiled = TTLCache(maxsize=maxsize, ttl=None)
+
+    def build(self,
+              messages: List[Dict[str, Any]],
+              model: Optional[str] = None,
+              temperature: float = 0.7,
+              max_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Build request parameters, see BaseLLMProxy._build_request
+
+        Returns:
+            Request parameters including extra_headers, in OpenAI form for every provider
+        """
+        kwargs = {"model": model or self.model, "messages": messages, "temperature": temperature}
+        if max_tokens is not None:
+            kwargs["max_tokens"] = max_tokens
+        if self.extra_body:
+            kwargs.update(self.extra_body)
+        kwargs["extra_headers"] = self.extra_headers
+        return kwargs
+
+    def compile(self, adapter: ProviderAdapter, endpoint: LLMConfig, kwargs: Dict[str, Any],
+                stream: bool) -> CompiledRequest:
+        """
+        Get the compiled request for an endpoint, compiling it on first use
+
+        Args:
+            adapter: Adapter translating the request
+            endpoint: Backend the request goes to, a long-lived object such as BackendState.config
+            kwargs: Request parameters built by this template, adapted to the endpoint
+            stream: Whether the response is streamed
+
+        Returns:
+            Compiled request
+        """
+        # Parsed streams may ask for usage where raw relays of the same endpoint do not
+        key = (adapter.name, id(endpoint), kwargs["model"], stream, "stream_options" in kwargs)
+        compiled = self._compiled.get(key)
+        # The identity check guards against an id reused by a newer endpoint object
+        if compiled is None or compiled.endpoint is not endpoint:
+            compiled = adapter.compile(endpoint, kwargs, stream)
+            self._compiled.set(key, compiled)
+        return compiled
+
+    def sdk_post(self, endpoint: LLMConfig, kwargs: Dict[str, Any], stream: bool) -> Dict[str, Any]:
+        """
+        Arguments for the OpenAI SDK client's post(), bypassing the parameter transform of create()
+
+        Args:
+            endpoint: Backend the request goes to
+            kwargs: Request parameters built by this template, adapted to the endpoint
+            stream: Whether the response is streamed
+
+        Returns:
+            path, content and options keyword arguments
+        """
+        compiled = self.compile(sdk_adapter, endpoint, kwargs, stream)
+        return {
+            "path": compiled.url,
+            "content": compiled.content(sdk_adapter.fields(kwargs)),
+            "options": {"headers": compiled.headers},
+        }
+
+
+class TemplateRegistry:
+    """Request templates shared by every proxy built from the same configuration"""
+
+    def __init__(self, maxsize: int = 1024):
+        """
+        Initialize registry
+
+        Args:
+            maxsize: Templates kept, least recently used first out
+        """
+        self._lock = threading.Lock()
+        self._templates = TTLCache(maxsize=maxsize, ttl=None)
+
+    @staticmethod
+    def key(config: LLMConfig) -> str:
+        """Digest of the configuration without its API key, which neither shapes requests nor belongs in a key"""
+        return hashlib.sha256(config.model_dump_json(exclude={"api_key"}).encode()).hexdigest()
+
+    def get(self, config: LLMConfig) -> RequestTemplate:
+        """Get or create the template of a configuration"""
+        key = self.key(config)
+        template = self._templates.get(key)
+        if template is None:
+            with self._lock:
+                template = self._templates.get(key)
+                if template is None:
+                    template = RequestTemplate(config)
+                    self._templates.set(key, template)
+        return template
+
+
+# Shared so per-request proxies reuse compiled requests
+default_templates = TemplateRegistry()
@@ -0,0 +1,411 @@
+"""
+Resilience - Retries with jittered backoff and per-endpoint circuit breakers
+"""
+
+import asyncio
+import email.utils
+import random
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+import httpx
+
+from .deadlines import Deadline, DeadlineExceeded
+
+
+T = TypeVar("T")
+
+# Status codes worth retrying, same set the OpenAI SDK retries
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+
+class CircuitOpenError(Exception):
+    """Raised without contacting the upstream while its circuit breaker is open"""
+
+    def __init__(self, endpoint: str, retry_in: float):
+        super().__init__(f"Circuit breaker open for {endpoint}, retry in {retry_in:.1f}s")
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    """HTTP status of an SDK or httpx error, None for transport failures"""
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        response = getattr(exc, "response", None)
+        status = getattr(response, "status_code", None)
+    return status
+
+
+def _connection_errors() -> Tuple[type, ...]:
+    """Connection failure types, the SDK's only once it is loaded, it cannot have raised one before"""
+    sdk_error = getattr(sys.modules.get("openai"), "APIConnectionError", None)
+    return (httpx.TransportError,) if sdk_error is None else (sdk_error, httpx.TransportError)
+
+
+def is_transient(exc: BaseException) -> bool:
+    """Whether an error is a timeout, connection failure, 5xx or throttling response"""
+    if isinstance(exc, _connection_errors()):
+        return True
+    status = _status_code(exc)
+    return status is not None and (status in RETRYABLE_STATUS_CODES or status >= 500)
+
+
+def is_upstream_failure(exc: BaseException) -> bool:
+    """Whether an error counts against the endpoint health, throttling does not"""
+    if isinstance(exc, _connection_errors()):
+        return True
+    status = _status_code(exc)
+    return status is not None and status >= 500
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds requested by a Retry-After (or retry-after-ms) response header"""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class RetryPolicy:
+    """Retry transient upstream errors with full-jitter exponential backoff"""
+
+    def __init__(self,
+                 max_retries: int = 2,
+                 base_delay: float = 0.5,
+                 max_delay: float = 30.0,
+                 respect_retry_after: bool = True):
+        """
+        Initialize retry policy
+
+        Args:
+            max_retries: Retries after the first attempt, 0 disables retrying
+            base_delay: Backoff ceiling of the first retry in seconds, doubled per retry
+            max_delay: Upper bound of any single wait, including Retry-After
+            respect_retry_after: Wait as long as the upstream asks via Retry-After
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.respect_retry_after = respect_retry_after
+        self._lock = threading.Lock()
+        self.attempts = 0
+        self.retries = 0
+        self.exhausted = 0
+
+    def delay(self, retry: int, exc: BaseException) -> float:
+        """
+        Seconds to wait before a retry
+
+        Args:
+            retry: Zero-based retry number
+            exc: Error that triggered the retry
+
+        Returns:
+            Wait time in seconds
+        """
+        if self.respect_retry_after:
+            requested = retry_after(exc)
+            if requested is not None:
+                return min(requested, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** retry)))
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def stats(self) -> Dict[str, int]:
+        """Return attempt and retry counters"""
+        with self._lock:
+            return {"attempts": self.attempts, "retries": self.retries, "exhausted": self.exhausted}
+
+
+class CircuitBreaker:
+    """Error-rate circuit breaker for one upstream endpoint"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self,
+                 endpoint: str,
+                 failure_rate: float = 0.5,
+                 window: int = 20,
+                 min_requests: int = 10,
+                 reset_timeout: float = 30.0,
+                 half_open_requests: int = 1,
+                 timer: Callable[[], float] = time.monotonic):
+        """
+        Initialize circuit breaker
+
+        Args:
+            endpoint: Upstream identifier, used in errors and snapshots
+            failure_rate: Failure ratio in the window at which the breaker opens
+            window: Number of recent outcomes considered
+            min_requests: Outcomes needed in the window before the breaker can open
+            reset_timeout: Seconds the breaker stays open before probing
+            half_open_requests: Concurrent probe requests allowed while half open
+            timer: Monotonic clock, replaceable in tests
+        """
+        self.endpoint = endpoint
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests
+        self.reset_timeout = reset_timeout
+        self.half_open_requests = half_open_requests
+        self._timer = timer
+        self._lock = threading.Lock()
+        self._outcomes: "deque[bool]" = deque(maxlen=window)
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self.rejected = 0
+        self.opened = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._refresh()
+            return self._state
+
+    def _refresh(self) -> None:
+        if self._state == self.OPEN and self._timer() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._probes = 0
+
+    def _open(self) -> None:
+        self._state = self.OPEN
+        self._opened_at = self._timer()
+        self._outcomes.clear()
+        self.opened += 1
+
+    def before_request(self) -> None:
+        """Admit a request or raise CircuitOpenError"""
+        self._admit(take_probe=True)
+
+    def check(self) -> None:
+        """Raise CircuitOpenError if a request would be rejected now, without taking a probe"""
+        self._admit(take_probe=False)
+
+    def _admit(self, take_probe: bool) -> None:
+        with self._lock:
+            self._refresh()
+            if self._state == self.CLOSED:
+                return
+            if self._state == self.HALF_OPEN and self._probes < self.half_open_requests:
+                if take_probe:
+                    self._probes += 1
+                return
+            self.rejected += 1
+            retry_in = max(0.0, self.reset_timeout - (self._timer() - self._opened_at))
+        raise CircuitOpenError(self.endpoint, retry_in)
+
+    def record_success(self) -> None:
+        """Record a successful upstream call"""
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._state = self.CLOSED
+                self._outcomes.clear()
+            self._outcomes.append(True)
+
+    def record_failure(self) -> None:
+        """Record a failed upstream call"""
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._open()
+                return
+            self._outcomes.append(False)
+            total = len(self._outcomes)
+            failures = total - sum(self._outcomes)
+            if total >= self.min_requests and failures / total >= self.failure_rate:
+                self._open()
+
+    def record(self, exc: Optional[BaseException]) -> None:
+        """Record the outcome of a call, errors that say nothing about endpoint health are ignored"""
+        if exc is None:
+            self.record_success()
+        elif is_upstream_failure(exc):
+            self.record_failure()
+        else:
+            # A probe that got a client error still proved the endpoint reachable
+            self.release()
+
+    def release(self) -> None:
+        """Give back a probe admitted by before_request whose call ended without an outcome, e.g. cancelled"""
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return state and counters for monitoring"""
+        with self._lock:
+            self._refresh()
+            total = len(self._outcomes)
+            return {
+                "state": self._state,
+                "failure_rate": (total - sum(self._outcomes)) / total if total else 0.0,
+                "window": total,
+                "opened": self.opened,
+                "rejected": self.rejected,
+            }
+
+
+class BreakerRegistry:
+    """Circuit breakers keyed by upstream base URL"""
+
+    def __init__(self, **settings: Any):
+        """
+        Initialize registry
+
+        Args:
+            settings: CircuitBreaker arguments applied to every breaker
+        """
+        self.settings = settings
+        self._lock = threading.Lock()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, endpoint: str) -> CircuitBreaker:
+        """Get or create the breaker for an endpoint"""
+        breaker = self._breakers.get(endpoint)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(endpoint, CircuitBreaker(endpoint, **self.settings))
+        return breaker
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Return the snapshot of every breaker"""
+        return {endpoint: breaker.snapshot() for endpoint, breaker in list(self._breakers.items())}
+
+
+def call_with_retries(call: Callable[[], T],
+                      policy: RetryPolicy,
+                      breaker: Optional[CircuitBreaker] = None,
+                      sleep: Callable[[float], None] = time.sleep,
+                      deadline: Optional[Deadline] = None) -> T:
+    """
+    Run a blocking upstream call under a retry policy and circuit breaker
+
+    Args:
+        call: Function performing one upstream attempt
+        policy: Retry policy
+        breaker: Optional breaker of the endpoint being called
+        sleep: Sleep function, replaceable in tests
+        deadline: Deadline of the call, no retry is started that could not finish by it
+
+    Returns:
+        Result of the first successful attempt
+    """
+    retry = 0
+    while True:
+        if breaker is not None:
+            breaker.before_request()
+        policy._count("attempts")
+        try:
+            result = call()
+        except Exception as exc:
+            if breaker is not None:
+                breaker.record(exc)
+            if not is_transient(exc):
+                raise
+            if retry >= policy.max_retries:
+                policy._count("exhausted")
+                raise
+            delay = policy.delay(retry, exc)
+            if deadline is not None and delay >= deadline.remaining():
+                policy._count("exhausted")
+                raise DeadlineExceeded(deadline.timeout) from exc
+            policy._count("retries")
+            sleep(delay)
+            retry += 1
+            continue
+        except BaseException:
+            # Cancelled or interrupted, which says nothing about the endpoint
+            if breaker is not None:
+                breaker.release()
+            raise
+        if breaker is not None:
+            breaker.record(None)
+        return result
+
+
+async def acall_with_retries(call: Callable[[], Awaitable[T]],
+                             policy: RetryPolicy,
+                             breaker: Optional[CircuitBreaker] = None,
+                             sleep: Callable[[float], Awaitable[Any]] = asyncio.sleep,
+                             deadline: Optional[Deadline] = None) -> T:
+    """
+    Run an async upstream call under a retry policy and circuit breaker
+
+    Args:
+        call: Coroutine function performing one upstream attempt
+        policy: Retry policy
+        breaker: Optional breaker of the endpoint being called
+        sleep: Coroutine function sleeping between attempts, replaceable in tests
+        deadline: Deadline of the call, no retry is started that could not finish by it
+
+    Returns:
+        Result of the first successful attempt
+    """
+    retry = 0
+    while True:
+        if breaker is not None:
+            breaker.before_request()
+        policy._count("attempts")
+        try:
+            result = await call()
+        except Exception as exc:
+            if breaker is not None:
+                breaker.record(exc)
+            if not is_transient(exc):
+                raise
+            if retry >= policy.max_retries:
+                policy._count("exhausted")
+                raise
+            delay = policy.delay(retry, exc)
+            if deadline is not None and delay >= deadline.remaining():
+                policy._count("exhausted")
+                raise DeadlineExceeded(deadline.timeout) from exc
+            policy._count("retries")
+            await sleep(delay)
+            retry += 1
+            continue
+        except BaseException:
+            # Cancelled or interrupted, which says nothing about the endpoint
+            if breaker is not None:
+                breaker.release()
+            raise
+        if breaker is not None:
+            breaker.record(None)
+        return result
+
+
+# Shared by every proxy that does not bring its own, so counters cover the whole process
+default_retry_policy = RetryPolicy()
+default_breakers = BreakerRegistry()
+
+
+def snapshot() -> Dict[str, Any]:
+    """Return retry counters and breaker states of the shared defaults"""
+    return {"retries": default_retry_policy.stats(), "circuit_breakers": default_breakers.snapshot()}
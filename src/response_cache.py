@@ -0,0 +1,113 @@
+"""
+Response Cache - Two-tier (memory LRU + SQLite) cache for deterministic chat completions
+"""
+
+import hashlib
+import json
+import threading
+from typing import Any, Dict, Optional
+
+from .cache import SQLiteCache, TTLCache
+from .models import LLMConfig
+
+
+class ResponseCache:
+    """Opt-in cache of chat completion responses, memory LRU in front of an optional SQLite tier"""
+
+    def __init__(self,
+                 maxsize: int = 1024,
+                 ttl: Optional[float] = 3600.0,
+                 path: Optional[str] = None,
+                 disk_ttl: Optional[float] = 86400.0,
+                 disk_max_entries: int = 100000,
+                 deterministic_only: bool = True,
+                 table: str = "responses"):
+        """
+        Initialize response cache
+
+        Args:
+            maxsize: Maximum entries in the memory tier
+            ttl: Seconds an entry stays in the memory tier
+            path: SQLite database file for the persistent tier, None for memory only. Processes opening
+                the same file share its entries
+            disk_ttl: Seconds an entry stays in the persistent tier
+            disk_max_entries: Maximum entries in the persistent tier
+            deterministic_only: Only cache requests sent with temperature 0
+            table: Table of the persistent tier, caches storing different kinds of values in one file use their own
+        """
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.disk = SQLiteCache(path, ttl=disk_ttl, max_entries=disk_max_entries, table=table) if path else None
+        self.deterministic_only = deterministic_only
+        self._lock = threading.Lock()
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(config: LLMConfig, request: Dict[str, Any]) -> str:
+        """
+        Canonical digest of a chat request
+
+        Args:
+            config: Configuration the request is sent with
+            request: Chat request parameters, model, messages, sampling parameters and merged extra_body
+
+        Returns:
+            Hex digest identifying the request
+        """
+        canonical = {
+            "provider": config.provider,
+            "base_url": config.base_url,
+            "request": {name: value for name, value in request.items() if name != "extra_headers"},
+        }
+        encoded = json.dumps(canonical, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(encoded.encode()).hexdigest()
+
+    def accepts(self, request: Dict[str, Any]) -> bool:
+        """Whether a request is eligible for caching"""
+        return not self.deterministic_only or request.get("temperature") == 0
+
+    def get(self, key: str) -> Optional[str]:
+        """Return a cached response, promoting persistent hits into memory"""
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        if self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+                with self._lock:
+                    self.disk_hits += 1
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value: str) -> None:
+        """Store a response in every tier"""
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters for both tiers"""
+        memory = self.memory.stats()
+        hits = memory["hits"] + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "hits": hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory": memory,
+            "disk": {"hits": self.disk_hits, "size": len(self.disk)} if self.disk is not None else None,
+        }
+
+    def clear(self) -> None:
+        """Remove all entries from every tier"""
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def close(self) -> None:
+        """Close the persistent tier"""
+        if self.disk is not None:
+            self.disk.close()
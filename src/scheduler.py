@@ -0,0 +1,389 @@
+"""
+Scheduler - Priority classes and weighted fair queuing of upstream calls sharing an API key
+"""
+
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Hashable, Iterable, Optional, Tuple
+
+from .cache import TTLCache
+from .deadlines import CancelToken, Deadline, DeadlineExceeded, RequestCancelled
+
+
+# Priority classes, most urgent first
+PRIORITIES = ("interactive", "batch")
+DEFAULT_PRIORITY = "interactive"
+
+# Share of contended slots per class, batch work is held back but never starved
+CLASS_WEIGHTS = {"interactive": 20.0, "batch": 1.0}
+
+# Requests that may queue per API key before new ones are shed
+MAX_QUEUE = int(os.environ.get("LLM_PROXY_SCHEDULER_QUEUE", "1000"))
+
+
+class RequestShed(Exception):
+    """Raised instead of queueing a request the scheduler cannot serve"""
+
+    def __init__(self, reason: str, priority: str):
+        messages = {
+            "queue_full": "Scheduler queue is full",
+            "deadline": "Request cannot be scheduled before its deadline",
+        }
+        super().__init__(f"{messages.get(reason, reason)} ({priority} request shed)")
+        self.reason = reason
+        self.priority = priority
+
+
+class _Stride:
+    """Stride scheduling: the member served least relative to its weight goes next"""
+
+    def __init__(self):
+        self.passes: Dict[Hashable, float] = {}
+        self.vtime = 0.0
+
+    def join(self, member: Hashable) -> None:
+        """A member gets work queued, it starts level with the members being served"""
+        self.passes[member] = max(self.passes.get(member, 0.0), self.vtime)
+
+    def pick(self, members: Iterable[Hashable]) -> Hashable:
+        return min(members, key=self.passes.__getitem__)
+
+    def charge(self, member: Hashable, cost: float, weight: float) -> None:
+        self.vtime = self.passes[member]
+        self.passes[member] += cost / weight
+
+    def leave(self, member: Hashable) -> None:
+        """A member ran out of queued work, one without outstanding service can be forgotten"""
+        if self.passes.get(member, 0.0) <= self.vtime:
+            self.passes.pop(member, None)
+
+
+class _Waiter:
+    """A queued request, woken with True when admitted or with the error to raise"""
+
+    __slots__ = ("tenant", "priority", "share", "cost", "outcome", "event", "loop", "future")
+
+    def __init__(self, tenant: Hashable, priority: str, share: float, cost: float):
+        self.tenant = tenant
+        self.priority = priority
+        self.share = share
+        self.cost = cost
+        self.outcome: Any = None
+        self.event: Optional[threading.Event] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.future: Optional[asyncio.Future] = None
+
+    def wake(self, outcome: Any = None) -> None:
+        if outcome is not None:
+            self.outcome = outcome
+        if self.future is not None:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+        else:
+            self.event.set()
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class Slot:
+    """An admitted call's place among the API key's calls in flight, release it once the call is done"""
+
+    __slots__ = ("scheduler", "waited", "_admitted")
+
+    def __init__(self, scheduler: "Scheduler", waited: float):
+        self.scheduler: Optional[Scheduler] = scheduler
+        # Seconds spent queued
+        self.waited = waited
+        self._admitted = time.perf_counter()
+
+    def release(self) -> None:
+        """Free the slot for the next queued request, further calls do nothing"""
+        if self.scheduler is not None:
+            scheduler, self.scheduler = self.scheduler, None
+            scheduler._release(time.perf_counter() - self._admitted)
+
+
+class Scheduler:
+    """
+    Admission of upstream calls to one API key
+
+    Up to max_inflight calls run at once. Further requests queue per priority class and, within a
+    class, per tenant (configuration). A freed slot goes to the class, then the tenant, served least
+    relative to its weight so far, measured in estimated tokens, so a batch job flooding a shared key
+    neither delays interactive requests much nor crowds out other tenants' batch work.
+    """
+
+    # Weight of the newest call in the moving average of slot hold times
+    HOLD_ALPHA = 0.2
+
+    def __init__(self,
+                 max_inflight: int,
+                 max_queue: int = MAX_QUEUE,
+                 class_weights: Optional[Dict[str, float]] = None):
+        """
+        Initialize scheduler
+
+        Args:
+            max_inflight: Calls allowed in flight at once
+            max_queue: Requests allowed to wait, further ones shed the least urgent waiter or are shed
+            class_weights: Share of contended slots per priority class, most urgent class first,
+                defaults to CLASS_WEIGHTS
+        """
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.class_weights = dict(class_weights or CLASS_WEIGHTS)
+        self._ranks = {priority: rank for rank, priority in enumerate(self.class_weights)}
+        self._lock = threading.Lock()
+        self.inflight = 0
+        self.hold_time = 0.0
+        self._classes = _Stride()
+        self._tenants = {priority: _Stride() for priority in self.class_weights}
+        self._queues: Dict[str, Dict[Hashable, Deque[_Waiter]]] = {priority: {} for priority in self.class_weights}
+        self._queued = {priority: 0 for priority in self.class_weights}
+        self.admitted = {priority: 0 for priority in self.class_weights}
+        self.shed: Dict[Tuple[str, str], int] = {}
+
+    @property
+    def queued(self) -> int:
+        return sum(self._queued.values())
+
+    def configure(self, max_inflight: int) -> None:
+        """Change the number of calls allowed in flight"""
+        with self._lock:
+            self.max_inflight = max_inflight
+            self._dispatch()
+
+    def acquire(self,
+                tenant: Hashable,
+                priority: str = DEFAULT_PRIORITY,
+                share: float = 1.0,
+                cost: float = 1.0,
+                deadline: Optional[Deadline] = None,
+                cancel: Optional[CancelToken] = None) -> Slot:
+        """
+        Wait for a slot
+
+        Args:
+            tenant: Identity fair queuing shares slots between, e.g. the configuration
+            priority: Priority class
+            share: Weight of the tenant within its class
+            cost: Work the request stands for, e.g. estimated tokens
+            deadline: Deadline of the request, it is shed when it cannot be admitted in time
+            cancel: Token cancelling the wait
+
+        Returns:
+            Slot to release once the call is done
+        """
+        started = time.perf_counter()
+        waiter = _Waiter(tenant, priority, share, cost)
+        waiter.event = threading.Event()
+        if self._enqueue(waiter, deadline):
+            return Slot(self, 0.0)
+        forget = None if cancel is None else cancel.on_cancel(waiter.event.set)
+        try:
+            waiter.event.wait(None if deadline is None else deadline.remaining())
+        finally:
+            if forget is not None:
+                forget()
+        return self._settle(waiter, started, deadline, cancel)
+
+    async def aacquire(self,
+                       tenant: Hashable,
+                       priority: str = DEFAULT_PRIORITY,
+                       share: float = 1.0,
+                       cost: float = 1.0,
+                       deadline: Optional[Deadline] = None,
+                       cancel: Optional[CancelToken] = None) -> Slot:
+        """Async variant of acquire(), cancelling the waiting task leaves the queue"""
+        started = time.perf_counter()
+        waiter = _Waiter(tenant, priority, share, cost)
+        waiter.loop = asyncio.get_running_loop()
+        waiter.future = waiter.loop.create_future()
+        if self._enqueue(waiter, deadline):
+            return Slot(self, 0.0)
+        forget = None if cancel is None else cancel.on_cancel(waiter.wake)
+        try:
+            await asyncio.wait([waiter.future], timeout=None if deadline is None else deadline.remaining())
+        except BaseException:
+            # Admitted just as the task was cancelled, hand the slot on
+            if not self._withdraw(waiter) and waiter.outcome is True:
+                self._release(0.0)
+            raise
+        finally:
+            if forget is not None:
+                forget()
+        return self._settle(waiter, started, deadline, cancel)
+
+    def _enqueue(self, waiter: _Waiter, deadline: Optional[Deadline]) -> bool:
+        """Admit a request at once (True) or queue it, raises RequestShed when it is turned away"""
+        priority = waiter.priority
+        if priority not in self._queues:
+            raise ValueError(f"Unknown priority: {priority}")
+        with self._lock:
+            if self.inflight < self.max_inflight and not self.queued:
+                self.inflight += 1
+                self.admitted[priority] += 1
+                return True
+            if deadline is not None and self._expected_wait(priority) >= deadline.remaining():
+                self._count_shed(priority, "deadline")
+                raise RequestShed("deadline", priority)
+            if self.queued >= self.max_queue and not self._evict(priority):
+                self._count_shed(priority, "queue_full")
+                raise RequestShed("queue_full", priority)
+            tenants = self._queues[priority]
+            queue = tenants.get(waiter.tenant)
+            if queue is None:
+                if not tenants:
+                    self._classes.join(priority)
+                self._tenants[priority].join(waiter.tenant)
+                queue = tenants[waiter.tenant] = deque()
+            queue.append(waiter)
+            self._queued[priority] += 1
+            return False
+
+    def _settle(self, waiter: _Waiter, started: float, deadline: Optional[Deadline],
+                cancel: Optional[CancelToken]) -> Slot:
+        """Turn a woken or timed out waiter into a slot or its error"""
+        if waiter.outcome is None and self._withdraw(waiter):
+            if cancel is not None and cancel.cancelled:
+                raise RequestCancelled()
+            with self._lock:
+                self._count_shed(waiter.priority, "expired")
+            raise DeadlineExceeded(None if deadline is None else deadline.timeout)
+        if waiter.outcome is not True:
+            raise waiter.outcome
+        return Slot(self, time.perf_counter() - started)
+
+    def _expected_wait(self, priority: str) -> float:
+        """Rough time until a new request of a class would be admitted"""
+        rank = self._ranks[priority]
+        ahead = sum(count for other, count in self._queued.items() if self._ranks[other] <= rank)
+        return (ahead + 1) * self.hold_time / max(1, self.max_inflight)
+
+    def _evict(self, priority: str) -> bool:
+        """Shed the newest request of the biggest tenant in a less urgent class to make room"""
+        for other in reversed(list(self._queues)):
+            if other == priority:
+                return False
+            tenants = self._queues[other]
+            if tenants:
+                tenant = max(tenants, key=lambda name: len(tenants[name]))
+                waiter = tenants[tenant].pop()
+                self._dequeued(other, tenant)
+                self._count_shed(other, "queue_full")
+                waiter.wake(RequestShed("queue_full", other))
+                return True
+        return False
+
+    def _withdraw(self, waiter: _Waiter) -> bool:
+        """Remove a waiter that gave up, False when it was already admitted or shed"""
+        with self._lock:
+            if waiter.outcome is not None:
+                return False
+            self._queues[waiter.priority][waiter.tenant].remove(waiter)
+            self._dequeued(waiter.priority, waiter.tenant)
+            return True
+
+    def _dequeued(self, priority: str, tenant: Hashable) -> None:
+        self._queued[priority] -= 1
+        tenants = self._queues[priority]
+        if not tenants[tenant]:
+            del tenants[tenant]
+            self._tenants[priority].leave(tenant)
+            if not tenants:
+                self._classes.leave(priority)
+
+    def _dispatch(self) -> None:
+        """Admit queued requests into free slots, called with the lock held"""
+        while self.inflight < self.max_inflight and self.queued:
+            priority = self._classes.pick(other for other, tenants in self._queues.items() if tenants)
+            tenants = self._queues[priority]
+            tenant = self._tenants[priority].pick(tenants)
+            waiter = tenants[tenant].popleft()
+            self._classes.charge(priority, waiter.cost, self.class_weights[priority])
+            self._tenants[priority].charge(tenant, waiter.cost, waiter.share)
+            self._dequeued(priority, tenant)
+            self.inflight += 1
+            self.admitted[priority] += 1
+            waiter.wake(True)
+
+    def _release(self, held: float) -> None:
+        with self._lock:
+            self.inflight -= 1
+            if held:
+                self.hold_time = held if not self.hold_time else \
+                    self.HOLD_ALPHA * held + (1 - self.HOLD_ALPHA) * self.hold_time
+            self._dispatch()
+
+    def _count_shed(self, priority: str, reason: str) -> None:
+        key = (priority, reason)
+        self.shed[key] = self.shed.get(key, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return slot usage, queue depths and counters per priority class"""
+        with self._lock:
+            return {
+                "max_inflight": self.max_inflight,
+                "inflight": self.inflight,
+                "hold_time": self.hold_time,
+                "queued": dict(self._queued),
+                "admitted": dict(self.admitted),
+                "shed": {f"{priority}:{reason}": count for (priority, reason), count in self.shed.items()},
+            }
+
+
+class SchedulerRegistry:
+    """Schedulers shared per (base_url, api_key), since calls through one key compete for its capacity"""
+
+    def __init__(self, max_queue: int = MAX_QUEUE, maxsize: int = 1024):
+        """
+        Initialize registry
+
+        Args:
+            max_queue: Requests each scheduler queues before shedding
+            maxsize: Schedulers kept, least recently used first out
+        """
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._schedulers = TTLCache(maxsize=maxsize, ttl=None)
+
+    def get(self, base_url: str, api_key: str, max_inflight: Optional[int]) -> Optional[Scheduler]:
+        """
+        Get the scheduler of an API key, None when its calls are not limited
+
+        Args:
+            base_url: Upstream base URL
+            api_key: API key the limit applies to
+            max_inflight: Calls allowed in flight at once
+
+        Returns:
+            Shared scheduler, holding the smallest limit any caller configured for the key
+        """
+        if max_inflight is None:
+            return None
+        # The API key is only kept hashed
+        key = (base_url, hashlib.sha256(api_key.encode()).hexdigest())
+        with self._lock:
+            scheduler = self._schedulers.get(key)
+            if scheduler is None:
+                scheduler = Scheduler(max_inflight, self.max_queue)
+                self._schedulers.set(key, scheduler)
+            elif max_inflight < scheduler.max_inflight:
+                # Callers disagreeing on a key's limit must not flip it back and forth, the strictest one holds
+                scheduler.configure(max_inflight)
+        return scheduler
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Return stats of every scheduler, keyed by base URL"""
+        return {f"{base_url}#{index}": scheduler.stats()
+                for index, ((base_url, _), scheduler) in enumerate(self._schedulers.items())}
+
+
+# Shared so every proxy using the same key queues for the same slots
+default_schedulers = SchedulerRegistry()
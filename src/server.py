@@ -0,0 +1,408 @@
+"""
+Gateway Server - OpenAI-compatible HTTP endpoint accepting encrypted configuration keys as bearer tokens
+"""
+
+import argparse
+import atexit
+import contextlib
+import json
+import math
+import os
+import shutil
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+import uvicorn
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+if __name__ == "__main__":
+    # The modules imported below read their LLM_PROXY_* settings as they load, so .env goes first
+    from dotenv import load_dotenv
+    load_dotenv()
+
+from . import metrics
+from .balancer import default_balancers
+from .client_pool import ClientPool, default_pool
+from .deadlines import Deadline, DeadlineExceeded
+from .key_generator import KeyGenerator
+from .llm_proxy import OPENAI_COMPATIBLE_PROVIDERS
+from .models import LLMConfig
+from .resilience import CircuitOpenError
+from .response_cache import ResponseCache
+
+
+# Upstream response headers that must not be copied onto the gateway response
+HOP_BY_HOP_HEADERS = {
+    "connection", "keep-alive", "transfer-encoding", "content-length", "content-encoding", "server", "date",
+}
+
+# Request header with the seconds a client will wait, the upstream request is given no longer
+TIMEOUT_HEADER = "x-request-timeout"
+
+
+class GatewayError(Exception):
+    """Error returned to the client in OpenAI error format"""
+
+    def __init__(self, status_code: int, message: str, error_type: str = "invalid_request_error"):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+        self.error_type = error_type
+
+    def response(self) -> JSONResponse:
+        return JSONResponse(
+            {"error": {"message": self.message, "type": self.error_type}},
+            status_code=self.status_code,
+        )
+
+
+async def resolve_config(request: Request) -> LLMConfig:
+    """
+    Decrypt the configuration carried in the Authorization header
+
+    Args:
+        request: Incoming request
+
+    Returns:
+        Decrypted configuration
+    """
+    authorization = request.headers.get("authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise GatewayError(401, "Missing bearer token", "authentication_error")
+
+    try:
+        if KeyGenerator.token_version(token) == 1:
+            # v1 keys may need a full PBKDF2 run and a lookup in the shared SQLite file, keep them off the
+            # event loop. v2 keys need neither
+            config = await run_in_threadpool(KeyGenerator.decrypt_config, token)
+        else:
+            config = KeyGenerator.decrypt_config(token)
+    except Exception:
+        raise GatewayError(401, "Invalid encrypted configuration key", "authentication_error")
+
+    if config.provider not in OPENAI_COMPATIBLE_PROVIDERS:
+        raise GatewayError(400, f"Provider not supported by the gateway: {config.provider}")
+    return config
+
+
+def request_deadline(request: Request) -> Optional[Deadline]:
+    """
+    Deadline set by the client's timeout header
+
+    Args:
+        request: Incoming request
+
+    Returns:
+        Deadline counted from now, None without the header
+    """
+    value = request.headers.get(TIMEOUT_HEADER)
+    if value is None:
+        return None
+    try:
+        timeout = float(value)
+    except ValueError:
+        timeout = math.nan
+    if not 0 < timeout < math.inf:
+        raise GatewayError(400, f"{TIMEOUT_HEADER} must be a positive number of seconds")
+    return Deadline(timeout)
+
+
+def build_upstream_request(http_client: httpx.AsyncClient,
+                           config: LLMConfig,
+                           path: str,
+                           body: Optional[Dict[str, Any]] = None,
+                           endpoint: Optional[LLMConfig] = None,
+                           timeout: Optional[httpx.Timeout] = None) -> httpx.Request:
+    """
+    Build the upstream request, applying the configuration the same way LLMProxy.chat does
+
+    Args:
+        http_client: Pooled HTTP client
+        config: Decrypted configuration
+        path: Path relative to the configured base URL
+        body: JSON request body, None for GET requests
+        endpoint: Backend chosen for the request, defaults to the configuration itself
+        timeout: Timeouts of the request, defaults to the client's
+
+    Returns:
+        Request ready to send
+    """
+    endpoint = endpoint or config
+    timeout = httpx.USE_CLIENT_DEFAULT if timeout is None else timeout
+    headers = {"Authorization": f"Bearer {endpoint.api_key}"}
+    headers.update(endpoint.headers or {})
+    url = endpoint.base_url.rstrip("/") + path
+
+    if body is None:
+        return http_client.build_request("GET", url, headers=headers, timeout=timeout)
+
+    return http_client.build_request("POST", url, headers=headers, json=upstream_body(config, body, endpoint),
+                                     timeout=timeout)
+
+
+def upstream_body(config: LLMConfig, body: Dict[str, Any], endpoint: Optional[LLMConfig] = None) -> Dict[str, Any]:
+    """Client request body with the configured model filled in and extra_body merged"""
+    body = dict(body)
+    body.setdefault("model", (endpoint or config).model)
+    if config.extra_body:
+        body.update(config.extra_body)
+    return body
+
+
+def shared_response_cache() -> Optional[ResponseCache]:
+    """Response cache in the file named by LLM_PROXY_SHARED_CACHE, shared by every worker, None if unset"""
+    path = os.environ.get("LLM_PROXY_SHARED_CACHE")
+    return ResponseCache(path=path, table="gateway_responses") if path else None
+
+
+async def _cache_call(cache: ResponseCache, method: Any, *args: Any) -> Any:
+    """Call a response cache method, off the event loop when it may wait on a locked SQLite file"""
+    if cache.disk is None:
+        return method(*args)
+    return await run_in_threadpool(method, *args)
+
+
+def _response_headers(upstream: httpx.Response) -> Dict[str, str]:
+    return {name: value for name, value in upstream.headers.items() if name.lower() not in HOP_BY_HOP_HEADERS}
+
+
+class RelayResponse(StreamingResponse):
+    """Streamed upstream body, the upstream response is closed however the relay ends"""
+
+    def __init__(self, upstream: httpx.Response, content: Any):
+        super().__init__(content, status_code=upstream.status_code, headers=_response_headers(upstream))
+        self.upstream = upstream
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # A client that disconnects mid-stream leaves the relay suspended, close it and the upstream
+            # now rather than when they are garbage collected, so the connection is free for other requests
+            aclose = getattr(self.body_iterator, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            await self.upstream.aclose()
+
+
+async def _instrumented_stream(upstream: httpx.Response, record: metrics.RequestRecord):
+    """Relay a streamed upstream body while timing it, the record is finished when the relay ends"""
+    error = None
+    try:
+        async for chunk in upstream.aiter_raw():
+            record.delta_received()
+            yield chunk
+    except BaseException as exc:
+        error = exc
+        raise
+    finally:
+        record.generation_done()
+        metrics.hub.finish(record, error)
+
+
+def _record_response(record: metrics.RequestRecord, upstream: httpx.Response) -> None:
+    """Copy status and, for complete JSON bodies, token usage onto a record"""
+    if upstream.status_code >= 400:
+        record.status = "error"
+        record.error = f"http_{upstream.status_code}"
+    elif not upstream.is_stream_consumed:
+        return
+    else:
+        try:
+            record.set_usage(json.loads(upstream.content).get("usage"))
+        except (ValueError, AttributeError):
+            pass
+
+
+def create_app(pool: Optional[ClientPool] = None,
+               enable_metrics: bool = True,
+               response_cache: Optional[ResponseCache] = None) -> Starlette:
+    """
+    Create the gateway application
+
+    Args:
+        pool: Client pool for upstream connections, defaults to the process-wide pool
+        enable_metrics: Aggregate request metrics and serve them on /metrics
+        response_cache: Optional cache answering repeated deterministic, non-streamed requests
+
+    Returns:
+        ASGI application
+    """
+    pool = pool or default_pool
+    if enable_metrics:
+        metrics.enable_prometheus()
+
+    async def chat_completions(request: Request):
+        received = time.perf_counter()
+        try:
+            deadline = request_deadline(request)
+            config = await resolve_config(request)
+            decrypted = time.perf_counter()
+            try:
+                body = await request.json()
+            except json.JSONDecodeError:
+                raise GatewayError(400, "Request body must be JSON")
+            if not isinstance(body, dict) or "messages" not in body:
+                raise GatewayError(400, "Request body must contain messages")
+        except GatewayError as e:
+            return e.response()
+
+        stream = bool(body.get("stream"))
+        cache_key = None
+        if response_cache is not None and not stream and response_cache.accepts(body):
+            cache_key = ResponseCache.make_key(config, upstream_body(config, body))
+            cached = await _cache_call(response_cache, response_cache.get, cache_key)
+            if cached is not None:
+                record = metrics.hub.start(config.provider, body.get("model") or config.model, stream, received,
+                                           config)
+                if record is not None:
+                    record.request = body
+                    record.cached = True
+                    metrics.hub.finish(record)
+                return Response(cached, media_type="application/json")
+
+        # Multi-backend configurations are balanced the same way LLMProxy balances them
+        balancer = default_balancers.get(config)
+        backend = balancer.pick()
+        try:
+            timeout = None if deadline is None else deadline.http_timeout(pool.timeouts)
+        except DeadlineExceeded as e:
+            return GatewayError(504, str(e), "timeout_error").response()
+        http_client = pool.get_async_http_client()
+        upstream_request = build_upstream_request(http_client, config, "/chat/completions", body, backend.config,
+                                                  timeout)
+        # Taken last, every exit from here on records an outcome or releases the probe
+        try:
+            backend.breaker.before_request()
+        except CircuitOpenError as e:
+            return GatewayError(503, str(e), "upstream_error").response()
+        record = metrics.hub.start(config.provider, body.get("model") or backend.config.model, stream, received,
+                                   config)
+        if record is not None:
+            record.request = body
+            record.add("decrypt", decrypted - received)
+            record.add("build", time.perf_counter() - decrypted)
+
+        started = backend.start()
+        token = metrics.bind(record)
+        try:
+            upstream = await http_client.send(upstream_request, stream=stream)
+        except httpx.HTTPError as e:
+            metrics.hub.finish(record, e)
+            if deadline is not None and deadline.expired:
+                # The client's deadline cut the request short, which says nothing about the backend's health
+                error = DeadlineExceeded(deadline.timeout)
+                balancer.finish(backend, started, error)
+                backend.breaker.record(error)
+                return GatewayError(504, str(error), "timeout_error").response()
+            balancer.finish(backend, started, e)
+            backend.breaker.record(e)
+            return GatewayError(502, f"Upstream request failed: {e}", "upstream_error").response()
+        except BaseException as e:
+            # The client went away or the server is shutting down, the backend is not to blame
+            balancer.finish(backend, started, e)
+            backend.breaker.release()
+            metrics.hub.finish(record, e)
+            raise
+        finally:
+            metrics.unbind(token)
+        balancer.finish(backend, started)
+        if upstream.status_code >= 500:
+            backend.breaker.record_failure()
+        else:
+            backend.breaker.record_success()
+        if record is not None:
+            _record_response(record, upstream)
+
+        if not stream:
+            if record is not None:
+                record.generation_done()
+                metrics.hub.finish(record)
+            if cache_key is not None and upstream.status_code == 200:
+                await _cache_call(response_cache, response_cache.set, cache_key, upstream.text)
+            return Response(upstream.content, status_code=upstream.status_code, headers=_response_headers(upstream))
+
+        # Relay server-sent events as they arrive, the connection is released when the client is done or gone
+        relay = upstream.aiter_raw() if record is None else _instrumented_stream(upstream, record)
+        return RelayResponse(upstream, relay)
+
+    async def models(request: Request):
+        try:
+            config = await resolve_config(request)
+        except GatewayError as e:
+            return e.response()
+        return JSONResponse({
+            "object": "list",
+            "data": [{"id": config.model, "object": "model", "owned_by": config.provider}],
+        })
+
+    async def health(request: Request):
+        return JSONResponse({"status": "ok"})
+
+    async def metrics_endpoint(request: Request):
+        return Response(metrics.prometheus.render(), media_type=metrics.PrometheusCollector.CONTENT_TYPE)
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        yield
+        await pool.aclose()
+
+    return Starlette(
+        routes=[
+            Route("/v1/chat/completions", chat_completions, methods=["POST"]),
+            Route("/v1/models", models, methods=["GET"]),
+            Route("/health", health, methods=["GET"]),
+        ] + ([Route("/metrics", metrics_endpoint, methods=["GET"])] if enable_metrics else []),
+        lifespan=lifespan,
+    )
+
+
+def serve_app() -> Starlette:
+    """Application of each uvicorn worker, served as "src.server:serve_app" with factory=True"""
+    return create_app(response_cache=shared_response_cache())
+
+
+_app: Optional[Starlette] = None
+
+
+def __getattr__(name: str) -> Any:
+    # "src.server:app" still works, but importing the module neither enables metrics nor opens the shared cache
+    global _app
+    if name == "app":
+        if _app is None:
+            _app = serve_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def main(argv: Optional[List[str]] = None):
+    """Run the gateway from the command line, .env is loaded by whatever imported this module first"""
+    parser = argparse.ArgumentParser(description='Run the OpenAI-compatible LLM proxy gateway')
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to bind')
+    parser.add_argument('--port', type=int, default=8000, help='Port to listen on')
+    parser.add_argument('--workers', type=int, default=1, help='Number of worker processes')
+    parser.add_argument('--shared-cache', help='SQLite file the workers share decrypted keys and responses through '
+                                               '(default: a temporary file when there are several workers)')
+    args = parser.parse_args(argv)
+
+    shared_cache = args.shared_cache or os.environ.get("LLM_PROXY_SHARED_CACHE")
+    if shared_cache is None and args.workers > 1:
+        directory = tempfile.mkdtemp(prefix="llm-proxy-")
+        atexit.register(shutil.rmtree, directory, True)
+        shared_cache = os.path.join(directory, "shared.db")
+    if shared_cache is not None:
+        # Every worker opens the file named in its environment on first use, not this process before forking
+        os.environ["LLM_PROXY_SHARED_CACHE"] = shared_cache
+
+    uvicorn.run("src.server:serve_app", factory=True, host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Single Flight - Coalesce identical in-flight requests so only one of them goes upstream
+"""
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+
+T = TypeVar("T")
+
+
+class _Call:
+    """A blocking call in flight, waited on by the threads that asked for the same key"""
+
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class _AsyncCall:
+    """A coroutine running as its own task, so no single caller's cancellation aborts it for the others"""
+
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: "asyncio.Task"):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    While a call for a key is running, callers asking for the same key wait for its outcome
+
+    The first caller (the leader) runs the call; the result, or the exception, is handed to every
+    caller that arrived while it was in flight. Later callers start a new call, nothing is cached.
+    """
+
+    def __init__(self, deterministic_only: bool = False):
+        """
+        Initialize single flight group
+
+        Args:
+            deterministic_only: Only coalesce requests with temperature 0, so sampled requests keep
+                getting independent completions
+        """
+        self.deterministic_only = deterministic_only
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._async_calls: Dict[Tuple[int, str], _AsyncCall] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def accepts(self, request: Dict[str, Any]) -> bool:
+        """Whether a request may share its completion with identical ones"""
+        return not self.deterministic_only or request.get("temperature") == 0
+
+    def do(self, key: str, call: Callable[[], T]) -> T:
+        """
+        Run a blocking call, or wait for the identical call already running in another thread
+
+        Args:
+            key: Canonical request key
+            call: Function performing the request
+
+        Returns:
+            Result of the call, shared by every caller of the key
+        """
+        with self._lock:
+            flight = self._calls.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = call()
+            return flight.result
+        except BaseException as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            flight.done.set()
+
+    async def ado(self, key: str, call: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run a coroutine, or wait for the identical one already running on this event loop
+
+        Args:
+            key: Canonical request key
+            call: Coroutine function performing the request
+
+        Returns:
+            Result of the call, shared by every caller of the key
+        """
+        loop_key = (id(asyncio.get_running_loop()), key)
+        flight = self._async_calls.get(loop_key)
+        if flight is None:
+            flight = _AsyncCall(asyncio.ensure_future(call()))
+            self._async_calls[loop_key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(loop_key, flight))
+            with self._lock:
+                self.leaders += 1
+        else:
+            with self._lock:
+                self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            # Abandon the upstream call once nobody is waiting for it any more
+            if flight.waiters == 1 and not flight.task.done():
+                self._forget(loop_key, flight)
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _forget(self, loop_key: Tuple[int, str], flight: _AsyncCall) -> None:
+        """Stop handing out a finished or abandoned call, a newer call for the key is left alone"""
+        if self._async_calls.get(loop_key) is flight:
+            del self._async_calls[loop_key]
+
+    def stats(self) -> Dict[str, int]:
+        """Return calls made and calls saved by coalescing"""
+        return {
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._calls) + len(self._async_calls),
+        }
+
+
+# Shared group for proxies created with single_flight=True
+default_single_flight = SingleFlight()
@@ -0,0 +1,280 @@
+"""
+Stub Upstream - Local OpenAI, Anthropic and Gemini compatible server for tests, benchmarks and development
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import socket
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+
+def _reply_text(body: Dict[str, Any]) -> str:
+    """Echo the last message back so callers can check what arrived upstream"""
+    messages = body.get("messages") or [{}]
+    content = messages[-1].get("content", "")
+    if not isinstance(content, str):
+        content = json.dumps(content)
+    return "echo: " + content
+
+
+def completion_body(body: Dict[str, Any], content: str) -> Dict[str, Any]:
+    """Build a non-streaming chat completion response"""
+    prompt_tokens = sum(len(str(m.get("content", ""))) // 4 + 1 for m in body.get("messages", []))
+    completion_tokens = len(content) // 4 + 1
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub-model"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def chunk_body(body: Dict[str, Any], delta: Optional[Dict[str, Any]], finish_reason: Any = None,
+               usage: Optional[Dict[str, int]] = None) -> bytes:
+    """Encode one streamed chat completion chunk as a server-sent event, the usage chunk has no delta"""
+    chunk = {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": body.get("model", "stub-model"),
+        "choices": [] if delta is None else [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    if usage is not None:
+        chunk["usage"] = usage
+    return f"data: {json.dumps(chunk)}\n\n".encode()
+
+
+def _event(data: Dict[str, Any], name: Optional[str] = None) -> bytes:
+    """Encode a server-sent event"""
+    prefix = f"event: {name}\n" if name else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n".encode()
+
+
+def anthropic_body(body: Dict[str, Any], content: str) -> Dict[str, Any]:
+    """Build a non-streaming Anthropic Messages response"""
+    usage = completion_body(body, content)["usage"]
+    return {
+        "id": "msg_stub",
+        "type": "message",
+        "role": "assistant",
+        "model": body.get("model", "stub-model"),
+        "content": [{"type": "text", "text": content}],
+        "stop_reason": "end_turn",
+        "usage": {"input_tokens": usage["prompt_tokens"], "output_tokens": usage["completion_tokens"]},
+    }
+
+
+def gemini_body(body: Dict[str, Any], content: str, finish_reason: Optional[str] = "STOP") -> Dict[str, Any]:
+    """Build a Gemini generateContent response, or one streamed piece of it"""
+    prompt_tokens = sum(len(part.get("text", "")) // 4 + 1
+                        for message in body.get("contents", []) for part in message.get("parts", []))
+    candidate = {"content": {"role": "model", "parts": [{"text": content}]}, "index": 0}
+    if finish_reason:
+        candidate["finishReason"] = finish_reason
+    completion_tokens = len(content) // 4 + 1
+    return {
+        "candidates": [candidate],
+        "usageMetadata": {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": completion_tokens,
+            "totalTokenCount": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def create_app(latency: float = 0.0,
+               jitter: float = 0.0,
+               chunk_delay: float = 0.0,
+               error_rate: float = 0.0,
+               error_status: int = 503,
+               reply: Optional[str] = None) -> Starlette:
+    """
+    Create the stub upstream application
+
+    Args:
+        latency: Seconds before the response (or the first streamed chunk) is sent
+        jitter: Extra random delay of up to this many seconds per request
+        chunk_delay: Seconds between streamed chunks
+        error_rate: Fraction of requests answered with error_status
+        error_status: HTTP status of injected errors
+        reply: Fixed reply text, by default the last message is echoed back
+
+    Returns:
+        ASGI application, received requests are recorded in app.state.stub["requests"]
+    """
+    state = {"requests": []}
+
+    async def receive(request: Request) -> Tuple[Dict[str, Any], Optional[JSONResponse]]:
+        """Record the request, wait the configured latency and maybe inject an error"""
+        body = await request.json()
+        state["requests"].append({"headers": dict(request.headers), "body": body, "path": request.url.path})
+        delay = latency + (random.uniform(0, jitter) if jitter else 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+        if error_rate and random.random() < error_rate:
+            return body, JSONResponse(
+                {"error": {"message": "Injected stub error", "type": "server_error"}},
+                status_code=error_status,
+                headers={"Retry-After": "0"},
+            )
+        return body, None
+
+    def words(content: str):
+        """Split a reply into the pieces streamed one per event"""
+        return [word if i == 0 else " " + word for i, word in enumerate(content.split(" "))]
+
+    async def chat_completions(request: Request):
+        body, error = await receive(request)
+        if error is not None:
+            return error
+        content = reply if reply is not None else _reply_text(body)
+
+        if not body.get("stream"):
+            return JSONResponse(completion_body(body, content))
+
+        async def events():
+            yield chunk_body(body, {"role": "assistant", "content": ""})
+            for word in words(content):
+                if chunk_delay:
+                    await asyncio.sleep(chunk_delay)
+                yield chunk_body(body, {"content": word})
+            yield chunk_body(body, {}, "stop")
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield chunk_body(body, None, usage=completion_body(body, content)["usage"])
+            yield b"data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    async def anthropic_messages(request: Request):
+        body, error = await receive(request)
+        if error is not None:
+            return error
+        content = reply if reply is not None else _reply_text(body)
+        message = anthropic_body(body, content)
+
+        if not body.get("stream"):
+            return JSONResponse(message)
+
+        async def events():
+            start = dict(message, content=[], stop_reason=None, usage=dict(message["usage"], output_tokens=0))
+            yield _event({"type": "message_start", "message": start}, "message_start")
+            yield _event({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}},
+                         "content_block_start")
+            for word in words(content):
+                if chunk_delay:
+                    await asyncio.sleep(chunk_delay)
+                yield _event({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": word}},
+                             "content_block_delta")
+            yield _event({"type": "content_block_stop", "index": 0}, "content_block_stop")
+            yield _event({"type": "message_delta", "delta": {"stop_reason": "end_turn"},
+                          "usage": {"output_tokens": message["usage"]["output_tokens"]}}, "message_delta")
+            yield _event({"type": "message_stop"}, "message_stop")
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    async def gemini_generate(request: Request):
+        body, error = await receive(request)
+        if error is not None:
+            return error
+        model, _, method = request.path_params["target"].partition(":")
+        if reply is not None:
+            content = reply
+        else:
+            parts = (body.get("contents") or [{}])[-1].get("parts") or [{}]
+            content = "echo: " + parts[0].get("text", "")
+
+        if method == "generateContent":
+            return JSONResponse(gemini_body(body, content))
+
+        async def events():
+            pieces = words(content)
+            for i, word in enumerate(pieces):
+                if chunk_delay:
+                    await asyncio.sleep(chunk_delay)
+                yield _event(gemini_body(body, word, "STOP" if i == len(pieces) - 1 else None))
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    async def models(request: Request):
+        return JSONResponse({"object": "list", "data": [{"id": "stub-model", "object": "model", "owned_by": "stub"}]})
+
+    app = Starlette(routes=[
+        Route("/v1/chat/completions", chat_completions, methods=["POST"]),
+        Route("/v1/models", models, methods=["GET"]),
+        Route("/v1/messages", anthropic_messages, methods=["POST"]),
+        Route("/v1beta/models/{target}", gemini_generate, methods=["POST"]),
+    ])
+    app.state.stub = state
+    return app
+
+
+def serve_in_thread(app: Any, host: str = "127.0.0.1") -> Tuple[uvicorn.Server, str]:
+    """
+    Serve an ASGI application on an ephemeral port in a background thread
+
+    Args:
+        app: ASGI application
+        host: Interface to bind
+
+    Returns:
+        Running server (set server.should_exit to stop it) and its base URL
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, 0))
+    port = sock.getsockname()[1]
+
+    server = uvicorn.Server(uvicorn.Config(app, log_level="warning", lifespan="off"))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("Stub server failed to start")
+        time.sleep(0.01)
+    return server, f"http://{host}:{port}"
+
+
+def main():
+    """Run the stub upstream from the command line"""
+    parser = argparse.ArgumentParser(description='Run a local OpenAI, Anthropic and Gemini compatible stub upstream')
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to bind')
+    parser.add_argument('--port', type=int, default=8001, help='Port to listen on')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds before each response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Extra random delay of up to this many seconds')
+    parser.add_argument('--chunk-delay', type=float, default=0.0, help='Seconds between streamed chunks')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with an error')
+    parser.add_argument('--error-status', type=int, default=503, help='HTTP status of injected errors')
+    args = parser.parse_args()
+
+    app = create_app(
+        latency=args.latency,
+        jitter=args.jitter,
+        chunk_delay=args.chunk_delay,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
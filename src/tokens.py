@@ -0,0 +1,76 @@
+"""
+Token Estimation - Cheap token counts for budgeting requests before they are sent
+"""
+
+import os
+from typing import Any, Dict, List, Optional
+
+
+# Average characters per token for English text with common BPE tokenizers
+CHARS_PER_TOKEN = 4
+
+# Tokens of per-message framing (role, separators) added by chat formats
+MESSAGE_OVERHEAD = 4
+
+# Completion tokens assumed when a request does not set max_tokens
+DEFAULT_COMPLETION_TOKENS = 256
+
+
+def estimate_text_tokens(text: str) -> int:
+    """Estimate tokens of a piece of text"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def estimate_message_tokens(message: Dict[str, Any]) -> int:
+    """Estimate tokens of one chat message, including multi-part content"""
+    content = message.get("content") or ""
+    if isinstance(content, str):
+        tokens = estimate_text_tokens(content)
+    else:
+        tokens = sum(estimate_text_tokens(part.get("text", "")) for part in content if isinstance(part, dict))
+    return tokens + MESSAGE_OVERHEAD
+
+
+def estimate_tokens(messages: List[Dict[str, Any]], max_tokens: Optional[int] = None) -> int:
+    """
+    Estimate the total tokens a chat request will be charged for
+
+    Args:
+        messages: List of messages
+        max_tokens: Completion limit of the request, DEFAULT_COMPLETION_TOKENS if not set
+
+    Returns:
+        Estimated prompt plus completion tokens
+    """
+    prompt = sum(estimate_message_tokens(message) for message in messages)
+    return prompt + (max_tokens if max_tokens is not None else DEFAULT_COMPLETION_TOKENS)
+
+
+# Context window sizes by model name prefix, the longest matching prefix wins
+CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-4.1": 1047576,
+    "o1": 200000,
+    "o3": 200000,
+    "o4": 200000,
+    "claude": 200000,
+    "gemini-1.5": 1048576,
+    "gemini-2": 1048576,
+    "deepseek": 65536,
+    "llama-3": 8192,
+    "llama-3.1": 131072,
+}
+
+# Context window assumed for models missing from CONTEXT_WINDOWS
+DEFAULT_CONTEXT_WINDOW = int(os.environ.get("LLM_PROXY_CONTEXT_WINDOW", "8192"))
+
+
+def context_window(model: str) -> int:
+    """Return the context window of a model in tokens"""
+    name = model.rsplit("/", 1)[-1].lower()
+    matches = [prefix for prefix in CONTEXT_WINDOWS if name.startswith(prefix)]
+    return CONTEXT_WINDOWS[max(matches, key=len)] if matches else DEFAULT_CONTEXT_WINDOW
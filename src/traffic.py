@@ -0,0 +1,150 @@
+"""
+Traffic - Records the shape and timing of proxied requests so they can be replayed as load
+"""
+
+import json
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from . import metrics
+
+
+# Text synthetic messages are cut from, its content is irrelevant to the upstream's cost
+FILLER = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor "
+
+
+def content_size(content: Any) -> int:
+    """Characters of a message's content, the text parts of multi-part content are summed"""
+    if content is None:
+        return 0
+    if isinstance(content, str):
+        return len(content)
+    if isinstance(content, list):
+        return sum(len(part.get("text") or "") if isinstance(part, dict) else len(str(part)) for part in content)
+    return len(str(content))
+
+
+class TrafficRecorder:
+    """
+    Metrics hook writing one JSON line per finished request
+
+    A line holds the request's arrival time since recording began, model, role and size of each
+    message, sampling parameters, outcome and timings. Message contents, keys and headers are
+    never written. Lines are written as requests finish, read_log puts them in arrival order.
+    """
+
+    def __init__(self, path: str):
+        """
+        Initialize recorder
+
+        Args:
+            path: JSONL file to write, replaced if it exists
+        """
+        self.path = path
+        self.started = time.perf_counter()
+        self.written = 0
+        self._lock = threading.Lock()
+        self._file = open(path, "w", encoding="utf-8")
+
+    def entry(self, record: metrics.RequestRecord) -> Dict[str, Any]:
+        """Redacted log entry of a finished request"""
+        request = record.request or {}
+        first_token = record.phases.get("first_token")
+        entry = {
+            "t": round(max(0.0, record.started - self.started), 6),
+            "model": request.get("model") or record.model,
+            "stream": record.stream,
+            "messages": [[message.get("role"), content_size(message.get("content"))]
+                         for message in request.get("messages") or ()],
+            "max_tokens": request.get("max_tokens"),
+            "temperature": request.get("temperature"),
+            "status": "cached" if record.cached else "coalesced" if record.coalesced else record.status,
+            "error": record.error,
+            "latency": round(record.phases.get("total", 0.0), 6),
+            "first_token": round(first_token, 6) if first_token is not None else None,
+            "completion_tokens": record.completion_tokens or None,
+        }
+        return {name: value for name, value in entry.items() if value is not None}
+
+    def __call__(self, record: metrics.RequestRecord) -> None:
+        line = json.dumps(self.entry(record), separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(line)
+            # Each line reaches the file as it is written, a crash loses nothing recorded so far
+            self._file.flush()
+            self.written += 1
+
+    def close(self) -> None:
+        """Stop recording and close the file"""
+        metrics.hub.remove_hook(self)
+        with self._lock:
+            self._file.close()
+
+
+def start_recording(path: str) -> TrafficRecorder:
+    """
+    Record every proxied request to a JSONL file until the recorder is closed
+
+    Args:
+        path: JSONL file to write, replaced if it exists
+
+    Returns:
+        Recorder registered with the metrics hub
+    """
+    recorder = TrafficRecorder(path)
+    metrics.hub.add_hook(recorder)
+    return recorder
+
+
+def read_log(path: str) -> List[Dict[str, Any]]:
+    """Entries of a traffic log in arrival order"""
+    with open(path, encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    entries.sort(key=lambda entry: entry["t"])
+    return entries
+
+
+def replay_offsets(entries: Sequence[Dict[str, Any]], speed: float = 1.0, qps: Optional[float] = None) -> List[float]:
+    """
+    Seconds after the start of a replay each entry is sent at
+
+    Args:
+        entries: Log entries in arrival order
+        speed: Time compression of the recorded arrivals, 10 replays an hour of traffic in 6 minutes
+        qps: Send at this fixed rate instead, ignoring recorded arrival times
+
+    Returns:
+        Send offset of each entry
+    """
+    if qps is not None:
+        if qps <= 0:
+            raise ValueError("qps must be positive")
+        return [index / qps for index in range(len(entries))]
+    if speed <= 0:
+        raise ValueError("speed must be positive")
+    first = entries[0]["t"] if entries else 0.0
+    return [(entry["t"] - first) / speed for entry in entries]
+
+
+def synthesize_messages(entry: Dict[str, Any], index: int) -> List[Dict[str, str]]:
+    """
+    Messages with the roles and sizes of a logged request
+
+    Args:
+        entry: Log entry
+        index: Position of the entry in the replay, marks the messages so no two replayed requests
+            are identical and none is answered from a cache or coalesced with another
+
+    Returns:
+        Messages to send
+    """
+    messages = []
+    for position, (role, size) in enumerate(entry.get("messages") or [["user", 0]]):
+        text = f"[{index}.{position}] "
+        missing = max(0, size - len(text))
+        text += (FILLER * (missing // len(FILLER) + 1))[:missing]
+        messages.append({"role": role or "user", "content": text})
+    return messages
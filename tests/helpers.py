@@ -0,0 +1,68 @@
+"""
+Shared test helpers: a manually advanced clock and a mock upstream
+"""
+
+import json
+
+import httpx
+
+
+class FakeClock:
+    """Manually advanced clock"""
+    
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self):
+        return self.now
+
+
+def completion_response(content: str) -> dict:
+    """Minimal chat completion body"""
+    return {
+        "id": "chatcmpl-test",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "gpt-3.5-turbo",
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }],
+        "usage": {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5}
+    }
+
+
+def stream_response(pieces: list) -> bytes:
+    """Server-sent events body streaming pieces as chat completion chunks"""
+    events = []
+    for piece in pieces:
+        chunk = {
+            "id": "chatcmpl-test",
+            "object": "chat.completion.chunk",
+            "created": 0,
+            "model": "gpt-3.5-turbo",
+            "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]
+        }
+        events.append(f"data: {json.dumps(chunk)}\n\n")
+    events.append("data: [DONE]\n\n")
+    return "".join(events).encode()
+
+
+class RecordingUpstream:
+    """Mock transport handler that records requests and echoes the last user message"""
+    
+    def __init__(self):
+        self.requests = []
+    
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        self.requests.append((request, body))
+        content = "echo: " + body["messages"][-1]["content"]
+        if body.get("stream"):
+            return httpx.Response(
+                200,
+                content=stream_response(content.split(" ")),
+                headers={"Content-Type": "text/event-stream"}
+            )
+        return httpx.Response(200, json=completion_response(content))
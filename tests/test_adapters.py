@@ -0,0 +1,152 @@
+"""
+Test native provider adapters against the stub upstream
+"""
+
+import asyncio
+import unittest
+import os
+import sys
+
+import httpx
+
+# Add project root directory to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src import adapters, stub_upstream
+from src.client_pool import ClientPool
+from src.key_generator import generate_encrypted_key
+from src.llm_proxy import AsyncLLMProxy, LLMProxy
+from src.models import LLMConfig
+from src.resilience import RetryPolicy, is_transient
+
+
+class TestAdapterTranslation(unittest.TestCase):
+    """Test request translation without a network"""
+    
+    def setUp(self):
+        self.kwargs = {
+            "model": "model-x",
+            "messages": [
+                {"role": "system", "content": "Be brief"},
+                {"role": "user", "content": "hi"},
+                {"role": "assistant", "content": "hello"},
+                {"role": "user", "content": [{"type": "text", "text": "again"}]},
+            ],
+            "temperature": 1.5,
+            "top_k": 5,
+            "extra_headers": {"X-Trace": "1"},
+        }
+    
+    def config(self, provider: str, base_url: str) -> LLMConfig:
+        return LLMConfig(provider=provider, base_url=base_url, api_key="secret", model="model-x")
+    
+    def test_anthropic_request(self):
+        """Test system prompts move to the top level and max_tokens is always set"""
+        url, headers, body = adapters.AnthropicAdapter().request(
+            self.config("anthropic", "https://api.anthropic.com/v1"), self.kwargs, stream=False)
+        self.assertEqual(url, "https://api.anthropic.com/v1/messages")
+        self.assertEqual(headers["x-api-key"], "secret")
+        self.assertEqual(headers["X-Trace"], "1")
+        self.assertEqual(body["system"], "Be brief")
+        self.assertEqual([m["role"] for m in body["messages"]], ["user", "assistant", "user"])
+        self.assertEqual(body["messages"][-1]["content"], "again")
+        self.assertEqual(body["max_tokens"], adapters.AnthropicAdapter.DEFAULT_MAX_TOKENS)
+        self.assertEqual(body["temperature"], 1.0)
+        self.assertEqual(body["top_k"], 5)
+    
+    def test_gemini_request(self):
+        """Test roles, generation config and streaming URL"""
+        kwargs = dict(self.kwargs, max_tokens=20, generationConfig={"topP": 0.5})
+        url, headers, body = adapters.GeminiAdapter().request(
+            self.config("google", "https://generativelanguage.googleapis.com/v1beta"), kwargs, stream=True)
+        self.assertTrue(url.endswith("/models/model-x:streamGenerateContent?alt=sse"))
+        self.assertEqual(headers["x-goog-api-key"], "secret")
+        self.assertEqual(body["systemInstruction"], {"parts": [{"text": "Be brief"}]})
+        self.assertEqual([c["role"] for c in body["contents"]], ["user", "model", "user"])
+        self.assertEqual(body["generationConfig"], {"temperature": 1.5, "maxOutputTokens": 20, "topP": 0.5})
+    
+    def test_error_response(self):
+        """Test error statuses raise retryable errors carrying the upstream message"""
+        def upstream(request):
+            return httpx.Response(503, json={"error": {"message": "overloaded"}}, headers={"Retry-After": "1"})
+        with httpx.Client(transport=httpx.MockTransport(upstream)) as client:
+            with self.assertRaises(adapters.UpstreamStatusError) as raised:
+                adapters.OpenAIAdapter().send(client, self.config("openai", "http://upstream.test/v1"), self.kwargs)
+        self.assertEqual(raised.exception.status_code, 503)
+        self.assertIn("overloaded", str(raised.exception))
+        self.assertTrue(is_transient(raised.exception))
+
+
+class TestNativeProxy(unittest.TestCase):
+    """Test proxies using native adapters end to end against the stub upstream"""
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.upstream_app = stub_upstream.create_app()
+        cls.upstream, cls.upstream_url = stub_upstream.serve_in_thread(cls.upstream_app)
+    
+    @classmethod
+    def tearDownClass(cls):
+        cls.upstream.should_exit = True
+    
+    def setUp(self):
+        self.pool = ClientPool()
+    
+    def tearDown(self):
+        self.pool.close()
+    
+    def key(self, provider: str, path: str) -> str:
+        return generate_encrypted_key(provider, self.upstream_url + path, "upstream-key", "stub-model",
+                                      extra_body={"top_p": 0.5})
+    
+    def test_providers(self):
+        """Test every provider returns the same text in plain and streaming mode"""
+        for provider, path, adapter in (("openai", "/v1", "native"), ("openai", "/v1", "sdk"),
+                                        ("anthropic", "/v1", None), ("google", "/v1beta", None)):
+            with self.subTest(provider=provider, adapter=adapter):
+                proxy = LLMProxy(self.key(provider, path), pool=self.pool, adapter=adapter)
+                self.assertEqual(proxy.chat([{"role": "user", "content": "hello there"}]), "echo: hello there")
+                self.assertEqual("".join(proxy.chat_stream([{"role": "user", "content": "a b c"}])), "echo: a b c")
+                self.assertEqual(self.upstream_app.state.stub["requests"][-1]["body"]["top_p"], 0.5)
+    
+    def test_anthropic_headers(self):
+        """Test the Anthropic key and version headers are sent"""
+        LLMProxy(self.key("anthropic", "/v1"), pool=self.pool).chat([{"role": "user", "content": "hi"}])
+        request = self.upstream_app.state.stub["requests"][-1]
+        self.assertEqual(request["path"], "/v1/messages")
+        self.assertEqual(request["headers"]["x-api-key"], "upstream-key")
+        self.assertEqual(request["headers"]["anthropic-version"], adapters.AnthropicAdapter.API_VERSION)
+    
+    def test_async_gemini(self):
+        """Test the async proxy uses the async pooled client"""
+        async def run():
+            proxy = AsyncLLMProxy(self.key("google", "/v1beta"), pool=self.pool)
+            text = await proxy.achat([{"role": "user", "content": "hi"}])
+            pieces = [piece async for piece in proxy.achat_stream([{"role": "user", "content": "x y"}])]
+            await proxy.aclose()
+            return text, pieces
+        text, pieces = asyncio.run(run())
+        self.assertEqual(text, "echo: hi")
+        self.assertEqual(pieces, ["echo:", " x", " y"])
+    
+    def test_retries_native_errors(self):
+        """Test transient native errors go through the retry policy"""
+        app = stub_upstream.create_app(error_rate=1.0, error_status=503)
+        server, url = stub_upstream.serve_in_thread(app)
+        try:
+            key = generate_encrypted_key("anthropic", url + "/v1", "upstream-key", "stub-model")
+            proxy = LLMProxy(key, pool=self.pool, retry_policy=RetryPolicy(max_retries=2, base_delay=0))
+            with self.assertRaises(adapters.UpstreamStatusError):
+                proxy.chat([{"role": "user", "content": "hi"}])
+        finally:
+            server.should_exit = True
+        self.assertEqual(len(app.state.stub["requests"]), 3)
+    
+    def test_sdk_rejected_for_native_providers(self):
+        """Test the OpenAI SDK cannot be forced onto other APIs"""
+        with self.assertRaises(ValueError):
+            LLMProxy(self.key("anthropic", "/v1"), pool=self.pool, adapter="sdk")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+"""
+Test the Gradio chat application sessions
+"""
+
+import asyncio
+import unittest
+import os
+import sys
+from unittest import mock
+
+import httpx
+
+# Add project root directory to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.app import LLMChatApp, create_demo
+from src.client_pool import ClientPool
+from src.key_generator import generate_encrypted_key
+from tests.helpers import RecordingUpstream
+
+
+class TestLLMChatApp(unittest.TestCase):
+    """Test the Gradio chat application sessions"""
+    
+    def setUp(self):
+        self.upstream = RecordingUpstream()
+        self.pool = ClientPool(transport=httpx.MockTransport(self.upstream))
+    
+    def tearDown(self):
+        self.pool.close()
+    
+    def key(self, model):
+        return generate_encrypted_key("openai", "http://upstream.test/v1", "test-api-key", model)
+    
+    def test_sessions_are_independent(self):
+        """Test concurrent sessions keep their own configuration, history and context"""
+        first, second = LLMChatApp(self.pool), LLMChatApp(self.pool)
+        self.assertIn("model-a", first.validate_config(self.key("model-a")))
+        self.assertIn("model-b", second.validate_config(self.key("model-b")))
+        
+        async def talk(session, message):
+            async for _, history, error in session.chat(message):
+                pass
+            return history, error
+        
+        async def run():
+            await asyncio.gather(talk(first, "hello"), talk(second, "hi"))
+            return await talk(first, "again")
+        
+        history, error = asyncio.run(run())
+        self.assertEqual(error, "")
+        self.assertEqual([entry["content"] for entry in history], ["hello", "echo:hello", "again", "echo:again"])
+        self.assertEqual(len(second.chat_history), 2)
+        
+        # The last request carried the first session's earlier turns and nothing of the second one
+        _, body = self.upstream.requests[-1]
+        self.assertEqual(body["model"], "model-a")
+        self.assertEqual([message["content"] for message in body["messages"]], ["hello", "echo:hello", "again"])
+    
+    def test_unanswered_message_dropped(self):
+        """Test a failed or cancelled reply leaves its message out of the context sent next"""
+        session = LLMChatApp(self.pool)
+        session.validate_config(self.key("model-a"))
+        streaming = asyncio.Event()
+        
+        async def stalled(messages):
+            yield "partial"
+            streaming.set()
+            await asyncio.sleep(5)
+        
+        async def failing(messages):
+            raise RuntimeError("upstream down")
+            yield
+        
+        async def talk(message):
+            async for _, history, error in session.chat(message):
+                pass
+            return error
+        
+        async def run():
+            with mock.patch.object(session.llm_proxy, "achat_stream", stalled):
+                task = asyncio.ensure_future(talk("cancelled"))
+                await streaming.wait()
+                task.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await task
+            with mock.patch.object(session.llm_proxy, "achat_stream", failing):
+                self.assertEqual(await talk("failed"), "Error: upstream down")
+            return await talk("again")
+        
+        self.assertEqual(asyncio.run(run()), "")
+        _, body = self.upstream.requests[-1]
+        self.assertEqual([message["content"] for message in body["messages"]], ["again"])
+    
+    def test_demo_queue(self):
+        """Test the demo is built with a concurrent queue"""
+        demo = create_demo(pool=self.pool, concurrency_limit=8, max_queue_size=16)
+        self.assertEqual(demo._queue.default_concurrency_limit, 8)
+        self.assertEqual(demo._queue.max_size, 16)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+"""
+Test multi-backend load balancing
+"""
+
+import asyncio
+import unittest
+import os
+import sys
+
+import httpx
+
+# Add project root directory to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.balancer import BalancerRegistry, LoadBalancer
+from src.client_pool import ClientPool
+from src.deadlines import DeadlineExceeded
+from src.key_generator import KeyGenerator, generate_encrypted_key
+from src.llm_proxy import LLMProxy
+from src.models import LLMConfig
+from src.resilience import BreakerRegistry
+
+
+class TestLoadBalancer(unittest.TestCase):
+    """Test multi-backend load balancing"""
+    
+    def setUp(self):
+        """Set up test environment"""
+        self.config = LLMConfig(
+            provider="openrouter",
+            base_url="http://a.test/v1",
+            api_key="key-a",
+            model="gpt-4o",
+            headers={"X-Title": "App"},
+            backends=[
+                {"base_url": "http://a.test/v1", "api_key": "key-a"},
+                {"base_url": "http://b.test/v1", "api_key": "key-b", "model": "openai/gpt-4o",
+                 "headers": {"X-Region": "eu"}},
+            ]
+        )
+    
+    def test_backend_configs(self):
+        """Test backends inherit defaults from the configuration"""
+        first, second = self.config.backend_configs()
+        self.assertEqual(first.model, "gpt-4o")
+        self.assertEqual(second.model, "openai/gpt-4o")
+        self.assertEqual(second.headers, {"X-Title": "App", "X-Region": "eu"})
+    
+    def test_prefers_faster_backend(self):
+        """Test power-of-two-choices favours the lower latency backend"""
+        balancer = LoadBalancer(self.config, BreakerRegistry())
+        fast, slow = balancer.backends
+        fast.ewma_latency, slow.ewma_latency = 0.1, 1.0
+        # The faster of two draws is expected 3 times in 4, enough draws keep the bound well below that
+        picks = [balancer.pick() for _ in range(1000)]
+        self.assertGreater(picks.count(fast), 680)
+    
+    def test_drains_unhealthy_backend(self):
+        """Test backends with an open breaker receive no traffic"""
+        breakers = BreakerRegistry(min_requests=1, window=1)
+        balancer = LoadBalancer(self.config, breakers)
+        healthy, broken = balancer.backends
+        broken.breaker.record_failure()
+        self.assertFalse(broken.healthy)
+        self.assertTrue(all(balancer.pick() is healthy for _ in range(50)))
+    
+    def test_only_upstream_failures_penalised(self):
+        """Test client errors, caller deadlines and cancellations do not count against a backend"""
+        balancer = LoadBalancer(self.config, BreakerRegistry(), failure_penalty=1.0)
+        backend = balancer.backends[0]
+        bad_request = httpx.HTTPStatusError("bad request", request=httpx.Request("POST", "http://a.test/v1"),
+                                            response=httpx.Response(400))
+        for error in (bad_request, DeadlineExceeded(1.0), asyncio.CancelledError()):
+            balancer.finish(backend, backend.start(), error)
+        self.assertEqual(backend.failures, 0)
+        self.assertLess(backend.ewma_latency, 0.5)
+        self.assertEqual(backend.inflight, 0)
+        
+        balancer.finish(backend, backend.start(), httpx.ConnectError("refused"))
+        self.assertEqual(backend.failures, 1)
+        self.assertGreater(backend.ewma_latency, 0.25)
+    
+    def test_registry(self):
+        """Test balancers are shared per configuration and breaker registry, bounded and keyed without secrets"""
+        registry = BalancerRegistry(maxsize=2)
+        breakers = BreakerRegistry()
+        first = registry.get(self.config, breakers)
+        self.assertIs(registry.get(self.config.model_copy(update={"extra_body": {"top_p": 1}}), breakers), first)
+        self.assertIsNot(registry.get(self.config, BreakerRegistry()), first)
+        self.assertIsNot(registry.get(self.config.model_copy(update={"api_key": "key-c"}), breakers), first)
+        self.assertFalse(any("key-a" in str(key) for key in registry._balancers._data))
+        self.assertIsNot(registry.get(self.config, breakers), first)
+    
+    def test_encrypted_backends(self):
+        """Test backends survive encryption"""
+        encrypted_key = KeyGenerator.encrypt_config(self.config)
+        decrypted = KeyGenerator.decrypt_config(encrypted_key)
+        self.assertEqual(len(decrypted.backends), 2)
+        self.assertEqual(decrypted.backends[1].api_key, "key-b")
+    
+    def test_proxy_spreads_requests(self):
+        """Test proxy sends requests to every backend with its own key and model"""
+        seen = []
+        
+        def handler(request: httpx.Request) -> httpx.Response:
+            seen.append((request.url.host, request.headers["Authorization"], request.headers.get("X-Region")))
+            return httpx.Response(200, json={
+                "id": "chatcmpl-test",
+                "object": "chat.completion",
+                "created": 0,
+                "model": "gpt-4o",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}]
+            })
+        
+        pool = ClientPool(transport=httpx.MockTransport(handler))
+        encrypted_key = generate_encrypted_key(
+            provider="openrouter",
+            base_url="http://a.test/v1",
+            api_key="key-a",
+            model="gpt-4o",
+            backends=[
+                {"base_url": "http://a.test/v1", "api_key": "key-a"},
+                {"base_url": "http://b.test/v1", "api_key": "key-b", "headers": {"X-Region": "eu"}},
+            ]
+        )
+        proxy = LLMProxy(encrypted_key, pool=pool, breakers=BreakerRegistry())
+        for _ in range(40):
+            proxy.send_message("hi")
+        
+        self.assertIn(("a.test", "Bearer key-a", None), seen)
+        self.assertIn(("b.test", "Bearer key-b", "eu"), seen)
+        self.assertEqual(sum(backend["requests"] for backend in proxy.balancer.snapshot()), 40)
+        pool.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+"""
+Test bulk key encryption, decryption and rotation
+"""
+
+import io
+import json
+import tempfile
+import unittest
+import os
+import sys
+
+# Add project root directory to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src import bulk_keys
+from src.key_generator import KeyGenerator
+
+
+CSV_INPUT = """id,provider,base_url,api_key,model,headers,rpm
+team-a,openai,https://api.openai.com/v1,sk-a,gpt-4,"{""X-Team"": ""a""}",500
+team-b,anthropic,https://api.anthropic.com/v1,sk-b,claude,,
+team-c,nonsense,https://example.com,sk-c,model,,
+"""
+
+
+class TestBulkKeys(unittest.TestCase):
+    """Test bulk key encryption, decryption and rotation"""
+    
+    def test_read_records(self):
+        """Test CSV cells are typed and unreadable JSON lines keep their place"""
+        records = list(bulk_keys.read_records(io.StringIO(CSV_INPUT), "csv"))
+        self.assertEqual(records[0]["headers"], {"X-Team": "a"})
+        self.assertEqual(records[0]["rpm"], 500)
+        self.assertNotIn("headers", records[1])
+        
+        records = list(bulk_keys.read_records(io.StringIO('{"token": "a"}\nnot json\n\n{"token": "b"}\n'), "jsonl"))
+        self.assertEqual(len(records), 3)
+        self.assertIn("_invalid", records[1])
+        
+        records = list(bulk_keys.read_records(io.StringIO("tok1\ntok2\n"), "text"))
+        self.assertEqual(records, [{"token": "tok1"}, {"token": "tok2"}])
+    
+    def test_encrypt_rotate_decrypt(self):
+        """Test a full rotation across worker processes keeps order, ids and contents"""
+        configs = [
+            {"id": i, "provider": "openai", "base_url": "https://api.openai.com/v1",
+             "api_key": f"sk-{i}", "model": "gpt-4"}
+            for i in range(50)
+        ]
+        encrypted = list(bulk_keys.bulk_process(configs, "encrypt", master_key="old", workers=2, chunksize=8))
+        self.assertEqual([result["id"] for result in encrypted], list(range(50)))
+        
+        progress = []
+        rotated = list(bulk_keys.bulk_process(
+            ({"id": result["id"], "token": result["token"]} for result in encrypted),
+            "rotate", master_key="old", new_master_key="new", workers=2, chunksize=8,
+            progress=lambda processed, failed: progress.append(processed)
+        ))
+        self.assertEqual(progress[-1], 50)
+        self.assertEqual(KeyGenerator.decrypt_config(rotated[7]["token"], use_cache=False, master_key="new").api_key, "sk-7")
+        
+        decrypted = list(bulk_keys.bulk_process(rotated, "decrypt", master_key="new", workers=1))
+        self.assertEqual([result["config"]["api_key"] for result in decrypted], [f"sk-{i}" for i in range(50)])
+    
+    def test_failures_are_reported(self):
+        """Test bad records fail individually without leaking their contents"""
+        records = bulk_keys.read_records(io.StringIO(CSV_INPUT), "csv")
+        results = list(bulk_keys.bulk_process(records, "encrypt", master_key="old", workers=1))
+        self.assertEqual([("error" in result) for result in results], [False, False, True])
+        self.assertEqual(results[2]["id"], "team-c")
+        self.assertEqual(results[2]["line"], 3)
+        self.assertNotIn("sk-c", results[2]["error"])
+        
+        results = list(bulk_keys.bulk_process([{"api_key": "sk-secret"}], "encrypt", workers=1))
+        self.assertIn("base_url: Field required", results[0]["error"])
+        self.assertNotIn("sk-secret", results[0]["error"])
+        
+        results = list(bulk_keys.bulk_process([{"token": "garbage"}], "rotate", master_key="old", workers=1))
+        self.assertIn("error", results[0])
+    
+    def test_cli(self):
+        """Test the command line tool streams JSONL and signals failures in its exit status"""
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, "teams.csv")
+            output = os.path.join(directory, "keys.jsonl")
+            with open(source, "w") as f:
+                f.write(CSV_INPUT)
+            status = bulk_keys.main(["encrypt", source, "-o", output, "--master-key", "old",
+                                     "--workers", "1", "--quiet"])
+            with open(output) as f:
+                results = [json.loads(line) for line in f]
+        self.assertEqual(status, 1)
+        self.assertEqual(len(results), 3)
+        self.assertTrue(results[0]["token"].startswith(KeyGenerator.V2_PREFIX))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+"""
+Test TTL cache functionality
+"""
+
+import unittest
+import os
+import sys
+
+# Add project root directory to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.cache import TTLCache
+from tests.helpers import FakeClock
+
+
+class TestTTLCache(unittest.TestCase):
+    """Test TTL cache functionality"""
+
+    def setUp(self):
+        """Set up test environment"""
+        self.clock = FakeClock()
+        self.cache = TTLCache(maxsize=2, ttl=10, timer=self.clock)
+
+    def test_hit_and_miss(self):
+        """Test hit/miss counters"""
+        self.assertIsNone(self.cache.get("a"))
+        self.cache.set("a", 1)
+        self.assertEqual(self.cache.get("a"), 1)
+        stats = self.cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+
+    def test_lru_eviction(self):
+        """Test least recently used entry is evicted"""
+        self.cache.set("a", 1)
+        self.cache.set("b", 2)
+        self.cache.get("a")
+        self.cache.set("c", 3)
+        self.assertIn("a", self.cache)
+        self.assertNotIn("b", self.cache)
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+
+    def test_expiry(self):
+        """Test entries expire after TTL"""
+        self.cache.set("a", 1)
+        self.clock.now = 11
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.cache.stats()["expirations"], 1)
+
+    def test_invalidate(self):
+        """Test explicit invalidation"""
+        self.cache.set("a", 1)
+        self.assertTrue(self.cache.invalidate("a"))
+        self.assertFalse(self.cache.invalidate("a"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+"""
+Test the command line and what each entry point loads at import
+"""
+
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+# Add project root directory to Python path
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from src import stub_upstream
+from src.__main__ import main
+
+
+def run(*argv):
+    """Run the command line in-process, returns the exit status, stdout and stderr"""
+    stdout, stderr = io.StringIO(), io.StringIO()
+    with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+        status = main(list(argv))
+    return status, stdout.getvalue(), stderr.getvalue()
+
+
+class TestLazyImports(unittest.TestCase):
+    """Test modules load heavy dependencies only once they are used"""
+    
+    def loaded(self, statement):
+        """Heavy modules loaded by a statement run in a fresh interpreter"""
+        script = (f"import json, sys\n{statement}\n"
+                  "print(json.dumps([m for m in ('openai', 'pydantic', 'gradio') if m in sys.modules]))")
+        output = subprocess.check_output([sys.executable, "-c", script], cwd=ROOT)
+        return json.loads(output.decode().strip().splitlines()[-1])
+    
+    def test_key_operations_load_nothing_heavy(self):
+        """Test importing the key generator and decrypting a key load neither pydantic nor the SDK"""
+        self.assertEqual(self.loaded("import src.key_generator"), [])
+        self.assertEqual(self.loaded("import src.__main__"), [])
+    
+    def test_proxy_loads_sdk_on_first_client(self):
+        """Test the provider SDK is loaded only when a client is constructed"""
+        self.assertNotIn("openai", self.loaded("import src.llm_proxy, src.server"))
+        self.assertIn("openai", self.loaded(
+            "from src.key_generator import generate_encrypted_key\n"
+            "from src.llm_proxy import LLMProxy\n"
+            "LLMProxy(generate_encrypted_key('openai', 'http://upstream.test/v1', 'sk-test', 'gpt-4o')).client"))
+    
+    def test_gateway_app_created_on_demand(self):
+        """Test importing the gateway neither creates its app nor enables metrics, src.server:app still works"""
+        script = ("import src.server\nfrom src import metrics\nprint(metrics.hub.active)\n"
+                  "app = src.server.app\nprint(metrics.hub.active, app is src.server.app)")
+        output = subprocess.check_output([sys.executable, "-c", script], cwd=ROOT)
+        self.assertEqual(output.decode().split(), ["False", "True", "True"])
+    
+    def test_apps_load_gradio_on_demand(self):
+        """Test the web apps import without loading gradio"""
+        self.assertNotIn("gradio", self.loaded("import src.app, src.key_generator_app"))
+
+
+class TestCommandLine(unittest.TestCase):
+    """Test the python -m src commands"""
+    
+    def test_encrypt_decrypt_round_trip(self):
+        """Test a key encrypted on the command line decrypts to the given configuration"""
+        status, key, _ = run("encrypt", "--provider", "openai", "--base-url", "http://upstream.test/v1",
+                             "--api-key", "sk-cli", "--model", "gpt-4o", "--header", "X-Team=search",
+                             "--extra-body", "top_k=5", "--rpm", "60", "--master-key", "cli-master")
+        self.assertEqual(status, 0)
+        
+        status, output, _ = run("decrypt", key.strip(), "--master-key", "cli-master")
+        self.assertEqual(status, 0)
+        config = json.loads(output)
+        self.assertEqual((config["api_key"], config["model"], config["rpm"]), ("sk-cli", "gpt-4o", 60))
+        self.assertEqual(config["headers"], {"X-Team": "search"})
+        self.assertEqual(config["extra_body"], {"top_k": 5})
+    
+    def test_decrypt_wrong_master_key(self):
+        """Test a failed command reports the error and exits non-zero"""
+        _, key, _ = run("encrypt", "--provider", "openai", "--base-url", "http://upstream.test/v1",
+                        "--api-key", "sk-cli", "--model", "gpt-4o", "--master-key", "cli-master")
+        status, output, error = run("decrypt", key.strip(), "--master-key", "other-master")
+        self.assertEqual((status, output), (1, ""))
+        self.assertIn("Error", error)
+    
+    def test_chat(self):
+        """Test chat prints the reply streamed and whole"""
+        server, url = stub_upstream.serve_in_thread(stub_upstream.create_app())
+        try:
+            _, key, _ = run("encrypt", "--provider", "openai", "--base-url", url + "/v1",
+                            "--api-key", "sk-cli", "--model", "stub-model")
+            for options in ((), ("--no-stream",)):
+                status, output, _ = run("chat", "--key", key.strip(), *options, "Hello from the command line")
+                self.assertEqual(status, 0)
+                self.assertTrue(output.strip())
+        finally:
+            server.should_exit = True
+
+
+if __name__ == "__main__":
+    unittest.main()
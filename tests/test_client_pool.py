@@ -0,0 +1,112 @@
+"""
+Test client pool functionality
+"""
+
+import asyncio
+import unittest
+import os
+import sys
+
+# Add project root directory to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.client_pool import ClientPool
+from src.key_generator import generate_encrypted_key
+from src.llm_proxy import LLMProxy
+from src.models import LLMConfig
+
+
+class TestClientPool(unittest.TestCase):
+    """Test client pool functionality"""
+    
+    def setUp(self):
+        """Set up test environment"""
+        self.pool = ClientPool(max_connections=5, timeout=30)
+        self.config = LLMConfig(
+            provider="openai",
+            base_url="http://127.0.0.1:9/v1",
+            api_key="test-api-key",
+            model="gpt-3.5-turbo"
+        )
+    
+    def tearDown(self):
+        self.pool.close()
+    
+    def test_client_reuse(self):
+        """Test identical configurations share a client"""
+        client = self.pool.get_client(self.config)
+        self.assertIs(self.pool.get_client(self.config.model_copy()), client)
+        
+        other = self.pool.get_client(self.config.model_copy(update={"api_key": "other-key"}))
+        self.assertIsNot(other, client)
+        
+        # Different clients still share one connection pool
+        self.assertIs(other._client, client._client)
+        self.assertEqual(self.pool.stats()["clients"], 2)
+    
+    def test_proxies_share_client(self):
+        """Test proxies created from the same key reuse the pooled client"""
+        encrypted_key = generate_encrypted_key(
+            provider="openai",
+            base_url="http://127.0.0.1:9/v1",
+            api_key="test-api-key",
+            model="gpt-3.5-turbo"
+        )
+        first = LLMProxy(encrypted_key, pool=self.pool)
+        second = LLMProxy(encrypted_key, pool=self.pool)
+        self.assertIs(first.client, second.client)
+    
+    def test_close(self):
+        """Test closing releases clients and connections"""
+        client = self.pool.get_client(self.config)
+        http_client = client._client
+        self.pool.close()
+        self.assertTrue(http_client.is_closed)
+        self.assertIsNot(self.pool.get_client(self.config), client)
+    
+    def test_bounded(self):
+        """Test the registry keeps the most recently used clients only"""
+        pool = ClientPool(max_clients=2)
+        first = pool.get_client(self.config.model_copy(update={"api_key": "key-a"}))
+        for key in ("key-b", "key-c"):
+            pool.get_client(self.config.model_copy(update={"api_key": key}))
+        self.assertEqual(pool.stats()["clients"], 2)
+        self.assertIsNot(pool.get_client(self.config.model_copy(update={"api_key": "key-a"})), first)
+        # Evicted clients leave the shared connection pool open for the others
+        self.assertFalse(first._client.is_closed)
+        pool.close()
+    
+    def test_async_connections_closed(self):
+        """Test reconfiguring closes async connections on their own event loop, running or not"""
+        async def open_client():
+            return self.pool.get_async_client(self.config)._client
+        
+        async def reconfigure():
+            http_client = await open_client()
+            self.pool.configure(timeout=5)
+            await asyncio.sleep(0.01)
+            return http_client
+        
+        self.assertTrue(asyncio.run(reconfigure()).is_closed)
+        
+        loop = asyncio.new_event_loop()
+        try:
+            http_client = loop.run_until_complete(open_client())
+            self.pool.close()
+            self.assertFalse(http_client.is_closed)
+            loop.run_until_complete(asyncio.sleep(0.01))
+            self.assertTrue(http_client.is_closed)
+        finally:
+            loop.close()
+    
+    def test_configure(self):
+        """Test settings apply to new clients"""
+        self.pool.configure(max_connections=2, timeout=5)
+        client = self.pool.get_client(self.config)
+        self.assertEqual(client.timeout.read, 5)
+        with self.assertRaises(ValueError):
+            self.pool.configure(unknown=1)
+
+
+if __name__ == "__main__":
+    unittest.main()
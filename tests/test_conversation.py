@@ -0,0 +1,80 @@
+"""
+Test token-windowed conversations
+"""
+
+import time
+import unittest
+import os
+import sys
+
+# Add project root directory to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.conversation import Conversation
+from src.tokens import DEFAULT_CONTEXT_WINDOW, context_window, estimate_tokens
+
+
+class TestConversation(unittest.TestCase):
+    """Test token-windowed conversations"""
+    
+    def test_context_window(self):
+        """Test the longest model name prefix wins and unknown models get the default"""
+        self.assertEqual(context_window("gpt-4"), 8192)
+        self.assertEqual(context_window("gpt-4o-mini"), 128000)
+        self.assertEqual(context_window("anthropic/claude-3-haiku"), 200000)
+        self.assertEqual(context_window("my-model"), DEFAULT_CONTEXT_WINDOW)
+    
+    def test_window_stays_within_budget(self):
+        """Test old turns are dropped, system prompts kept and the window starts at a user message"""
+        conversation = Conversation(system_prompt="Be brief.", max_prompt_tokens=200)
+        for i in range(50):
+            conversation.add_user(f"question {i} " + "word " * 20)
+            conversation.add_assistant(f"answer {i} " + "word " * 20)
+            messages = conversation.messages()
+            self.assertLessEqual(estimate_tokens(messages, max_tokens=0), 200)
+            self.assertEqual(conversation.tokens, estimate_tokens(messages, max_tokens=0))
+        
+        messages = conversation.messages()
+        self.assertEqual(messages[0], {"role": "system", "content": "Be brief."})
+        self.assertEqual(messages[1]["role"], "user")
+        self.assertTrue(messages[-1]["content"].startswith("answer 49"))
+        self.assertGreater(conversation.dropped, 0)
+        
+        self.assertEqual(conversation.pop()["role"], "assistant")
+        conversation.clear()
+        self.assertEqual(len(conversation.messages()), 1)
+    
+    def test_summarizer(self):
+        """Test dropped turns are folded into a summary sent after the system prompt"""
+        calls = []
+        
+        def summarize(summary, dropped):
+            calls.append(len(dropped))
+            return f"{summary or ''}{len(dropped)} messages;"
+        
+        conversation = Conversation(max_prompt_tokens=100, summarizer=summarize)
+        for i in range(10):
+            conversation.add_user("word " * 20)
+            conversation.add_assistant("word " * 20)
+        messages = conversation.messages()
+        self.assertTrue(messages[0]["content"].startswith(Conversation.SUMMARY_PREFIX))
+        self.assertEqual(conversation.summary.count(";"), len(calls))
+        self.assertLessEqual(conversation.tokens, 100)
+    
+    def test_window_size_is_bounded(self):
+        """Test a long conversation sends as many messages as a short one once the budget is reached"""
+        conversation = Conversation("gpt-4")
+        
+        def add_turns(count):
+            for _ in range(count):
+                conversation.add_user("word " * 50)
+                conversation.add_assistant("word " * 50)
+            return len(conversation.messages())
+        
+        early = add_turns(1000)
+        self.assertEqual(add_turns(20000), early)
+        self.assertLessEqual(conversation.tokens, 8192 - 256)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,255 @@
+"""
+Test per-call deadlines and cancellation
+"""
+
+import asyncio
+import threading
+import time
+import unittest
+import os
+import sys
+
+import httpx
+from starlette.testclient import TestClient
+
+# Add project root directory to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src import stub_upstream
+from src.client_pool import ClientPool
+from src.deadlines import CancelToken, Deadline, DeadlineExceeded, RequestCancelled
+from src.key_generator import generate_encrypted_key
+from src.llm_proxy import AsyncLLMProxy, LLMProxy
+from src.resilience import BreakerRegistry, CircuitBreaker, RetryPolicy, call_with_retries, default_breakers
+from src.server import create_app
+
+
+class LapsingDeadline(Deadline):
+    """Deadline running out between the checks before an attempt and sending it"""
+    
+    def http_timeout(self, base=None):
+        raise DeadlineExceeded(self.timeout)
+
+
+def half_open(breaker):
+    """Open a breaker that probes again at once"""
+    breaker.reset_timeout = 0
+    for _ in range(breaker.min_requests):
+        breaker.record_failure()
+    return breaker
+
+
+class TestDeadline(unittest.TestCase):
+    """Test deadlines and cancel tokens on their own"""
+    
+    def test_http_timeout(self):
+        """Test each phase keeps the shorter of its own limit and the time left"""
+        timeout = Deadline(30).http_timeout(httpx.Timeout(600, connect=10))
+        self.assertEqual(timeout.connect, 10)
+        self.assertLessEqual(timeout.read, 30)
+        self.assertGreater(timeout.read, 29)
+        
+        deadline = Deadline(0)
+        self.assertTrue(deadline.expired)
+        with self.assertRaises(DeadlineExceeded):
+            deadline.http_timeout()
+    
+    def test_of(self):
+        """Test timeouts become deadlines and deadlines pass through"""
+        deadline = Deadline(5)
+        self.assertIs(Deadline.of(deadline), deadline)
+        self.assertIsNone(Deadline.of(None))
+        self.assertEqual(Deadline.of(2).timeout, 2)
+    
+    def test_cancel_token(self):
+        """Test callbacks run once on cancel, and at once when registered afterwards"""
+        token = CancelToken()
+        calls = []
+        forget = token.on_cancel(lambda: calls.append("forgotten"))
+        token.on_cancel(lambda: calls.append("first"))
+        forget()
+        token.check()
+        token.cancel()
+        token.cancel()
+        token.on_cancel(lambda: calls.append("late"))
+        self.assertEqual(calls, ["first", "late"])
+        self.assertTrue(token.wait(10))
+        with self.assertRaises(RequestCancelled):
+            token.check()
+    
+    def test_retries_stop_at_deadline(self):
+        """Test a retry that could not finish in time is not started"""
+        sleeps = []
+        
+        def fail():
+            raise httpx.ConnectError("refused")
+        
+        with self.assertRaises(DeadlineExceeded) as raised:
+            call_with_retries(fail, RetryPolicy(max_retries=5, base_delay=10, max_delay=10), sleep=sleeps.append,
+                              deadline=Deadline(0.5))
+        self.assertIsInstance(raised.exception.__cause__, httpx.ConnectError)
+        # Full jitter may pick a short enough delay once in a while, never one past the deadline
+        self.assertTrue(all(delay < 0.5 for delay in sleeps))
+
+
+class TestProxyDeadlines(unittest.TestCase):
+    """Test proxies give up on time and close cancelled streams promptly"""
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.upstream_app = stub_upstream.create_app(latency=0.5, chunk_delay=1.0, reply="one two three")
+        cls.upstream, cls.upstream_url = stub_upstream.serve_in_thread(cls.upstream_app)
+    
+    @classmethod
+    def tearDownClass(cls):
+        cls.upstream.should_exit = True
+    
+    def setUp(self):
+        self.pool = ClientPool()
+        self.breakers = BreakerRegistry()
+        self.encrypted_key = generate_encrypted_key(
+            provider="openai",
+            base_url=self.upstream_url + "/v1",
+            api_key="upstream-api-key",
+            model="stub-model",
+        )
+        self.messages = [{"role": "user", "content": "hi"}]
+    
+    def tearDown(self):
+        self.pool.close()
+    
+    def test_chat_deadline(self):
+        """Test a slow response raises DeadlineExceeded without counting against the breaker"""
+        for adapter in ("sdk", "native"):
+            with self.subTest(adapter=adapter):
+                proxy = LLMProxy(self.encrypted_key, pool=self.pool, breakers=self.breakers, adapter=adapter)
+                started = time.perf_counter()
+                with self.assertRaises(DeadlineExceeded):
+                    proxy.chat(self.messages, timeout=0.2)
+                self.assertLess(time.perf_counter() - started, 0.45)
+                self.assertEqual(proxy.breaker.snapshot()["window"], 0)
+        
+        # A generous deadline changes nothing
+        self.assertEqual(proxy.chat(self.messages, timeout=5), "one two three")
+    
+    def test_cancelled_before_sending(self):
+        """Test a cancelled token stops the call before it reaches the upstream"""
+        token = CancelToken()
+        token.cancel()
+        sent = len(self.upstream_app.state.stub["requests"])
+        with self.assertRaises(RequestCancelled):
+            LLMProxy(self.encrypted_key, pool=self.pool).chat(self.messages, cancel=token)
+        self.assertEqual(len(self.upstream_app.state.stub["requests"]), sent)
+    
+    def test_stream_cancel_aborts_blocked_read(self):
+        """Test cancelling from another thread ends a stream waiting on its next chunk"""
+        for adapter in ("sdk", "native"):
+            with self.subTest(adapter=adapter):
+                proxy = LLMProxy(self.encrypted_key, pool=self.pool, adapter=adapter)
+                token = CancelToken()
+                started = time.perf_counter()
+                threading.Timer(0.8, token.cancel).start()
+                with self.assertRaises(RequestCancelled):
+                    list(proxy.chat_stream(self.messages, cancel=token))
+                # The first word only arrives 1.5s in
+                self.assertLess(time.perf_counter() - started, 1.3)
+    
+    def test_async_deadline_and_task_cancel(self):
+        """Test async calls give up on time and a cancelled stream task ends at once"""
+        async def run():
+            proxy = AsyncLLMProxy(self.encrypted_key, pool=self.pool, breakers=self.breakers)
+            with self.assertRaises(DeadlineExceeded):
+                await proxy.achat(self.messages, timeout=0.2)
+            
+            async def consume():
+                return [delta async for delta in proxy.achat_stream(self.messages)]
+            
+            task = asyncio.ensure_future(consume())
+            await asyncio.sleep(0.8)
+            started = time.perf_counter()
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            cancelled_in = time.perf_counter() - started
+            await self.pool.aclose()
+            return cancelled_in
+        
+        self.assertLess(asyncio.run(run()), 0.2)
+
+    
+    def test_deadline_before_sending_keeps_no_probe(self):
+        """Test a deadline running out before the request is sent leaves the half-open probe free"""
+        breakers = BreakerRegistry()
+        breaker = half_open(breakers.get(self.upstream_url + "/v1"))
+        proxy = LLMProxy(self.encrypted_key, pool=self.pool, breakers=breakers)
+        with self.assertRaises(DeadlineExceeded):
+            proxy.chat(self.messages, timeout=LapsingDeadline(5))
+        
+        async def run():
+            async_proxy = AsyncLLMProxy(self.encrypted_key, pool=self.pool, breakers=breakers)
+            with self.assertRaises(DeadlineExceeded):
+                await async_proxy.achat(self.messages, timeout=LapsingDeadline(5))
+            await self.pool.aclose()
+        
+        asyncio.run(run())
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertEqual(proxy.chat(self.messages, timeout=5), "one two three")
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+class TestGatewayDeadlines(unittest.TestCase):
+    """Test the gateway bounds upstream requests by the client's timeout header"""
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.upstream_app = stub_upstream.create_app(latency=0.5)
+        cls.upstream, cls.upstream_url = stub_upstream.serve_in_thread(cls.upstream_app)
+    
+    @classmethod
+    def tearDownClass(cls):
+        cls.upstream.should_exit = True
+    
+    def setUp(self):
+        self.pool = ClientPool()
+        self.client = TestClient(create_app(self.pool, enable_metrics=False))
+        encrypted_key = generate_encrypted_key(
+            provider="openai",
+            base_url=self.upstream_url + "/v1",
+            api_key="upstream-api-key",
+            model="stub-model",
+        )
+        self.auth = {"Authorization": f"Bearer {encrypted_key}"}
+        self.body = {"messages": [{"role": "user", "content": "hi"}]}
+    
+    def tearDown(self):
+        self.client.close()
+        self.pool.close()
+    
+    def test_timeout_header(self):
+        """Test a request past the client's timeout answers 504, a bad header 400"""
+        response = self.client.post("/v1/chat/completions", json=self.body,
+                                    headers=dict(self.auth, **{"X-Request-Timeout": "0.2"}))
+        self.assertEqual(response.status_code, 504)
+        self.assertEqual(response.json()["error"]["type"], "timeout_error")
+        
+        response = self.client.post("/v1/chat/completions", json=self.body,
+                                    headers=dict(self.auth, **{"X-Request-Timeout": "soon"}))
+        self.assertEqual(response.status_code, 400)
+        
+        response = self.client.post("/v1/chat/completions", json=self.body,
+                                    headers=dict(self.auth, **{"X-Request-Timeout": "5"}))
+        self.assertEqual(response.status_code, 200)
+    
+    def test_expired_before_sending_keeps_no_probe(self):
+        """Test a request out of time before it is sent leaves the half-open probe free"""
+        breaker = half_open(default_breakers.get(self.upstream_url + "/v1"))
+        response = self.client.post("/v1/chat/completions", json=self.body,
+                                    headers=dict(self.auth, **{"X-Request-Timeout": "0.000001"}))
+        self.assertEqual(response.status_code, 504)
+        
+        response = self.client.post("/v1/chat/completions", json=self.body, headers=self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,240 @@
+"""
+Test hedged requests
+"""
+
+import asyncio
+import threading
+import time
+import unittest
+import os
+import sys
+
+import httpx
+
+# Add project root directory to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src import metrics
+from src.client_pool import ClientPool
+from src.hedging import HedgePolicy, hedged_acall, hedged_call
+from src.key_generator import generate_encrypted_key
+from src.llm_proxy import AsyncLLMProxy, LLMProxy, _sdk_types
+from src.resilience import RetryPolicy
+from tests.helpers import RecordingUpstream, completion_response
+
+
+class SlowFirstUpstream(RecordingUpstream):
+    """Recording upstream where only the very first request is a straggler"""
+    
+    def __call__(self, request):
+        first = not self.requests
+        response = super().__call__(request)
+        if first:
+            time.sleep(1)
+        return response
+
+
+class TestHedgePolicy(unittest.TestCase):
+    """Test hedge delays and budget"""
+    
+    def test_delay_follows_quantile(self):
+        """Test the delay is unknown until enough latencies are seen, then tracks the p95"""
+        policy = HedgePolicy(min_samples=20, min_delay=0.0)
+        for i in range(19):
+            policy.observe("m", i / 100)
+        self.assertIsNone(policy.delay("m"))
+        for i in range(19, 100):
+            policy.observe("m", i / 100)
+        self.assertAlmostEqual(policy.delay("m"), 0.95)
+        self.assertIsNone(policy.delay("other"))
+        self.assertEqual(HedgePolicy(delay=0.2).delay("m"), 0.2)
+    
+    def test_budget(self):
+        """Test hedges stay within the configured share of requests"""
+        policy = HedgePolicy(max_extra=0.05, burst=2)
+        hedges = 0
+        for _ in range(1000):
+            policy.start()
+            hedges += policy.try_hedge()
+        self.assertEqual(hedges, 50)
+        self.assertEqual(policy.stats()["hedge_rate"], 0.05)
+    
+    def test_hedge_wins(self):
+        """Test a slow call loses to its hedge, and a failed call does not hide a successful one"""
+        policy = HedgePolicy(delay=0.02, max_extra=1.0, burst=1)
+        outcomes = []
+        
+        def call(hedge):
+            if hedge:
+                return "hedge"
+            time.sleep(1)
+            raise RuntimeError("straggler failed")
+        
+        started = time.perf_counter()
+        self.assertEqual(hedged_call(policy, "m", call, outcomes.append), "hedge")
+        self.assertLess(time.perf_counter() - started, 0.6)
+        self.assertEqual(outcomes, [True])
+        
+        # Without budget the original call is awaited
+        policy = HedgePolicy(delay=0.02, max_extra=0.0)
+        with self.assertRaises(RuntimeError):
+            hedged_call(policy, "m", call)
+        self.assertEqual(policy.stats()["denied"], 1)
+    
+    def test_calls_without_hedge_run_inline(self):
+        """Test only calls holding a hedge from the budget leave the caller's thread, and a fast one returns it"""
+        threads = []
+        
+        def call(hedge):
+            threads.append(threading.current_thread())
+            return "done"
+        
+        policy = HedgePolicy(delay=0.5, max_extra=0.0)
+        self.assertEqual(hedged_call(policy, "m", call), "done")
+        self.assertIs(threads[-1], threading.current_thread())
+        
+        policy = HedgePolicy(delay=0.5, max_extra=1.0, burst=1)
+        self.assertEqual(hedged_call(policy, "m", call), "done")
+        self.assertIsNot(threads[-1], threading.current_thread())
+        self.assertEqual(policy.stats()["hedges"], 0)
+        self.assertTrue(policy.reserve())
+    
+    def test_async_loser_is_cancelled(self):
+        """Test the losing coroutine is cancelled"""
+        policy = HedgePolicy(delay=0.02, max_extra=1.0, burst=1)
+        cancelled = threading.Event()
+        
+        async def call(hedge):
+            if hedge:
+                return "hedge"
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+        
+        async def run():
+            result = await hedged_acall(policy, "m", call)
+            await asyncio.sleep(0)
+            return result
+        
+        self.assertEqual(asyncio.run(run()), "hedge")
+        self.assertTrue(cancelled.is_set())
+        self.assertEqual(policy.stats()["wins"], 1)
+
+
+class TestProxyHedging(unittest.TestCase):
+    """Test proxies hedge stragglers to an alternate backend"""
+    
+    def setUp(self):
+        self.records = []
+        metrics.hub.add_hook(self.records.append)
+        self.encrypted_key = generate_encrypted_key(
+            provider="openai",
+            base_url="http://a.test/v1",
+            api_key="test-api-key",
+            model="gpt-3.5-turbo",
+            backends=[
+                {"base_url": "http://a.test/v1", "api_key": "key-a"},
+                {"base_url": "http://b.test/v1", "api_key": "key-b"},
+            ],
+        )
+    
+    def tearDown(self):
+        metrics.hub.remove_hook(self.records.append)
+    
+    def test_sync_chat(self):
+        """Test the hedge answers while the straggler is still running, on the other backend"""
+        upstream = SlowFirstUpstream()
+        pool = ClientPool(transport=httpx.MockTransport(upstream))
+        policy = HedgePolicy(delay=0.05, max_extra=1.0, burst=1)
+        proxy = LLMProxy(self.encrypted_key, pool=pool, hedge=policy)
+        # Load the SDK first, the hedge could otherwise reach the upstream before the straggler
+        for backend in proxy.balancer.backends:
+            pool.get_client(backend.config)
+        _sdk_types()
+        started = time.perf_counter()
+        self.assertEqual(proxy.chat([{"role": "user", "content": "hi"}]), "echo: hi")
+        self.assertLess(time.perf_counter() - started, 0.6)
+        
+        straggler, hedge = upstream.requests[0][0], upstream.requests[1][0]
+        self.assertNotEqual(straggler.url.host, hedge.url.host)
+        self.assertEqual(policy.stats()["wins"], 1)
+        self.assertEqual(self.records[-1].hedge, "won")
+        pool.close()
+    
+    def test_straggler_leaves_record_alone(self):
+        """Test the losing straggler does not write into the record once the request is finished"""
+        upstream = SlowFirstUpstream()
+        pool = ClientPool(transport=httpx.MockTransport(upstream))
+        proxy = LLMProxy(self.encrypted_key, pool=pool, hedge=HedgePolicy(delay=0.05, max_extra=1.0, burst=1))
+        for backend in proxy.balancer.backends:
+            pool.get_client(backend.config)
+        _sdk_types()
+        proxy.chat([{"role": "user", "content": "hi"}])
+        record = self.records[-1]
+        phases = dict(record.phases)
+        # The straggler's response arrives after the hedge's
+        time.sleep(1.2)
+        self.assertEqual(len(upstream.requests), 2)
+        self.assertEqual(record.phases, phases)
+        pool.close()
+    
+    def test_straggler_phases_kept_when_it_wins(self):
+        """Test the original request's phases reach the record when it answers before any hedge"""
+        pool = ClientPool(transport=httpx.MockTransport(RecordingUpstream()))
+        proxy = LLMProxy(self.encrypted_key, pool=pool, hedge=HedgePolicy(delay=5, max_extra=1.0, burst=1))
+        proxy.chat([{"role": "user", "content": "hi"}])
+        self.assertIsNone(self.records[-1].hedge)
+        self.assertIn("ttfb", self.records[-1].phases)
+        self.assertIn("build", self.records[-1].phases)
+        pool.close()
+    
+    def test_hedge_not_retried(self):
+        """Test a failed hedge is not retried, it is a single extra request"""
+        requests = []
+        
+        def handler(request):
+            requests.append(request)
+            if len(requests) > 1:
+                return httpx.Response(503, json={"error": {"message": "unavailable"}})
+            time.sleep(1)
+            return httpx.Response(200, json=completion_response("slow"))
+        
+        pool = ClientPool(transport=httpx.MockTransport(handler))
+        proxy = LLMProxy(self.encrypted_key, pool=pool, hedge=HedgePolicy(delay=0.05, max_extra=1.0, burst=1),
+                         retry_policy=RetryPolicy(base_delay=0.01))
+        for backend in proxy.balancer.backends:
+            pool.get_client(backend.config)
+        _sdk_types()
+        self.assertEqual(proxy.chat([{"role": "user", "content": "hi"}]), "slow")
+        self.assertEqual(len(requests), 2)
+        pool.close()
+    
+    def test_async_chat(self):
+        """Test the async proxy hedges and cancels the straggler"""
+        requests = []
+        
+        async def handler(request):
+            requests.append(request)
+            if len(requests) == 1:
+                await asyncio.sleep(5)
+            return httpx.Response(200, json={"choices": [{"message": {"content": "fast"}}]})
+        
+        async def run():
+            pool = ClientPool(transport=httpx.MockTransport(handler))
+            proxy = AsyncLLMProxy(self.encrypted_key, pool=pool, adapter="native",
+                                  hedge=HedgePolicy(delay=0.05, max_extra=1.0, burst=1))
+            started = time.perf_counter()
+            content = await proxy.achat([{"role": "user", "content": "hi"}])
+            await pool.aclose()
+            return content, time.perf_counter() - started
+        
+        content, elapsed = asyncio.run(run())
+        self.assertEqual(content, "fast")
+        self.assertLess(elapsed, 1)
+        self.assertNotEqual(requests[0].url.host, requests[1].url.host)
+
+
+if __name__ == "__main__":
+    unittest.main()
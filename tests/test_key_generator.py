@@ -2,14 +2,17 @@
 Test key generator functionality
 """
 
+import subprocess
+import tempfile
 import unittest
+from unittest import mock
 import os
 import sys
 
 # Add project root directory to Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from src.key_generator import KeyGenerator, generate_encrypted_key
+from src.key_generator import KeyGenerator, generate_encrypted_key, migrate_encrypted_key
 from src.models import LLMConfig, LLMProvider
 
 
@@ -68,6 +71,163 @@ class TestKeyGenerator(unittest.TestCase):
         self.assertEqual(decrypted_config.headers, {"User-Agent": "TestApp/1.0"})
         self.assertEqual(decrypted_config.extra_body, {"max_tokens": 100})
 
+    
+    def test_decrypt_cache(self):
+        """Test decrypted configurations are cached and isolated per caller"""
+        KeyGenerator.invalidate_cache()
+        encrypted_key = KeyGenerator.encrypt_config(self.test_config)
+        
+        hits = KeyGenerator.config_cache.hits
+        first = KeyGenerator.decrypt_config(encrypted_key)
+        second = KeyGenerator.decrypt_config(encrypted_key)
+        self.assertEqual(KeyGenerator.config_cache.hits, hits + 1)
+        
+        # Callers get independent copies
+        first.headers["X-Test"] = "1"
+        self.assertNotIn("X-Test", second.headers)
+        self.assertNotIn("X-Test", KeyGenerator.decrypt_config(encrypted_key).headers)
+    
+    def test_rotate_master_key(self):
+        """Test master key rotation invalidates cached configurations"""
+        original = KeyGenerator.MASTER_KEY
+        encrypted_key = KeyGenerator.encrypt_config(self.test_config)
+        KeyGenerator.decrypt_config(encrypted_key)
+        try:
+            KeyGenerator.rotate_master_key("another-master-key")
+            self.assertEqual(len(KeyGenerator.config_cache), 0)
+            with self.assertRaises(Exception):
+                KeyGenerator.decrypt_config(encrypted_key)
+        finally:
+            KeyGenerator.rotate_master_key(original)
+
+    
+    def test_token_versions(self):
+        """Test v1 and v2 tokens both decrypt"""
+        v1_key = KeyGenerator.encrypt_config(self.test_config, version=1)
+        v2_key = KeyGenerator.encrypt_config(self.test_config)
+        self.assertEqual(KeyGenerator.token_version(v1_key), 1)
+        self.assertEqual(KeyGenerator.token_version(v2_key), 2)
+        self.assertTrue(v2_key.startswith(KeyGenerator.V2_PREFIX))
+        
+        for encrypted_key in (v1_key, v2_key):
+            decrypted_config = KeyGenerator.decrypt_config(encrypted_key, use_cache=False)
+            self.assertEqual(decrypted_config.api_key, self.test_config.api_key)
+            self.assertEqual(decrypted_config.extra_body, self.test_config.extra_body)
+    
+    def test_migrate(self):
+        """Test v1 keys migrate to v2"""
+        v1_key = KeyGenerator.encrypt_config(self.test_config, version=1)
+        v2_key = migrate_encrypted_key(v1_key)
+        self.assertEqual(KeyGenerator.token_version(v2_key), 2)
+        self.assertEqual(KeyGenerator.decrypt_config(v2_key).api_key, "test-api-key")
+        
+        # Already migrated keys are returned unchanged
+        self.assertEqual(migrate_encrypted_key(v2_key), v2_key)
+    
+    def test_migrate_new_master_key(self):
+        """Test re-encryption under a new master key"""
+        old_key = KeyGenerator.encrypt_config(self.test_config, master_key="old-master")
+        new_key = KeyGenerator.migrate_config(old_key, master_key="old-master", new_master_key="new-master")
+        self.assertEqual(KeyGenerator.decrypt_config(new_key, master_key="new-master").model, "gpt-3.5-turbo")
+        with self.assertRaises(Exception):
+            KeyGenerator.decrypt_config(new_key, use_cache=False, master_key="old-master")
+
+
+
+# Decrypts a key in a fresh process that cannot run the v1 key derivation, so only the shared cache can answer
+DECRYPT_SHARED = """
+import sys
+from src.key_generator import KeyGenerator
+
+def derive(*args, **kwargs):
+    raise AssertionError("v1 key derivation ran")
+
+KeyGenerator._derive_key = derive
+print(KeyGenerator.decrypt_config(sys.argv[1]).api_key)
+"""
+
+# Reports whether the shared file exists after import and after decrypting a v1 key
+OPEN_SHARED = """
+import os
+import sys
+from src.key_generator import KeyGenerator
+
+path = os.environ["LLM_PROXY_SHARED_CACHE"]
+print(os.path.exists(path))
+KeyGenerator.decrypt_config(sys.argv[1])
+print(os.path.exists(path))
+"""
+
+
+class TestSharedConfigCache(unittest.TestCase):
+    """Test decrypted configurations shared between processes"""
+    
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "shared.db")
+        KeyGenerator.invalidate_cache()
+        KeyGenerator.share_cache(self.path)
+        self.config = LLMConfig(
+            provider=LLMProvider.OPENAI,
+            base_url="https://api.openai.com/v1",
+            api_key="shared-api-key",
+            model="gpt-3.5-turbo"
+        )
+    
+    def tearDown(self):
+        KeyGenerator.share_cache(None)
+        KeyGenerator.invalidate_cache()
+        self.tmpdir.cleanup()
+    
+    def test_shared_between_processes(self):
+        """Test a v1 key decrypted in one process is a hit in another"""
+        v1_key = KeyGenerator.encrypt_config(self.config, version=1)
+        KeyGenerator.decrypt_config(v1_key)
+        self.assertEqual(len(KeyGenerator.shared_cache), 1)
+        
+        root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+        child = subprocess.run(
+            [sys.executable, "-c", DECRYPT_SHARED, v1_key],
+            cwd=root, env=dict(os.environ, LLM_PROXY_SHARED_CACHE=self.path),
+            capture_output=True, text=True, timeout=60,
+        )
+        self.assertEqual(child.returncode, 0, child.stderr)
+        self.assertEqual(child.stdout.strip(), "shared-api-key")
+        
+        # The file only holds configurations encrypted again
+        for name in os.listdir(self.tmpdir.name):
+            with open(os.path.join(self.tmpdir.name, name), "rb") as f:
+                self.assertNotIn(b"shared-api-key", f.read())
+    
+    def test_v2_keys_and_invalidation(self):
+        """Test v2 keys are not shared and invalidation reaches the shared tier"""
+        KeyGenerator.decrypt_config(KeyGenerator.encrypt_config(self.config))
+        self.assertEqual(len(KeyGenerator.shared_cache), 0)
+        
+        v1_key = KeyGenerator.encrypt_config(self.config, version=1)
+        KeyGenerator.decrypt_config(v1_key)
+        KeyGenerator.invalidate_cache(v1_key)
+        self.assertEqual(len(KeyGenerator.shared_cache), 0)
+    
+    def test_v2_keys_not_looked_up(self):
+        """Test decrypting a v2 key does not query the shared tier, which only ever holds v1 keys"""
+        v2_key = KeyGenerator.encrypt_config(self.config)
+        with mock.patch.object(KeyGenerator.shared_cache, "get", side_effect=AssertionError) as get:
+            self.assertEqual(KeyGenerator.decrypt_config(v2_key).api_key, "shared-api-key")
+        get.assert_not_called()
+    
+    def test_opened_on_first_use(self):
+        """Test importing the module does not open the file named in the environment, the first v1 key does"""
+        root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+        v1_key = KeyGenerator.encrypt_config(self.config, version=1)
+        child = subprocess.run(
+            [sys.executable, "-c", OPEN_SHARED, v1_key],
+            cwd=root, env=dict(os.environ, LLM_PROXY_SHARED_CACHE=os.path.join(self.tmpdir.name, "lazy.db")),
+            capture_output=True, text=True, timeout=60,
+        )
+        self.assertEqual(child.returncode, 0, child.stderr)
+        self.assertEqual(child.stdout.split(), ["False", "True"])
+
 
 if __name__ == "__main__":
     unittest.main() 
\ No newline at end of file
@@ -0,0 +1,131 @@
+"""
+Test LLM proxy functionality
+"""
+
+import asyncio
+import json
+import unittest
+import os
+import sys
+
+import httpx
+
+# Add project root directory to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.client_pool import ClientPool
+from src.key_generator import generate_encrypted_key
+from src.llm_proxy import AsyncLLMProxy, LLMProxy
+from tests.helpers import RecordingUpstream, completion_response, stream_response
+
+
+class TestLLMProxy(unittest.TestCase):
+    """Test LLM proxy functionality"""
+    
+    def setUp(self):
+        """Set up test environment"""
+        self.upstream = RecordingUpstream()
+        self.pool = ClientPool(transport=httpx.MockTransport(self.upstream))
+        self.encrypted_key = generate_encrypted_key(
+            provider="openai",
+            base_url="http://upstream.test/v1",
+            api_key="test-api-key",
+            model="gpt-3.5-turbo",
+            headers={"X-Title": "TestApp"},
+            extra_body={"top_p": 0.5}
+        )
+    
+    def tearDown(self):
+        self.pool.close()
+    
+    def test_send_message(self):
+        """Test request building and response extraction"""
+        proxy = LLMProxy(self.encrypted_key, pool=self.pool)
+        self.assertEqual(proxy.send_message("hi"), "echo: hi")
+        
+        request, body = self.upstream.requests[-1]
+        self.assertEqual(request.url.path, "/v1/chat/completions")
+        self.assertEqual(request.headers["X-Title"], "TestApp")
+        self.assertEqual(request.headers["Authorization"], "Bearer test-api-key")
+        self.assertEqual(body["model"], "gpt-3.5-turbo")
+        self.assertEqual(body["top_p"], 0.5)
+        self.assertNotIn("max_tokens", body)
+    
+    def test_async_chat(self):
+        """Test async proxy uses the same request semantics"""
+        async def run():
+            async with AsyncLLMProxy(self.encrypted_key, pool=self.pool, max_concurrency=2) as proxy:
+                results = await asyncio.gather(*[
+                    proxy.achat([{"role": "user", "content": str(i)}], max_tokens=10)
+                    for i in range(5)
+                ])
+                single = await proxy.asend_message("hi")
+            return results, single
+        
+        results, single = asyncio.run(run())
+        self.assertEqual(results, [f"echo: {i}" for i in range(5)])
+        self.assertEqual(single, "echo: hi")
+        
+        request, body = self.upstream.requests[0]
+        self.assertEqual(request.headers["X-Title"], "TestApp")
+        self.assertEqual(body["top_p"], 0.5)
+        self.assertEqual(body["max_tokens"], 10)
+    
+    def test_chat_stream(self):
+        """Test streamed deltas arrive in order"""
+        proxy = LLMProxy(self.encrypted_key, pool=self.pool)
+        deltas = list(proxy.chat_stream([{"role": "user", "content": "hi"}]))
+        self.assertEqual(deltas, ["echo:", "hi"])
+        self.assertTrue(self.upstream.requests[-1][1]["stream"])
+    
+    def test_async_chat_stream(self):
+        """Test async streamed deltas arrive in order"""
+        async def run():
+            proxy = AsyncLLMProxy(self.encrypted_key, pool=self.pool, max_concurrency=1)
+            return [delta async for delta in proxy.achat_stream([{"role": "user", "content": "hi"}])]
+        
+        self.assertEqual(asyncio.run(run()), ["echo:", "hi"])
+    
+    def test_chat_raw(self):
+        """Test raw calls return the upstream body and stream bytes unparsed, with the configured request"""
+        proxy = LLMProxy(self.encrypted_key, pool=self.pool)
+        body = proxy.chat_raw([{"role": "user", "content": "hi"}], max_tokens=10)
+        self.assertIsInstance(body, bytes)
+        self.assertEqual(json.loads(body), completion_response("echo: hi"))
+        
+        request, sent = self.upstream.requests[-1]
+        self.assertEqual(request.headers["X-Title"], "TestApp")
+        self.assertEqual((sent["top_p"], sent["max_tokens"]), (0.5, 10))
+        
+        chunks = list(proxy.chat_raw([{"role": "user", "content": "hi"}], stream=True))
+        self.assertTrue(all(isinstance(chunk, bytes) for chunk in chunks))
+        self.assertEqual(b"".join(chunks), stream_response(["echo:", "hi"]))
+        self.assertTrue(self.upstream.requests[-1][1]["stream"])
+    
+    def test_async_chat_raw(self):
+        """Test async raw calls return the same bytes"""
+        async def run():
+            async with AsyncLLMProxy(self.encrypted_key, pool=self.pool, max_concurrency=1) as proxy:
+                body = await proxy.achat_raw([{"role": "user", "content": "hi"}])
+                chunks = [chunk async for chunk in proxy.achat_raw([{"role": "user", "content": "hi"}], stream=True)]
+            return body, chunks
+        
+        body, chunks = asyncio.run(run())
+        self.assertEqual(json.loads(body), completion_response("echo: hi"))
+        self.assertEqual(b"".join(chunks), stream_response(["echo:", "hi"]))
+        self.assertEqual(self.upstream.requests[-1][0].headers["X-Title"], "TestApp")
+    
+    def test_unsupported_provider(self):
+        """Test providers without a client are rejected"""
+        encrypted_key = generate_encrypted_key(
+            provider="custom",
+            base_url="https://llm.example.com",
+            api_key="test-api-key",
+            model="custom-model"
+        )
+        with self.assertRaises(ValueError):
+            LLMProxy(encrypted_key, pool=self.pool)
+
+
+if __name__ == "__main__":
+    unittest.main()
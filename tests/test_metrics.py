@@ -0,0 +1,171 @@
+"""
+Test request metrics and the Prometheus exposition
+"""
+
+import asyncio
+import unittest
+import os
+import sys
+
+import httpx
+
+# Add project root directory to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src import metrics, stub_upstream
+from src.client_pool import ClientPool
+from src.key_generator import generate_encrypted_key
+from src.llm_proxy import AsyncLLMProxy, LLMProxy
+from src.response_cache import ResponseCache
+from tests.helpers import RecordingUpstream
+
+
+class TestRequestMetrics(unittest.TestCase):
+    """Test phase timings recorded by the proxies"""
+    
+    def setUp(self):
+        """Set up test environment"""
+        self.records = []
+        metrics.hub.add_hook(self.records.append)
+        self.pool = ClientPool(transport=httpx.MockTransport(RecordingUpstream()))
+        self.encrypted_key = generate_encrypted_key(
+            provider="openai",
+            base_url="http://upstream.test/v1",
+            api_key="test-api-key",
+            model="gpt-3.5-turbo"
+        )
+    
+    def tearDown(self):
+        metrics.hub.remove_hook(self.records.append)
+        self.pool.close()
+    
+    def test_chat_phases(self):
+        """Test a completion reports its phases and token usage"""
+        proxy = LLMProxy(self.encrypted_key, pool=self.pool)
+        proxy.chat([{"role": "user", "content": "hi"}])
+        proxy.chat([{"role": "user", "content": "again"}])
+        
+        first, second = self.records
+        self.assertEqual((first.provider, first.model, first.status), ("openai", "gpt-3.5-turbo", "ok"))
+        for phase in ("decrypt", "build", "ttfb", "generation", "total"):
+            self.assertIn(phase, first.phases)
+        self.assertGreaterEqual(first.phases["total"], first.phases["ttfb"])
+        self.assertEqual((first.prompt_tokens, first.completion_tokens), (3, 2))
+        # Decryption happened once, at construction
+        self.assertNotIn("decrypt", second.phases)
+    
+    def test_stream_phases(self):
+        """Test a stream reports time to first token once fully read"""
+        proxy = LLMProxy(self.encrypted_key, pool=self.pool)
+        self.assertEqual("".join(proxy.chat_stream([{"role": "user", "content": "a b"}])), "echo:ab")
+        
+        record, = self.records
+        self.assertTrue(record.stream)
+        self.assertIn("first_token", record.phases)
+        self.assertIn("generation", record.phases)
+    
+    def test_errors_and_cache_hits(self):
+        """Test failed and cached requests are labelled"""
+        def failing(request):
+            return httpx.Response(400, json={"error": {"message": "bad request"}})
+        pool = ClientPool(transport=httpx.MockTransport(failing))
+        proxy = LLMProxy(self.encrypted_key, pool=pool)
+        with self.assertRaises(Exception):
+            proxy.chat([{"role": "user", "content": "hi"}])
+        pool.close()
+        self.assertEqual((self.records[-1].status, self.records[-1].error), ("error", "BadRequestError"))
+        
+        proxy = LLMProxy(self.encrypted_key, pool=self.pool, response_cache=ResponseCache())
+        proxy.chat([{"role": "user", "content": "hi"}], temperature=0)
+        proxy.chat([{"role": "user", "content": "hi"}], temperature=0)
+        self.assertTrue(self.records[-1].cached)
+    
+    def test_async_chat(self):
+        """Test async requests are recorded with their own context"""
+        async def run():
+            async with AsyncLLMProxy(self.encrypted_key, pool=self.pool) as proxy:
+                await asyncio.gather(*[proxy.achat([{"role": "user", "content": str(i)}]) for i in range(3)])
+        asyncio.run(run())
+        
+        self.assertEqual(len(self.records), 3)
+        for record in self.records:
+            self.assertIn("ttfb", record.phases)
+    
+    def test_unconfigured_model_label(self):
+        """Test models the configuration does not name are aggregated as "other", records keep the model asked for"""
+        collector = metrics.PrometheusCollector()
+        metrics.hub.add_hook(collector)
+        try:
+            proxy = LLMProxy(self.encrypted_key, pool=self.pool)
+            proxy.chat([{"role": "user", "content": "hi"}])
+            proxy.chat([{"role": "user", "content": "hi"}], model="client-chosen-model")
+        finally:
+            metrics.hub.remove_hook(collector)
+        
+        self.assertEqual([record.model for record in self.records], ["gpt-3.5-turbo", "client-chosen-model"])
+        text = collector.render()
+        self.assertIn('llm_proxy_requests_total{provider="openai",model="gpt-3.5-turbo",status="ok"} 1', text)
+        self.assertIn('llm_proxy_requests_total{provider="openai",model="other",status="ok"} 1', text)
+        self.assertNotIn("client-chosen-model", text)
+    
+    def test_inactive_without_hooks(self):
+        """Test nothing is recorded when no hook is registered"""
+        hooks = metrics.hub._hooks
+        metrics.hub._hooks = []
+        try:
+            self.assertIsNone(metrics.hub.start("openai", "gpt-3.5-turbo"))
+        finally:
+            metrics.hub._hooks = hooks
+    
+    def test_connect_phase(self):
+        """Test connection setup time is traced against a real socket"""
+        app = stub_upstream.create_app()
+        server, url = stub_upstream.serve_in_thread(app)
+        pool = ClientPool()
+        try:
+            key = generate_encrypted_key("openai", url + "/v1", "test-api-key", "stub-model")
+            proxy = LLMProxy(key, pool=pool)
+            proxy.chat([{"role": "user", "content": "hi"}])
+            proxy.chat([{"role": "user", "content": "hi"}])
+        finally:
+            pool.close()
+            server.should_exit = True
+        
+        self.assertIn("connect", self.records[0].phases)
+        # The second request reused the pooled connection
+        self.assertNotIn("connect", self.records[1].phases)
+
+
+class TestPrometheusCollector(unittest.TestCase):
+    """Test aggregation into Prometheus text format"""
+    
+    def test_render(self):
+        """Test counters and histograms are rendered"""
+        collector = metrics.PrometheusCollector()
+        record = metrics.RequestRecord("openai", "gpt-4", started=0.0)
+        record.phases = {"ttfb": 0.2, "total": 0.3}
+        record.prompt_tokens = 10
+        collector(record)
+        failed = metrics.RequestRecord("openai", "gpt-4", started=0.0)
+        failed.status, failed.error = "error", "APITimeoutError"
+        collector(failed)
+        
+        text = collector.render()
+        self.assertIn('llm_proxy_requests_total{provider="openai",model="gpt-4",status="ok"} 1', text)
+        self.assertIn('llm_proxy_errors_total{provider="openai",model="gpt-4",error="APITimeoutError"} 1', text)
+        self.assertIn('llm_proxy_tokens_total{provider="openai",model="gpt-4",type="prompt"} 10', text)
+        self.assertIn('llm_proxy_phase_seconds_bucket{provider="openai",model="gpt-4",phase="ttfb",le="0.25"} 1', text)
+        self.assertIn('llm_proxy_phase_seconds_bucket{provider="openai",model="gpt-4",phase="ttfb",le="0.1"} 0', text)
+        self.assertIn('llm_proxy_phase_seconds_count{provider="openai",model="gpt-4",phase="total"} 1', text)
+    
+    def test_broken_hook_is_ignored(self):
+        """Test an exporter raising does not fail the request"""
+        hub = metrics.MetricsHub()
+        def broken(record):
+            raise RuntimeError("exporter down")
+        hub.add_hook(broken)
+        hub.finish(hub.start("openai", "gpt-4"))
+
+
+if __name__ == '__main__':
+    unittest.main()
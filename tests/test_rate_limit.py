@@ -0,0 +1,242 @@
+"""
+Test client-side rate limiting
+"""
+
+import asyncio
+import unittest
+import os
+import sys
+
+import httpx
+
+# Add project root directory to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src import stub_upstream
+from src.client_pool import ClientPool
+from src.key_generator import generate_encrypted_key
+from src.llm_proxy import AsyncLLMProxy, LLMProxy
+from src.rate_limit import LimiterRegistry, RateLimiter, RateLimitTimeout, default_limiters
+from src.resilience import BreakerRegistry, CircuitBreaker
+from src.tokens import estimate_tokens
+from tests.helpers import FakeClock
+
+
+class TestRateLimiter(unittest.TestCase):
+    """Test token bucket rate limiter"""
+    
+    def setUp(self):
+        """Set up test environment"""
+        self.clock = FakeClock()
+    
+    def test_requests_queue(self):
+        """Test requests beyond the burst wait for refill"""
+        limiter = RateLimiter(rpm=60, timer=self.clock)
+        waits = [limiter.reserve() for _ in range(62)]
+        self.assertEqual(waits[:60], [0.0] * 60)
+        self.assertAlmostEqual(waits[60], 1.0)
+        self.assertAlmostEqual(waits[61], 2.0)
+        
+        self.clock.now = 2.0
+        self.assertAlmostEqual(limiter.reserve(), 1.0)
+    
+    def test_bounded_wait(self):
+        """Test requests that would wait too long are rejected without using budget"""
+        limiter = RateLimiter(tpm=600, max_wait=5, timer=self.clock)
+        limiter.reserve(600)
+        with self.assertRaises(RateLimitTimeout):
+            limiter.reserve(100)
+        self.assertAlmostEqual(limiter.reserve(40), 4.0)
+        self.assertEqual(limiter.stats()["rejected"], 1)
+    
+    def test_reconcile(self):
+        """Test unused estimated tokens are returned to the budget"""
+        limiter = RateLimiter(tpm=600, timer=self.clock)
+        limiter.reserve(600)
+        limiter.reconcile(600, 100)
+        self.assertEqual(limiter.reserve(500), 0.0)
+        limiter.reconcile(0, 60)
+        self.assertAlmostEqual(limiter.reserve(0), 0.0)
+        self.assertAlmostEqual(limiter.tokens.wait_time(1), 6.1)
+    
+    def test_refund(self):
+        """Test a refunded request gives back its tokens, and its request when it was never sent"""
+        limiter = RateLimiter(rpm=1, tpm=600, timer=self.clock)
+        limiter.reserve(600)
+        limiter.refund(600, request=True)
+        self.assertEqual(limiter.reserve(600), 0.0)
+        limiter.refund(600)
+        self.assertEqual(limiter.reserve(600, max_wait=100), 60.0)
+    
+    def test_resize_keeps_balance(self):
+        """Test changing a limit keeps the budget already used"""
+        limiter = RateLimiter(rpm=10, timer=self.clock)
+        for _ in range(10):
+            limiter.reserve()
+        limiter.configure(12, None)
+        self.assertAlmostEqual(limiter.reserve(), 5.0)
+    
+    def test_registry_keeps_strictest_limit(self):
+        """Test callers configuring different limits for one key share one bucket at the smallest limit"""
+        registry = LimiterRegistry(max_wait=0)
+        admitted = 0
+        for i in range(200):
+            limiter = registry.get("http://ratelimit.test/v1", "shared-key", 10 if i % 2 else 12, None)
+            try:
+                limiter.reserve()
+                admitted += 1
+            except RateLimitTimeout:
+                pass
+        self.assertEqual(admitted, 11)
+        self.assertEqual(limiter.rpm, 10)
+        self.assertIs(registry.get("http://ratelimit.test/v1", "shared-key", None, 500), limiter)
+        self.assertEqual((limiter.rpm, limiter.tpm), (10, 500))
+    
+    def test_registry_bounded(self):
+        """Test the registry keeps a bounded number of limiters and no API key in plain text"""
+        registry = LimiterRegistry(maxsize=2)
+        for api_key in ("first-key", "second-key", "third-key"):
+            registry.get("http://ratelimit.test/v1", api_key, 10, None)
+        self.assertEqual(len(registry._limiters), 2)
+        self.assertNotIn("-key", repr(registry._limiters.items()))
+    
+    def test_estimate(self):
+        """Test estimate covers prompt and completion budget"""
+        messages = [{"role": "user", "content": "x" * 40}]
+        self.assertEqual(estimate_tokens(messages, max_tokens=10), 10 + 4 + 10)
+
+
+class TestProxyRateLimit(unittest.TestCase):
+    """Test proxy integration"""
+    
+    def setUp(self):
+        """Set up test environment"""
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(200, json={
+                "id": "chatcmpl-test",
+                "object": "chat.completion",
+                "created": 0,
+                "model": "gpt-3.5-turbo",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 5, "completion_tokens": 1, "total_tokens": 6}
+            })
+        
+        self.pool = ClientPool(transport=httpx.MockTransport(handler))
+        self.encrypted_key = generate_encrypted_key(
+            provider="openai",
+            base_url="http://ratelimit.test/v1",
+            api_key="rate-limited-key",
+            model="gpt-3.5-turbo",
+            rpm=2
+        )
+    
+    def tearDown(self):
+        self.pool.close()
+    
+    def test_rpm_from_config(self):
+        """Test the configured RPM is shared by every proxy and sync/async calls"""
+        first = LLMProxy(self.encrypted_key, pool=self.pool, rate_limit_wait=0)
+        second = LLMProxy(self.encrypted_key, pool=self.pool, rate_limit_wait=0)
+        self.assertEqual(first.send_message("hi"), "ok")
+        
+        async def run():
+            proxy = AsyncLLMProxy(self.encrypted_key, pool=self.pool, rate_limit_wait=0)
+            return await proxy.asend_message("hi")
+        
+        self.assertEqual(asyncio.run(run()), "ok")
+        with self.assertRaises(RateLimitTimeout):
+            second.send_message("hi")
+    
+    def test_tpm_reconciled(self):
+        """Test token budget is corrected with reported usage"""
+        encrypted_key = generate_encrypted_key("openai", "http://ratelimit.test/v1", "tpm-key", "gpt-3.5-turbo")
+        proxy = LLMProxy(encrypted_key, pool=self.pool, rpm=1000, tpm=1000)
+        proxy.chat([{"role": "user", "content": "hi"}], max_tokens=500)
+        limiter = default_limiters.get("http://ratelimit.test/v1", "tpm-key", 1000, 1000)
+        self.assertAlmostEqual(limiter.tokens.tokens, 1000 - 6, delta=1)
+    
+    def test_rate_limited_call_keeps_no_probe(self):
+        """Test a call rejected for rate limit budget does not hold the half-open breaker's probe"""
+        encrypted_key = generate_encrypted_key("openai", "http://ratelimit.test/v1", "probe-key", "gpt-3.5-turbo")
+        breakers = BreakerRegistry(reset_timeout=0)
+        breaker = breakers.get("http://ratelimit.test/v1")
+        for _ in range(10):
+            breaker.record_failure()
+        default_limiters.get("http://ratelimit.test/v1", "probe-key", 1, None).reserve()
+        proxy = LLMProxy(encrypted_key, pool=self.pool, breakers=breakers, rpm=1, rate_limit_wait=0)
+        
+        with self.assertRaises(RateLimitTimeout):
+            proxy.send_message("hi")
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        breaker.before_request()
+        breaker.release()
+    
+    def test_failed_call_refunded(self):
+        """Test the tokens reserved for a call the upstream rejected go back to the budget"""
+        pool = ClientPool(transport=httpx.MockTransport(
+            lambda request: httpx.Response(400, json={"error": {"message": "bad request"}})))
+        encrypted_key = generate_encrypted_key("openai", "http://refund.test/v1", "refund-key", "gpt-3.5-turbo")
+        try:
+            for adapter in ("sdk", "native"):
+                proxy = LLMProxy(encrypted_key, pool=pool, tpm=1000, adapter=adapter)
+                with self.assertRaises(Exception):
+                    proxy.chat([{"role": "user", "content": "hi"}], max_tokens=500)
+                limiter = default_limiters.get("http://refund.test/v1", "refund-key", None, 1000)
+                self.assertAlmostEqual(limiter.tokens.tokens, 1000, delta=1)
+        finally:
+            pool.close()
+    
+    def test_stream_reconciled(self):
+        """Test a stream's reservation is reconciled to the usage its final chunk reports once it is closed"""
+        server, url = stub_upstream.serve_in_thread(stub_upstream.create_app())
+        encrypted_key = generate_encrypted_key("openai", url + "/v1", "stream-key", "stub-model", stream_usage=True)
+        messages = [{"role": "user", "content": "hello there"}]
+        usage = stub_upstream.completion_body({"messages": messages}, "echo: hello there")["usage"]
+        limiter = default_limiters.get(url + "/v1", "stream-key", None, 1000)
+        pool = ClientPool()
+        
+        async def run(proxy):
+            return [delta async for delta in proxy.achat_stream(messages, max_tokens=500)]
+        
+        try:
+            for adapter in ("sdk", "native"):
+                proxy = LLMProxy(encrypted_key, pool=pool, tpm=1000, adapter=adapter)
+                self.assertEqual("".join(proxy.chat_stream(messages, max_tokens=500)), "echo: hello there")
+                self.assertAlmostEqual(limiter.tokens.tokens, 1000 - usage["total_tokens"], delta=20)
+                limiter.tokens.tokens = 1000
+                
+                proxy = AsyncLLMProxy(encrypted_key, pool=pool, tpm=1000, adapter=adapter)
+                self.assertEqual("".join(asyncio.run(run(proxy))), "echo: hello there")
+                self.assertAlmostEqual(limiter.tokens.tokens, 1000 - usage["total_tokens"], delta=20)
+                limiter.tokens.tokens = 1000
+        finally:
+            pool.close()
+            server.should_exit = True
+    
+    def test_stream_usage_opt_in(self):
+        """Test usage is asked for only on parsed streams of configurations opting in, never on raw relays"""
+        upstream_app = stub_upstream.create_app()
+        server, url = stub_upstream.serve_in_thread(upstream_app)
+        messages = [{"role": "user", "content": "hi"}]
+        pool = ClientPool()
+        
+        def sent(proxy, call):
+            call(proxy)
+            return upstream_app.state.stub["requests"][-1]["body"].get("stream_options")
+        
+        try:
+            for adapter in ("sdk", "native"):
+                opted = generate_encrypted_key("openai", url + "/v1", "opt-key", "stub-model", stream_usage=True)
+                plain = generate_encrypted_key("openai", url + "/v1", "opt-key", "stub-model")
+                proxy = LLMProxy(opted, pool=pool, adapter=adapter)
+                self.assertEqual(sent(proxy, lambda p: list(p.chat_stream(messages))), {"include_usage": True})
+                self.assertIsNone(sent(proxy, lambda p: list(p.chat_raw(messages, stream=True))))
+                proxy = LLMProxy(plain, pool=pool, adapter=adapter)
+                self.assertIsNone(sent(proxy, lambda p: list(p.chat_stream(messages))))
+        finally:
+            pool.close()
+            server.should_exit = True
+
+
+if __name__ == "__main__":
+    unittest.main()
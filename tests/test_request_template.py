@@ -0,0 +1,143 @@
+"""
+Test precompiled request templates
+"""
+
+import json
+import unittest
+import os
+import sys
+from unittest import mock
+
+import httpx
+
+# Add project root directory to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src import adapters
+from src.client_pool import ClientPool
+from src.key_generator import generate_encrypted_key
+from src.llm_proxy import LLMProxy, _posts_content
+from src.models import LLMConfig
+from src.request_template import RequestTemplate, TemplateRegistry, default_templates
+from tests.helpers import RecordingUpstream
+
+
+MESSAGES = [
+    {"role": "system", "content": "Be brief."},
+    {"role": "user", "content": "Hello"},
+]
+
+
+class TestRequestTemplate(unittest.TestCase):
+    """Test precompiled request templates"""
+    
+    def setUp(self):
+        self.config = LLMConfig(
+            provider="openai",
+            base_url="http://upstream.test/v1",
+            api_key="test-api-key",
+            model="model-a",
+            headers={"X-Team": "a"},
+            extra_body={"top_p": 0.5, "max_tokens": 64, "generationConfig": {"topK": 3}},
+        )
+    
+    def test_compiled_body_matches_adapter(self):
+        """Test every adapter encodes the same body from a compiled request as from request()"""
+        template = RequestTemplate(self.config)
+        for adapter in (adapters.OpenAIAdapter(), adapters.AnthropicAdapter(), adapters.GeminiAdapter()):
+            for stream in (False, True):
+                kwargs = template.build(MESSAGES, temperature=1.5)
+                compiled = template.compile(adapter, self.config, kwargs, stream)
+                url, headers, body = adapter.request(self.config, kwargs, stream)
+                with self.subTest(adapter=adapter.name, stream=stream):
+                    self.assertEqual(compiled.url, url)
+                    self.assertEqual(compiled.headers, dict(headers, **{"Content-Type": "application/json"}))
+                    self.assertEqual(json.loads(compiled.content(adapter.fields(kwargs))), body)
+                
+                # Later calls only encode their own fields
+                kwargs = template.build([{"role": "user", "content": "Again"}], temperature=0)
+                self.assertIs(template.compile(adapter, self.config, kwargs, stream), compiled)
+                self.assertEqual(json.loads(compiled.content(adapter.fields(kwargs))),
+                                 adapter.request(self.config, kwargs, stream)[2])
+    
+    def test_extra_body_overrides_call_parameters(self):
+        """Test extra_body still wins over per-call parameters, as before templates"""
+        kwargs = RequestTemplate(self.config).build(MESSAGES, max_tokens=10)
+        self.assertEqual(kwargs["max_tokens"], 64)
+        self.assertEqual(kwargs["extra_headers"], {"X-Team": "a"})
+    
+    def test_registry(self):
+        """Test equal configurations share one template"""
+        self.assertIs(default_templates.get(self.config), default_templates.get(self.config.model_copy()))
+        self.assertIsNot(default_templates.get(self.config),
+                         default_templates.get(self.config.model_copy(update={"extra_body": {}})))
+    
+    def test_registry_bounded(self):
+        """Test templates and compiled requests are evicted least recently used first, keys hold no API key"""
+        registry = TemplateRegistry(maxsize=2)
+        first = registry.get(self.config)
+        self.assertNotIn("test-api-key", registry.key(self.config))
+        self.assertIs(registry.get(self.config.model_copy(update={"api_key": "other-key"})), first)
+        for model in ("model-b", "model-c"):
+            registry.get(self.config.model_copy(update={"model": model}))
+        self.assertIsNot(registry.get(self.config), first)
+        
+        template = RequestTemplate(self.config, maxsize=2)
+        adapter = adapters.OpenAIAdapter()
+        for model in ("model-a", "model-b", "model-c"):
+            template.compile(adapter, self.config, template.build(MESSAGES, model=model), False)
+        self.assertEqual(template._compiled.stats()["size"], 2)
+
+
+class TestFastPath(unittest.TestCase):
+    """Test proxies send precompiled requests"""
+    
+    def setUp(self):
+        self.upstream = RecordingUpstream()
+        self.pool = ClientPool(transport=httpx.MockTransport(self.upstream))
+        self.encrypted_key = generate_encrypted_key(
+            provider="openai",
+            base_url="http://upstream.test/v1",
+            api_key="test-api-key",
+            model="gpt-3.5-turbo",
+            headers={"X-Team": "a"},
+            extra_body={"top_p": 0.5},
+        )
+    
+    def tearDown(self):
+        self.pool.close()
+    
+    def test_sdk_and_native(self):
+        """Test the fast path sends the same request as the SDK's create() through both transports"""
+        bodies = []
+        for adapter in ("sdk", "native"):
+            for fast_path in (False, True):
+                proxy = LLMProxy(self.encrypted_key, pool=self.pool, adapter=adapter, fast_path=fast_path)
+                self.assertEqual(proxy.chat(MESSAGES, max_tokens=5), "echo: Hello")
+                self.assertEqual("".join(proxy.chat_stream(MESSAGES)), "echo:Hello")
+                request, body = self.upstream.requests[-2]
+                self.assertEqual(request.headers["Authorization"], "Bearer test-api-key")
+                self.assertEqual(request.headers["X-Team"], "a")
+                self.assertTrue(self.upstream.requests[-1][1]["stream"])
+                bodies.append(body)
+        for body in bodies:
+            self.assertEqual(body, {"model": "gpt-3.5-turbo", "messages": MESSAGES, "temperature": 0.7,
+                                    "max_tokens": 5, "top_p": 0.5})
+    
+    def test_sdk_without_content_post(self):
+        """Test SDK releases whose post() takes no pre-encoded body are served through create()"""
+        class LegacyClient:
+            def post(self, path, *, cast_to, body=None, options={}, files=None, stream=False, stream_cls=None):
+                raise AssertionError("post() called with a pre-encoded body")
+        
+        self.assertFalse(_posts_content(LegacyClient))
+        proxy = LLMProxy(self.encrypted_key, pool=self.pool, adapter="sdk", fast_path=True)
+        self.assertTrue(_posts_content(type(proxy.client)))
+        with mock.patch("src.llm_proxy._posts_content", return_value=False), \
+                mock.patch.object(LLMProxy, "_sdk_post", side_effect=AssertionError):
+            self.assertEqual(proxy.chat(MESSAGES, max_tokens=5), "echo: Hello")
+        self.assertEqual(self.upstream.requests[-1][1]["max_tokens"], 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
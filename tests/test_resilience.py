@@ -0,0 +1,252 @@
+"""
+Test retry and circuit breaker functionality
+"""
+
+import asyncio
+import json
+import unittest
+import os
+import sys
+import time
+
+import httpx
+import openai
+
+# Add project root directory to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.client_pool import ClientPool
+from src.deadlines import CancelToken, RequestCancelled
+from src.key_generator import generate_encrypted_key
+from src.llm_proxy import AsyncLLMProxy, LLMProxy
+from src.resilience import (BreakerRegistry, CircuitBreaker, CircuitOpenError, RetryPolicy,
+                            acall_with_retries, call_with_retries, retry_after)
+from tests.helpers import FakeClock
+
+
+def status_error(status: int, headers: dict = None) -> httpx.HTTPStatusError:
+    """HTTP error carrying a response"""
+    request = httpx.Request("POST", "http://upstream.test/v1/chat/completions")
+    response = httpx.Response(status, headers=headers or {}, request=request)
+    return httpx.HTTPStatusError("error", request=request, response=response)
+
+
+class TestRetryPolicy(unittest.TestCase):
+    """Test retry policy"""
+    
+    def test_retry_after(self):
+        """Test Retry-After parsing"""
+        self.assertEqual(retry_after(status_error(429, {"Retry-After": "3"})), 3.0)
+        self.assertEqual(retry_after(status_error(429, {"retry-after-ms": "250"})), 0.25)
+        self.assertIsNone(retry_after(status_error(429)))
+        self.assertEqual(RetryPolicy(max_delay=1).delay(0, status_error(429, {"Retry-After": "60"})), 1)
+    
+    def test_retries_transient_errors(self):
+        """Test transient errors are retried until success"""
+        errors = [status_error(503), status_error(429)]
+        
+        def call():
+            if errors:
+                raise errors.pop(0)
+            return "ok"
+        
+        policy = RetryPolicy(max_retries=2)
+        sleeps = []
+        self.assertEqual(call_with_retries(call, policy, sleep=sleeps.append), "ok")
+        self.assertEqual(len(sleeps), 2)
+        self.assertEqual(policy.stats(), {"attempts": 3, "retries": 2, "exhausted": 0})
+    
+    def test_does_not_retry_client_errors(self):
+        """Test client errors escape immediately"""
+        policy = RetryPolicy(max_retries=3)
+        
+        def call():
+            raise status_error(400)
+        
+        with self.assertRaises(httpx.HTTPStatusError):
+            call_with_retries(call, policy, sleep=lambda _: None)
+        self.assertEqual(policy.stats()["attempts"], 1)
+    
+    def test_exhausted(self):
+        """Test the last error escapes when retries run out"""
+        policy = RetryPolicy(max_retries=1)
+        
+        def call():
+            raise status_error(502)
+        
+        with self.assertRaises(httpx.HTTPStatusError):
+            call_with_retries(call, policy, sleep=lambda _: None)
+        self.assertEqual(policy.stats()["exhausted"], 1)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """Test circuit breaker state machine"""
+    
+    def setUp(self):
+        """Set up test environment"""
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker("http://upstream.test", failure_rate=0.5, window=4,
+                                      min_requests=4, reset_timeout=10, timer=self.clock)
+    
+    def test_opens_and_recovers(self):
+        """Test breaker opens on error rate, probes when half open and closes on success"""
+        for _ in range(2):
+            self.breaker.record(None)
+        for _ in range(2):
+            self.breaker.record(status_error(500))
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_request()
+        
+        self.clock.now = 10
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.breaker.before_request()
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_request()
+        self.breaker.record(None)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(self.breaker.snapshot()["opened"], 1)
+    
+    def test_failed_probe_reopens(self):
+        """Test a failed probe opens the breaker again"""
+        for _ in range(4):
+            self.breaker.record(status_error(503))
+        self.clock.now = 10
+        self.breaker.before_request()
+        self.breaker.record(status_error(503))
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+    
+    def test_cancelled_probe_is_released(self):
+        """Test a probe cancelled mid-call gives its slot back without reopening or closing the breaker"""
+        for _ in range(4):
+            self.breaker.record(status_error(503))
+        self.clock.now = 10
+        
+        async def cancelled():
+            raise asyncio.CancelledError()
+        
+        with self.assertRaises(asyncio.CancelledError):
+            asyncio.run(acall_with_retries(cancelled, RetryPolicy(), self.breaker))
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        
+        def interrupted():
+            raise KeyboardInterrupt()
+        
+        with self.assertRaises(KeyboardInterrupt):
+            call_with_retries(interrupted, RetryPolicy(), self.breaker)
+        self.breaker.before_request()
+        self.breaker.record(None)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+    
+    def test_throttling_does_not_open(self):
+        """Test 429 and client errors do not count against endpoint health"""
+        for _ in range(4):
+            self.breaker.record(status_error(429))
+            self.breaker.record(status_error(400))
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+
+class TestProxyRetries(unittest.TestCase):
+    """Test proxy integration"""
+    
+    def test_proxy_retries_and_breaks(self):
+        """Test proxy retries 503 responses and fails fast once the breaker opens"""
+        responses = [503, 200, 503, 503, 503, 503]
+        
+        def handler(request: httpx.Request) -> httpx.Response:
+            status = responses.pop(0)
+            if status != 200:
+                return httpx.Response(status, headers={"Retry-After": "0"}, json={"error": {"message": "down"}})
+            return httpx.Response(200, json={
+                "id": "chatcmpl-test",
+                "object": "chat.completion",
+                "created": 0,
+                "model": "gpt-3.5-turbo",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}]
+            })
+        
+        pool = ClientPool(transport=httpx.MockTransport(handler))
+        encrypted_key = generate_encrypted_key(
+            provider="openai",
+            base_url="http://upstream.test/v1",
+            api_key="test-api-key",
+            model="gpt-3.5-turbo"
+        )
+        policy = RetryPolicy(max_retries=1)
+        breakers = BreakerRegistry(min_requests=4, window=4, failure_rate=0.75, reset_timeout=60)
+        proxy = LLMProxy(encrypted_key, pool=pool, retry_policy=policy, breakers=breakers)
+        
+        self.assertEqual(proxy.send_message("hi"), "ok")
+        with self.assertRaises(openai.InternalServerError):
+            proxy.send_message("hi")
+        with self.assertRaises(CircuitOpenError):
+            proxy.send_message("hi")
+        self.assertEqual(breakers.snapshot()["http://upstream.test/v1"]["state"], "open")
+        self.assertEqual(len(responses), 2)
+        pool.close()
+
+    
+    def test_cancelled_attempt_releases_probe(self):
+        """Test cancelling a call whose attempt holds the half-open probe lets the next call probe"""
+        async def handler(request: httpx.Request) -> httpx.Response:
+            if json.loads(request.content)["messages"][-1]["content"] == "slow":
+                await asyncio.sleep(10)
+            return httpx.Response(200, json={"choices": [{"message": {"content": "ok"}}]})
+        
+        pool = ClientPool(transport=httpx.MockTransport(handler))
+        encrypted_key = generate_encrypted_key("openai", "http://probe.test/v1", "test-api-key", "gpt-3.5-turbo")
+        breakers = BreakerRegistry(reset_timeout=0)
+        breaker = breakers.get("http://probe.test/v1")
+        for _ in range(10):
+            breaker.record_failure()
+        
+        async def run():
+            proxy = AsyncLLMProxy(encrypted_key, pool=pool, breakers=breakers, adapter="native")
+            task = asyncio.ensure_future(proxy.achat([{"role": "user", "content": "slow"}]))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            return await proxy.achat([{"role": "user", "content": "fast"}])
+        
+        self.assertEqual(asyncio.run(run()), "ok")
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        pool.close()
+    
+    def test_async_backoff_holds_no_slot_and_is_cancellable(self):
+        """Test async calls backing off leave their concurrency slot to others and end when cancelled"""
+        async def handler(request: httpx.Request) -> httpx.Response:
+            if json.loads(request.content)["messages"][-1]["content"] == "retry":
+                return httpx.Response(503, headers={"Retry-After": "30"}, json={"error": {"message": "down"}})
+            return httpx.Response(200, json={"choices": [{"message": {"content": "ok"}}]})
+        
+        pool = ClientPool(transport=httpx.MockTransport(handler))
+        encrypted_key = generate_encrypted_key("openai", "http://backoff.test/v1", "test-api-key", "gpt-3.5-turbo")
+        token = CancelToken()
+        
+        async def run():
+            proxy = AsyncLLMProxy(encrypted_key, pool=pool, breakers=BreakerRegistry(), adapter="native",
+                                  retry_policy=RetryPolicy(max_retries=1, max_delay=60), max_concurrency=1)
+            retry = [{"role": "user", "content": "retry"}]
+            
+            async def consume():
+                return [delta async for delta in proxy.achat_stream(retry, cancel=token)]
+            
+            backing_off = [asyncio.ensure_future(consume()), asyncio.ensure_future(proxy.achat(retry, cancel=token))]
+            await asyncio.sleep(0.1)
+            reply = await asyncio.wait_for(proxy.achat([{"role": "user", "content": "fast"}]), 2)
+            started = time.perf_counter()
+            token.cancel()
+            for task in backing_off:
+                with self.assertRaises(RequestCancelled):
+                    await task
+            return reply, time.perf_counter() - started
+        
+        reply, cancelled_in = asyncio.run(run())
+        self.assertEqual(reply, "ok")
+        self.assertLess(cancelled_in, 1)
+        pool.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+"""
+Test response cache functionality
+"""
+
+import json
+import tempfile
+import unittest
+import os
+import sys
+
+import httpx
+
+# Add project root directory to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.client_pool import ClientPool
+from src.key_generator import generate_encrypted_key
+from src.llm_proxy import LLMProxy
+from src.models import LLMConfig
+from src.response_cache import ResponseCache, SQLiteCache
+
+
+class TestResponseCache(unittest.TestCase):
+    """Test response cache functionality"""
+    
+    def setUp(self):
+        """Set up test environment"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "responses.db")
+        self.config = LLMConfig(
+            provider="openai",
+            base_url="http://upstream.test/v1",
+            api_key="test-api-key",
+            model="gpt-3.5-turbo"
+        )
+        self.request = {
+            "model": "gpt-3.5-turbo",
+            "messages": [{"role": "user", "content": "hi"}],
+            "temperature": 0,
+            "extra_headers": {}
+        }
+    
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    
+    def test_canonical_key(self):
+        """Test key ignores ordering and headers but not parameters"""
+        reordered = dict(reversed(list(self.request.items())))
+        reordered["extra_headers"] = {"X-Title": "Other"}
+        key = ResponseCache.make_key(self.config, self.request)
+        self.assertEqual(ResponseCache.make_key(self.config, reordered), key)
+        self.assertNotEqual(ResponseCache.make_key(self.config, dict(self.request, max_tokens=5)), key)
+        other_upstream = self.config.model_copy(update={"base_url": "http://other.test/v1"})
+        self.assertNotEqual(ResponseCache.make_key(other_upstream, self.request), key)
+    
+    def test_persistent_tier(self):
+        """Test responses survive a new cache instance"""
+        cache = ResponseCache(path=self.path)
+        cache.set("key", "value")
+        cache.close()
+        
+        cache = ResponseCache(path=self.path)
+        self.assertEqual(cache.get("key"), "value")
+        self.assertEqual(cache.get("key"), "value")
+        stats = cache.stats()
+        self.assertEqual(stats["disk"]["hits"], 1)
+        self.assertEqual(stats["memory"]["hits"], 1)
+        cache.close()
+    
+    def test_disk_size_cap(self):
+        """Test persistent tier prunes least recently used entries"""
+        disk = SQLiteCache(self.path, max_entries=3)
+        for i in range(5):
+            disk.set(f"key{i}", str(i))
+        disk.prune()
+        self.assertEqual(len(disk), 3)
+        self.assertIsNone(disk.get("key0"))
+        self.assertEqual(disk.get("key4"), "4")
+        disk.close()
+    
+    def test_disk_reads_batched(self):
+        """Test reads do not write, their access times are batched and still order pruning"""
+        disk = SQLiteCache(self.path, max_entries=3)
+        for i in range(4):
+            disk.set(f"key{i}", str(i))
+        statements = []
+        disk._connection().set_trace_callback(statements.append)
+        for _ in range(10):
+            self.assertEqual(disk.get("key0"), "0")
+        self.assertEqual([sql for sql in statements if not sql.startswith("SELECT")], [])
+        
+        disk.TOUCH_INTERVAL = 0
+        self.assertEqual(disk.get("key0"), "0")
+        disk.prune()
+        self.assertEqual(disk.get("key0"), "0")
+        self.assertIsNone(disk.get("key1"))
+        self.assertEqual(sum(sql.startswith("UPDATE") for sql in statements), 1)
+        disk.close()
+    
+    def test_disk_ttl(self):
+        """Test expired persistent entries are not returned"""
+        disk = SQLiteCache(self.path, ttl=-1)
+        disk.set("key", "value")
+        self.assertIsNone(disk.get("key"))
+        disk.close()
+    
+    def test_proxy_integration(self):
+        """Test only deterministic requests are served from cache"""
+        calls = []
+        
+        def handler(request: httpx.Request) -> httpx.Response:
+            calls.append(json.loads(request.content))
+            return httpx.Response(200, json={
+                "id": "chatcmpl-test",
+                "object": "chat.completion",
+                "created": 0,
+                "model": "gpt-3.5-turbo",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": f"reply {len(calls)}"}, "finish_reason": "stop"}]
+            })
+        
+        pool = ClientPool(transport=httpx.MockTransport(handler))
+        encrypted_key = generate_encrypted_key(
+            provider="openai",
+            base_url="http://upstream.test/v1",
+            api_key="test-api-key",
+            model="gpt-3.5-turbo"
+        )
+        cache = ResponseCache()
+        proxy = LLMProxy(encrypted_key, pool=pool, response_cache=cache)
+        messages = [{"role": "user", "content": "hi"}]
+        
+        self.assertEqual(proxy.chat(messages, temperature=0), "reply 1")
+        self.assertEqual(proxy.chat(messages, temperature=0), "reply 1")
+        self.assertEqual(len(calls), 1)
+        
+        # Bypass and sampled requests go upstream
+        self.assertEqual(proxy.chat(messages, temperature=0, use_cache=False), "reply 2")
+        self.assertEqual(proxy.chat(messages), "reply 3")
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(cache.stats()["hits"], 1)
+        pool.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
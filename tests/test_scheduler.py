@@ -0,0 +1,246 @@
+"""
+Test the priority and fair share scheduler
+"""
+
+import asyncio
+import threading
+import time
+import unittest
+import os
+import sys
+
+import httpx
+
+# Add project root directory to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src import metrics
+from src.client_pool import ClientPool
+from src.deadlines import CancelToken, Deadline, DeadlineExceeded, RequestCancelled
+from src.key_generator import generate_encrypted_key
+from src.llm_proxy import AsyncLLMProxy, LLMProxy
+from src.rate_limit import default_limiters
+from src.resilience import BreakerRegistry, CircuitBreaker
+from src.scheduler import RequestShed, Scheduler, SchedulerRegistry, default_schedulers
+from tests.helpers import RecordingUpstream
+
+
+def admission_order(scheduler, requests):
+    """Queue requests behind a held slot, then release it and return the order they were admitted in"""
+    async def run():
+        held = await scheduler.aacquire("holder")
+        order = []
+
+        async def request(name, tenant, priority, share):
+            slot = await scheduler.aacquire(tenant, priority, share)
+            order.append(name)
+            slot.release()
+
+        tasks = [asyncio.ensure_future(request(*spec)) for spec in requests]
+        await asyncio.sleep(0.01)
+        held.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    return asyncio.run(run())
+
+
+class TestScheduler(unittest.TestCase):
+    """Test scheduling order, shedding and giving up"""
+    
+    def test_interactive_first(self):
+        """Test an interactive request overtakes a queue of batch requests"""
+        order = admission_order(Scheduler(1), [
+            ("batch-1", "team-a", "batch", 1.0),
+            ("batch-2", "team-a", "batch", 1.0),
+            ("interactive", "team-b", "interactive", 1.0),
+        ])
+        self.assertEqual(order, ["interactive", "batch-1", "batch-2"])
+    
+    def test_fair_share_between_tenants(self):
+        """Test a tenant arriving behind a flood is served in turn, in proportion to its share"""
+        flood = [(f"a{i}", "team-a", "batch", 1.0) for i in range(6)]
+        order = admission_order(Scheduler(1), flood + [("b0", "team-b", "batch", 1.0), ("b1", "team-b", "batch", 1.0)])
+        self.assertEqual(order[:4], ["a0", "b0", "a1", "b1"])
+        
+        order = admission_order(Scheduler(1), flood + [(f"b{i}", "team-b", "batch", 2.0) for i in range(4)])
+        self.assertEqual(order[:6], ["a0", "b0", "b1", "a1", "b2", "b3"])
+    
+    def test_batch_is_not_starved(self):
+        """Test batch requests still get a share while interactive ones keep arriving"""
+        scheduler = Scheduler(1, class_weights={"interactive": 3.0, "batch": 1.0})
+        order = admission_order(scheduler, [("batch", "team-a", "batch", 1.0)] +
+                                [(f"i{i}", "team-b", "interactive", 1.0) for i in range(8)])
+        self.assertLess(order.index("batch"), 5)
+    
+    def test_queue_full(self):
+        """Test a full queue sheds batch requests to make room for interactive ones"""
+        async def run():
+            scheduler = Scheduler(1, max_queue=2)
+            held = await scheduler.aacquire("holder")
+            batch = [asyncio.ensure_future(scheduler.aacquire("team-a", "batch")) for _ in range(2)]
+            await asyncio.sleep(0.01)
+            interactive = asyncio.ensure_future(scheduler.aacquire("team-b", "interactive"))
+            await asyncio.sleep(0.01)
+            with self.assertRaises(RequestShed) as shed:
+                await batch[1]
+            self.assertEqual(shed.exception.reason, "queue_full")
+            with self.assertRaises(RequestShed):
+                await scheduler.aacquire("team-a", "batch")
+            
+            held.release()
+            (await interactive).release()
+            (await batch[0]).release()
+            return scheduler.stats()
+        
+        stats = asyncio.run(run())
+        self.assertEqual(stats["shed"], {"batch:queue_full": 2})
+        self.assertEqual(stats["inflight"], 0)
+    
+    def test_deadline(self):
+        """Test hopeless requests are shed at once and expired ones leave the queue"""
+        scheduler = Scheduler(1)
+        held = scheduler.acquire("holder")
+        scheduler.hold_time = 1.0
+        with self.assertRaises(RequestShed) as shed:
+            scheduler.acquire("team-a", deadline=Deadline(0.1))
+        self.assertEqual(shed.exception.reason, "deadline")
+        
+        scheduler.hold_time = 0.0
+        with self.assertRaises(DeadlineExceeded):
+            scheduler.acquire("team-a", deadline=Deadline(0.05))
+        self.assertEqual(scheduler.queued, 0)
+        held.release()
+        self.assertEqual(scheduler.inflight, 0)
+    
+    def test_cancel_while_queued(self):
+        """Test cancelled waits leave the queue without taking a slot"""
+        scheduler = Scheduler(1)
+        held = scheduler.acquire("holder")
+        token = CancelToken()
+        threading.Timer(0.05, token.cancel).start()
+        with self.assertRaises(RequestCancelled):
+            scheduler.acquire("team-a", cancel=token)
+        
+        async def cancel_task():
+            task = asyncio.ensure_future(scheduler.aacquire("team-a"))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+        
+        asyncio.run(cancel_task())
+        self.assertEqual(scheduler.queued, 0)
+        held.release()
+        self.assertEqual(scheduler.inflight, 0)
+    
+    def test_registry(self):
+        """Test callers disagreeing on a key's limit share one scheduler at the smallest, and the registry is bounded"""
+        registry = SchedulerRegistry(maxsize=2)
+        limits = [registry.get("http://scheduled.test/v1", "registry-key", max_inflight).max_inflight
+                  for max_inflight in (4, 2, 3)]
+        self.assertEqual(limits, [4, 2, 2])
+        scheduler = registry.get("http://scheduled.test/v1", "registry-key", 4)
+        self.assertNotIn("registry-key", repr(registry._schedulers.items()))
+        
+        for api_key in ("other-key", "third-key"):
+            registry.get("http://scheduled.test/v1", api_key, 1)
+        self.assertEqual(len(registry._schedulers), 2)
+        self.assertIsNot(registry.get("http://scheduled.test/v1", "registry-key", 2), scheduler)
+
+
+class TestProxyScheduling(unittest.TestCase):
+    """Test proxies queue through the scheduler of their API key"""
+    
+    def setUp(self):
+        self.records = []
+        metrics.hub.add_hook(self.records.append)
+        self.upstream = RecordingUpstream()
+        self.pool = ClientPool(transport=httpx.MockTransport(self.upstream))
+        self.encrypted_key = generate_encrypted_key(
+            provider="openai",
+            base_url="http://scheduled.test/v1",
+            api_key="scheduled-api-key",
+            model="gpt-3.5-turbo",
+            max_inflight=1,
+            priority="batch",
+        )
+        self.scheduler = default_schedulers.get("http://scheduled.test/v1", "scheduled-api-key", 1)
+    
+    def tearDown(self):
+        metrics.hub.remove_hook(self.records.append)
+        self.pool.close()
+    
+    def test_chat(self):
+        """Test a scheduled chat call records its priority and wait"""
+        proxy = LLMProxy(self.encrypted_key, pool=self.pool)
+        self.assertEqual(proxy.chat([{"role": "user", "content": "hi"}]), "echo: hi")
+        self.assertEqual(self.records[-1].priority, "batch")
+        self.assertIn("schedule", self.records[-1].phases)
+        self.assertEqual(self.scheduler.inflight, 0)
+        
+        collector = metrics.PrometheusCollector()
+        collector(self.records[-1])
+        rendered = collector.render()
+        self.assertIn('llm_proxy_scheduler_wait_seconds_count{priority="batch"} 1', rendered)
+        self.assertIn("llm_proxy_scheduler_inflight", rendered)
+    
+    def test_stream_holds_slot(self):
+        """Test a stream keeps its slot until it is closed"""
+        proxy = LLMProxy(self.encrypted_key, pool=self.pool, priority="interactive")
+        stream = proxy.chat_stream([{"role": "user", "content": "one two"}])
+        next(stream)
+        self.assertEqual(self.scheduler.inflight, 1)
+        stream.close()
+        self.assertEqual(self.scheduler.inflight, 0)
+    
+    def test_shed_call_keeps_no_probe(self):
+        """Test a call shed while queued does not hold the half-open breaker's probe"""
+        breakers = BreakerRegistry(reset_timeout=0)
+        breaker = breakers.get("http://scheduled.test/v1")
+        for _ in range(10):
+            breaker.record_failure()
+        proxy = LLMProxy(self.encrypted_key, pool=self.pool, breakers=breakers)
+        
+        held = self.scheduler.acquire("holder")
+        with self.assertRaises((RequestShed, DeadlineExceeded)):
+            proxy.chat([{"role": "user", "content": "queued"}], timeout=0.05)
+        held.release()
+        self.assertEqual(proxy.chat([{"role": "user", "content": "hi"}]), "echo: hi")
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+    
+    def test_rate_limit_wait_holds_no_slot(self):
+        """Test a call queued for rate limit budget leaves the scheduler and concurrency slots to other calls"""
+        encrypted_key = generate_encrypted_key("openai", "http://scheduled.test/v1", "budget-key", "gpt-3.5-turbo",
+                                               max_inflight=1, rpm=60)
+        scheduler = default_schedulers.get("http://scheduled.test/v1", "budget-key", 1)
+        limiter = default_limiters.get("http://scheduled.test/v1", "budget-key", 60, None)
+        for _ in range(60):
+            limiter.reserve()
+        proxy = LLMProxy(encrypted_key, pool=self.pool)
+        queued = threading.Thread(target=proxy.send_message, args=("queued",))
+        queued.start()
+        time.sleep(0.1)
+        scheduler.acquire("other", deadline=Deadline(0.1)).release()
+        queued.join()
+        
+        async def run():
+            async_proxy = AsyncLLMProxy(encrypted_key, pool=self.pool, max_concurrency=1)
+            task = asyncio.ensure_future(async_proxy.asend_message("queued"))
+            await asyncio.sleep(0.1)
+            semaphore = async_proxy._get_semaphore()
+            await asyncio.wait_for(semaphore.acquire(), 0.1)
+            semaphore.release()
+            (await scheduler.aacquire("other", deadline=Deadline(0.1))).release()
+            return await task
+        
+        self.assertEqual(asyncio.run(run()), "echo: queued")
+    
+    def test_unknown_priority(self):
+        """Test an unknown priority class is rejected"""
+        with self.assertRaises(ValueError):
+            LLMProxy(self.encrypted_key, pool=self.pool, priority="urgent")
+
+
+if __name__ == "__main__":
+    unittest.main()
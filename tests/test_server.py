@@ -0,0 +1,171 @@
+"""
+Test gateway server end to end against the stub upstream
+"""
+
+import asyncio
+import json
+import tempfile
+import unittest
+import os
+import sys
+
+from starlette.testclient import TestClient
+
+# Add project root directory to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src import stub_upstream
+from src.client_pool import ClientPool
+from src.key_generator import generate_encrypted_key
+from src.response_cache import ResponseCache
+from src.server import create_app
+
+
+class TestGatewayServer(unittest.TestCase):
+    """Test gateway server end to end against the stub upstream"""
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.upstream_app = stub_upstream.create_app()
+        cls.upstream, cls.upstream_url = stub_upstream.serve_in_thread(cls.upstream_app)
+    
+    @classmethod
+    def tearDownClass(cls):
+        cls.upstream.should_exit = True
+    
+    def setUp(self):
+        """Set up test environment"""
+        self.pool = ClientPool()
+        self.client = TestClient(create_app(self.pool))
+        self.encrypted_key = generate_encrypted_key(
+            provider="openai",
+            base_url=self.upstream_url + "/v1",
+            api_key="upstream-api-key",
+            model="stub-model",
+            headers={"X-Title": "Gateway"},
+            extra_body={"top_p": 0.5}
+        )
+        self.auth = {"Authorization": f"Bearer {self.encrypted_key}"}
+    
+    def tearDown(self):
+        self.client.close()
+        self.pool.close()
+    
+    def test_health(self):
+        """Test health endpoint needs no key"""
+        response = self.client.get("/health")
+        self.assertEqual(response.json(), {"status": "ok"})
+    
+    def test_metrics(self):
+        """Test proxied requests show up on the metrics endpoint, models the key does not configure as other"""
+        for model in ("stub-model", "metrics-model"):
+            self.client.post(
+                "/v1/chat/completions",
+                headers=self.auth,
+                json={"model": model, "messages": [{"role": "user", "content": "hi"}]}
+            )
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/plain"))
+        self.assertIn('llm_proxy_requests_total{provider="openai",model="stub-model",status="ok"}', response.text)
+        self.assertIn('llm_proxy_requests_total{provider="openai",model="other",status="ok"}', response.text)
+        self.assertNotIn("metrics-model", response.text)
+        self.assertIn('phase="ttfb"', response.text)
+    
+    def test_chat_completion(self):
+        """Test request is decrypted, rewritten and forwarded"""
+        response = self.client.post(
+            "/v1/chat/completions",
+            headers=self.auth,
+            json={"messages": [{"role": "user", "content": "hi"}]}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["choices"][0]["message"]["content"], "echo: hi")
+        
+        forwarded = self.upstream_app.state.stub["requests"][-1]
+        self.assertEqual(forwarded["headers"]["authorization"], "Bearer upstream-api-key")
+        self.assertEqual(forwarded["headers"]["x-title"], "Gateway")
+        self.assertEqual(forwarded["body"]["model"], "stub-model")
+        self.assertEqual(forwarded["body"]["top_p"], 0.5)
+    
+    def test_streaming(self):
+        """Test server-sent events are relayed"""
+        with self.client.stream(
+            "POST",
+            "/v1/chat/completions",
+            headers=self.auth,
+            json={"messages": [{"role": "user", "content": "hello there"}], "stream": True}
+        ) as response:
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.headers["content-type"].startswith("text/event-stream"))
+            payload = "".join(response.iter_text())
+        
+        events = [line[len("data: "):] for line in payload.splitlines() if line.startswith("data: ")]
+        self.assertEqual(events[-1], "[DONE]")
+        text = "".join(
+            json.loads(event)["choices"][0]["delta"].get("content") or "" for event in events[:-1]
+        )
+        self.assertEqual(text, "echo: hello there")
+    
+    def test_models(self):
+        """Test models endpoint reports the configured model"""
+        response = self.client.get("/v1/models", headers=self.auth)
+        self.assertEqual(response.json()["data"][0]["id"], "stub-model")
+    
+    def test_invalid_key(self):
+        """Test invalid keys are rejected"""
+        response = self.client.post(
+            "/v1/chat/completions",
+            headers={"Authorization": "Bearer not-a-key"},
+            json={"messages": []}
+        )
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()["error"]["type"], "authentication_error")
+        
+        response = self.client.get("/v1/models")
+        self.assertEqual(response.status_code, 401)
+    
+    def test_shared_response_cache(self):
+        """Test a deterministic response relayed by one worker is answered from the shared cache by another"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "shared.db")
+            # Each worker process opens the file on its own
+            caches = [ResponseCache(path=path, table="gateway_responses") for _ in range(2)]
+            on_loop = []
+            
+            def off_loop(method):
+                def call(*args):
+                    try:
+                        asyncio.get_running_loop()
+                        on_loop.append(method.__name__)
+                    except RuntimeError:
+                        pass
+                    return method(*args)
+                return call
+            
+            for cache in caches:
+                cache.disk.get, cache.disk.set = off_loop(cache.disk.get), off_loop(cache.disk.set)
+            workers = [TestClient(create_app(self.pool, enable_metrics=False, response_cache=cache))
+                       for cache in caches]
+            body = {"messages": [{"role": "user", "content": "shared"}], "temperature": 0}
+            sent = len(self.upstream_app.state.stub["requests"])
+            try:
+                first = workers[0].post("/v1/chat/completions", headers=self.auth, json=body)
+                second = workers[1].post("/v1/chat/completions", headers=self.auth, json=body)
+                self.assertEqual(second.status_code, 200)
+                self.assertEqual(second.json(), first.json())
+                self.assertEqual(len(self.upstream_app.state.stub["requests"]), sent + 1)
+                
+                # Sampled requests always go upstream
+                workers[1].post("/v1/chat/completions", headers=self.auth, json=dict(body, temperature=1))
+                self.assertEqual(len(self.upstream_app.state.stub["requests"]), sent + 2)
+                # The SQLite tier can wait on a locked file, it is never called on the event loop
+                self.assertEqual(on_loop, [])
+            finally:
+                for worker, cache in zip(workers, caches):
+                    worker.close()
+                    cache.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
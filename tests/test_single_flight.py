@@ -0,0 +1,179 @@
+"""
+Test coalescing of identical in-flight requests
+"""
+
+import asyncio
+import threading
+import time
+import unittest
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+# Add project root directory to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.client_pool import ClientPool
+from src.key_generator import generate_encrypted_key
+from src.llm_proxy import AsyncLLMProxy, LLMProxy
+from src.resilience import RetryPolicy
+from src.single_flight import SingleFlight
+from tests.helpers import RecordingUpstream
+
+
+class SlowUpstream(RecordingUpstream):
+    """Recording upstream that keeps each request in flight for a while"""
+    
+    def __call__(self, request):
+        time.sleep(0.2)
+        return super().__call__(request)
+
+
+class TestSingleFlight(unittest.TestCase):
+    """Test coalescing of identical in-flight requests"""
+    
+    def test_threads_share_one_call(self):
+        """Test concurrent callers of a key run the call once"""
+        flights = SingleFlight()
+        calls = []
+        release = threading.Event()
+        
+        def call():
+            calls.append(1)
+            release.wait(5)
+            return "result"
+        
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            futures = [executor.submit(flights.do, "key", call) for _ in range(5)]
+            while flights.stats()["coalesced"] < 4:
+                time.sleep(0.01)
+            release.set()
+            results = [future.result() for future in futures]
+        
+        self.assertEqual(results, ["result"] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flights.stats(), {"leaders": 1, "coalesced": 4, "in_flight": 0})
+        
+        # Nothing is cached once the call has finished
+        flights.do("key", call)
+        self.assertEqual(len(calls), 2)
+    
+    def test_errors_reach_every_waiter(self):
+        """Test the leader's exception is raised in every waiting thread"""
+        flights = SingleFlight()
+        release = threading.Event()
+        
+        def call():
+            release.wait(5)
+            raise RuntimeError("upstream down")
+        
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            futures = [executor.submit(flights.do, "key", call) for _ in range(3)]
+            while flights.stats()["coalesced"] < 2:
+                time.sleep(0.01)
+            release.set()
+            for future in futures:
+                with self.assertRaises(RuntimeError):
+                    future.result()
+    
+    def test_async_cancellation(self):
+        """Test a cancelled caller does not cancel the call for the others"""
+        flights = SingleFlight()
+        calls = []
+        
+        async def call():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "result"
+        
+        async def run():
+            first = asyncio.ensure_future(flights.ado("key", call))
+            second = asyncio.ensure_future(flights.ado("key", call))
+            await asyncio.sleep(0)
+            first.cancel()
+            return await second, first.cancelled()
+        
+        self.assertEqual(asyncio.run(run()), ("result", True))
+        self.assertEqual(len(calls), 1)
+    
+    def test_async_errors(self):
+        """Test every coroutine waiting on a failed call gets its exception"""
+        flights = SingleFlight()
+        
+        async def call():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream down")
+        
+        async def run():
+            return await asyncio.gather(*[flights.ado("key", call) for _ in range(3)], return_exceptions=True)
+        
+        results = asyncio.run(run())
+        self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+        self.assertEqual(flights.stats()["leaders"], 1)
+
+
+class TestProxyCoalescing(unittest.TestCase):
+    """Test proxies send identical concurrent requests upstream once"""
+    
+    def setUp(self):
+        self.upstream = SlowUpstream()
+        self.pool = ClientPool(transport=httpx.MockTransport(self.upstream))
+        self.encrypted_key = generate_encrypted_key(
+            provider="openai",
+            base_url="http://upstream.test/v1",
+            api_key="test-api-key",
+            model="gpt-3.5-turbo"
+        )
+    
+    def tearDown(self):
+        self.pool.close()
+    
+    def test_sync_chat(self):
+        """Test identical prompts from many threads go upstream once, different ones do not"""
+        proxy = LLMProxy(self.encrypted_key, pool=self.pool, single_flight=SingleFlight())
+        prompts = ["same"] * 6 + ["other"]
+        with ThreadPoolExecutor(max_workers=len(prompts)) as executor:
+            results = list(executor.map(lambda p: proxy.chat([{"role": "user", "content": p}]), prompts))
+        self.assertEqual(results, ["echo: same"] * 6 + ["echo: other"])
+        self.assertEqual(len(self.upstream.requests), 2)
+    
+    def test_async_chat(self):
+        """Test identical prompts gathered on one loop go upstream once"""
+        async def run():
+            proxy = AsyncLLMProxy(self.encrypted_key, pool=self.pool, single_flight=SingleFlight())
+            return await asyncio.gather(*[proxy.achat([{"role": "user", "content": "same"}]) for _ in range(5)])
+        self.assertEqual(asyncio.run(run()), ["echo: same"] * 5)
+        self.assertEqual(len(self.upstream.requests), 1)
+    
+    def test_errors_propagate(self):
+        """Test every coalesced caller sees the upstream error"""
+        def failing(request):
+            time.sleep(0.2)
+            return httpx.Response(400, json={"error": {"message": "bad request"}})
+        pool = ClientPool(transport=httpx.MockTransport(failing))
+        proxy = LLMProxy(self.encrypted_key, pool=pool, single_flight=SingleFlight(),
+                         retry_policy=RetryPolicy(max_retries=0))
+        
+        def chat(_):
+            try:
+                proxy.chat([{"role": "user", "content": "same"}])
+            except Exception as e:
+                return type(e).__name__
+        
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            errors = list(executor.map(chat, range(4)))
+        pool.close()
+        self.assertEqual(errors, ["BadRequestError"] * 4)
+    
+    def test_deterministic_only(self):
+        """Test sampled requests can be excluded from coalescing"""
+        proxy = LLMProxy(self.encrypted_key, pool=self.pool, single_flight=SingleFlight(deterministic_only=True))
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            list(executor.map(lambda _: proxy.chat([{"role": "user", "content": "same"}]), range(3)))
+        self.assertEqual(len(self.upstream.requests), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+"""
+Test stub upstream behaviour used by tests and benchmarks
+"""
+
+import time
+import unittest
+import os
+import sys
+
+from starlette.testclient import TestClient
+
+# Add project root directory to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src import stub_upstream
+
+
+class TestStubUpstream(unittest.TestCase):
+    """Test stub upstream behaviour used by tests and benchmarks"""
+    
+    def chat(self, app, **body):
+        with TestClient(app) as client:
+            return client.post("/v1/chat/completions", json=dict({"messages": [{"role": "user", "content": "hi"}]}, **body))
+    
+    def test_echo_with_usage(self):
+        """Test replies echo the last message and report usage"""
+        response = self.chat(stub_upstream.create_app())
+        body = response.json()
+        self.assertEqual(body["choices"][0]["message"]["content"], "echo: hi")
+        self.assertGreater(body["usage"]["total_tokens"], 0)
+    
+    def test_latency(self):
+        """Test configured latency delays the response"""
+        started = time.perf_counter()
+        self.chat(stub_upstream.create_app(latency=0.1, reply="fixed"))
+        self.assertGreaterEqual(time.perf_counter() - started, 0.1)
+    
+    def test_error_injection(self):
+        """Test injected errors use the configured status"""
+        response = self.chat(stub_upstream.create_app(error_rate=1.0, error_status=429))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers["retry-after"], "0")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+"""
+Test traffic recording and replay helpers
+"""
+
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+import httpx
+
+# Add project root directory to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src import metrics, traffic
+from src.client_pool import ClientPool
+from src.key_generator import generate_encrypted_key
+from src.llm_proxy import LLMProxy
+from tests.helpers import RecordingUpstream
+
+
+class TestTrafficRecorder(unittest.TestCase):
+    """Test requests are logged as redacted shapes with their timings"""
+    
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "traffic.jsonl")
+        self.pool = ClientPool(transport=httpx.MockTransport(RecordingUpstream()))
+        self.proxy = LLMProxy(generate_encrypted_key(
+            provider="openai",
+            base_url="http://upstream.test/v1",
+            api_key="recorded-api-key",
+            model="gpt-3.5-turbo",
+        ), pool=self.pool)
+    
+    def tearDown(self):
+        self.pool.close()
+        self.tmpdir.cleanup()
+    
+    def test_redacted_shapes(self):
+        """Test the log holds roles, sizes and timings but no message text"""
+        recorder = traffic.start_recording(self.path)
+        try:
+            messages = [{"role": "system", "content": [{"type": "text", "text": "secret instructions"}]},
+                        {"role": "user", "content": "private question"}]
+            self.proxy.chat(messages, temperature=0, max_tokens=32)
+            time.sleep(0.05)
+            list(self.proxy.chat_stream([{"role": "user", "content": "private stream"}]))
+        finally:
+            recorder.close()
+        self.assertNotIn(recorder, metrics.hub._hooks)
+        
+        with open(self.path) as f:
+            raw = f.read()
+        for secret in ("secret", "private", "recorded-api-key"):
+            self.assertNotIn(secret, raw)
+        
+        chat, stream = traffic.read_log(self.path)
+        self.assertEqual(chat["messages"], [["system", 19], ["user", 16]])
+        self.assertEqual((chat["model"], chat["temperature"], chat["max_tokens"]), ("gpt-3.5-turbo", 0, 32))
+        self.assertEqual(chat["status"], "ok")
+        self.assertGreater(chat["latency"], 0)
+        self.assertTrue(stream["stream"])
+        self.assertIn("first_token", stream)
+        self.assertGreaterEqual(stream["t"] - chat["t"], 0.05)
+    
+    def test_replay_offsets(self):
+        """Test recorded arrivals are compressed by the speed or replaced by a fixed rate"""
+        entries = [{"t": 2.0}, {"t": 3.0}, {"t": 6.0}]
+        self.assertEqual(traffic.replay_offsets(entries), [0.0, 1.0, 4.0])
+        self.assertEqual(traffic.replay_offsets(entries, speed=10), [0.0, 0.1, 0.4])
+        self.assertEqual(traffic.replay_offsets(entries, qps=4), [0.0, 0.25, 0.5])
+        with self.assertRaises(ValueError):
+            traffic.replay_offsets(entries, speed=0)
+    
+    def test_synthesize_messages(self):
+        """Test replayed messages keep the recorded roles and sizes and differ between requests"""
+        entry = {"messages": [["system", 120], ["user", 3]]}
+        first, second = traffic.synthesize_messages(entry, 0), traffic.synthesize_messages(entry, 1)
+        self.assertEqual([message["role"] for message in first], ["system", "user"])
+        self.assertEqual(len(first[0]["content"]), 120)
+        self.assertNotEqual(first, second)
+
+
+if __name__ == "__main__":
+    unittest.main()